@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+
+########################################################################
+
+
+"""Load generator for the weight calendar grid HTTP server
+
+Sends grid requests over a number of concurrent keep-alive connections
+and reports throughput, latency percentiles, response status counts
+and the mean stage latencies from the Server-Timing headers. The
+requests cycle through a number of distinct grids, so that with few
+distinct grids, many requests share a rendering on the server.
+
+Run from the top level source directory, either against a running
+server, or with --spawn to start a server for the duration of the run:
+
+    python3 benchmarks/http_load.py --spawn --workers 2
+    python3 benchmarks/http_load.py --port 8000 --requests 1000 -c 32
+"""
+
+
+########################################################################
+
+
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+
+########################################################################
+
+
+top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+########################################################################
+
+
+def make_queries(distinct, output_format, driver):
+    """Query strings for distinct grids, one week apart"""
+    begin = datetime.date(2015, 11, 22)
+    queries = []
+    for n in range(distinct):
+        query = 'height=1.78&weight=70-80&begin=%s&format=%s' % (
+            begin + datetime.timedelta(days=7*n), output_format)
+        if driver:
+            query += '&driver=%s' % driver
+        queries.append(query)
+    return queries
+
+
+def parse_server_timing(value):
+    """Get {stage: ms} from a Server-Timing header value"""
+    timings = {}
+    for item in value.split(','):
+        name, sep, params = item.strip().partition(';')
+        for param in params.split(';'):
+            key, sep, dur = param.partition('=')
+            if key.strip() == 'dur':
+                timings[name] = float(dur)
+    return timings
+
+
+async def fetch(reader, writer, host, path):
+    """Send one GET request, returning (status, headers, body)"""
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\n\r\n'
+                  % (path, host)).encode('ascii'))
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, sep, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(lines[0].split(' ')[1]), headers, body
+
+
+########################################################################
+
+
+class LoadResults(object):
+
+    def __init__(self):
+        super(LoadResults, self).__init__()
+        self.latencies = []
+        self.statuses = collections.Counter()
+        self.stage_ms = collections.defaultdict(list)
+        self.errors = 0
+
+    def add(self, latency, status, headers):
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+        timings = parse_server_timing(headers.get('server-timing', ''))
+        for stage, ms in timings.items():
+            self.stage_ms[stage].append(ms)
+
+
+async def client(host, port, queries, counter, total, results):
+    """Send requests over one connection until total have been sent"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while counter[0] < total:
+            query = queries[counter[0] % len(queries)]
+            counter[0] += 1
+            t0 = time.perf_counter()
+            try:
+                status, headers, body = await fetch(reader, writer, host,
+                                                    '/?' + query)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                results.errors += 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            results.add(1000.0 * (time.perf_counter() - t0), status, headers)
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+    finally:
+        writer.close()
+
+
+async def run_load(args, queries):
+    results = LoadResults()
+    counter = [0]
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(args.host, args.port, queries, counter,
+                                  args.requests, results)
+                           for i in range(args.concurrency)])
+    elapsed = time.perf_counter() - t0
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    status, headers, body = await fetch(reader, writer, args.host, '/_stats')
+    writer.close()
+    server_stats = json.loads(body.decode('utf-8')) if status == 200 else {}
+    return results, elapsed, server_stats
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def print_results(results, elapsed, server_stats):
+    count = len(results.latencies)
+    print('%d requests in %.2fs: %.1f requests/s'
+          % (count, elapsed, count / elapsed if elapsed else 0.0))
+    if results.latencies:
+        print('latency ms: mean %.1f  p50 %.1f  p90 %.1f  p99 %.1f  max %.1f'
+              % (statistics.mean(results.latencies),
+                 percentile(results.latencies, 50),
+                 percentile(results.latencies, 90),
+                 percentile(results.latencies, 99),
+                 max(results.latencies)))
+    print('status:', ', '.join('%d: %d' % item
+                               for item in sorted(results.statuses.items())))
+    if results.errors:
+        print('connection errors:', results.errors)
+    print('mean stage ms (Server-Timing):', ', '.join(
+        '%s %.2f' % (stage, statistics.mean(results.stage_ms[stage]))
+        for stage in ['parse', 'wait', 'layout', 'render']
+        if results.stage_ms[stage]))
+    if server_stats:
+        print('server: %d renderings, %d coalesced, %d rejected as busy, '
+              'mean encode %.2f ms'
+              % (server_stats.get('renders', 0),
+                 server_stats.get('coalesced', 0),
+                 server_stats.get('busy', 0),
+                 server_stats.get('mean ms', {}).get('encode', 0.0)))
+
+
+########################################################################
+
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(args):
+    """Start a server process and wait until it accepts connections"""
+    cmd = [sys.executable, '-m', 'weight_cal_grid.server',
+           '--host', args.host, '--port', str(args.port)]
+    if args.workers:
+        cmd.extend(['--workers', str(args.workers)])
+    if args.queue:
+        cmd.extend(['--queue', str(args.queue)])
+    proc = subprocess.Popen(cmd, cwd=top_dir, stdin=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('server exited with retcode %d'
+                               % proc.returncode)
+        try:
+            socket.create_connection((args.host, args.port), 0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError('server did not start listening')
+
+
+def stop_server(proc):
+    """Stop the server like Ctrl-C does, so it shuts down its workers"""
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+########################################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='generate load on the weight calendar grid HTTP server')
+    parser.add_argument('--host', default='localhost',
+                        help='server host (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=None,
+                        help='server port (default: 8000, or a free port '
+                        'with --spawn)')
+    parser.add_argument('--spawn', action='store_true',
+                        help='start a server for the duration of the run')
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help='render workers of the spawned server')
+    parser.add_argument('--queue', type=int, default=None, metavar='N',
+                        help='render queue size of the spawned server')
+    parser.add_argument('-n', '--requests', type=int, default=200,
+                        help='number of requests (default: %(default)s)')
+    parser.add_argument('-c', '--concurrency', type=int, default=16,
+                        help='number of concurrent connections '
+                        '(default: %(default)s)')
+    parser.add_argument('--distinct', type=int, default=8, metavar='N',
+                        help='number of distinct grids requested '
+                        '(default: %(default)s)')
+    parser.add_argument('--format', default='pdf',
+                        help='output format (default: %(default)s)')
+    parser.add_argument('--driver', default=None,
+                        help='driver (default: chosen by the server)')
+    args = parser.parse_args(argv)
+
+    if args.port is None:
+        args.port = free_port(args.host) if args.spawn else 8000
+    queries = make_queries(args.distinct, args.format, args.driver)
+
+    proc = spawn_server(args) if args.spawn else None
+    try:
+        results, elapsed, server_stats = asyncio.run(run_load(args, queries))
+    finally:
+        if proc:
+            stop_server(proc)
+    print_results(results, elapsed, server_stats)
+    return 0 if results.latencies else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+########################################################################
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+
+########################################################################
+
+
+"""Measure the cost of disabled log calls
+
+Times the ways a hot code path can log a DEBUG message while DEBUG is
+off: with a plain argument, with eagerly built arguments, with a
+log.lazy() argument, and behind a log.enabled() check, compared to not
+logging at all. A last
+case renders a half year grid page with the ReportLab driver, to put
+the numbers into perspective.
+
+Run from the top level source directory:
+
+    python3 benchmarks/log_overhead.py
+"""
+
+
+########################################################################
+
+
+import argparse
+import datetime
+import os
+import sys
+import timeit
+
+
+########################################################################
+
+
+top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, top_dir)
+
+from weight_cal_grid import log
+
+
+########################################################################
+
+
+date = datetime.date(2016, 1, 17)
+
+
+def no_logging():
+    pass
+
+
+def plain():
+    log.debug("Receiver.week_tick %s", date)
+
+
+def eager():
+    log.debug("Receiver.month_range %s (from %s to %s)",
+              date.strftime('%Y-%m'), date, date)
+
+
+def lazy():
+    log.debug("Receiver.month_range %s (from %s to %s)",
+              log.lazy(date.strftime, '%Y-%m'), date, date)
+
+
+def guarded():
+    if log.enabled(log.DEBUG):
+        log.debug("Receiver.month_range %s (from %s to %s)",
+                  date.strftime('%Y-%m'), date, date)
+
+
+cases = [
+    ('no logging', no_logging),
+    ('log.debug() with a plain argument', plain),
+    ('log.debug() with eager strftime', eager),
+    ('log.debug() with log.lazy()', lazy),
+    ('log.enabled() check', guarded),
+    ]
+
+
+########################################################################
+
+
+def time_case(func, number, repeat):
+    """Best time per call in ns"""
+    return 1e9 * min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def time_page_render(repeat):
+    """Best time in ms for rendering a half year grid page"""
+    try:
+        from weight_cal_grid.drivers import ReportLab
+    except ImportError:
+        return None
+    from reportlab.graphics.shapes import Drawing
+    from weight_cal_grid.i18n import get_translation
+    driver = ReportLab.ReportLabDriver(
+        1.78, (70.0, 80.0),
+        (datetime.date(2015, 11, 22), datetime.date(2016, 5, 22)),
+        translation=get_translation(None))
+    driver.count_axes()
+    driver.load_fontset_mono()
+    driver.load_fontset_sans()
+    def render():
+        driver.render(Drawing(driver.page_width, driver.page_height))
+    return 1e3 * min(timeit.repeat(render, number=1, repeat=repeat))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='measure the cost of disabled log calls')
+    parser.add_argument('-n', '--number', type=int, default=200000,
+                        help='calls per measurement (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='measurements per case, the best one counts '
+                        '(default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    log.level = log.QUIET
+    log.startup_level = log.QUIET
+    assert(not log.enabled(log.DEBUG))
+
+    for name, func in cases:
+        print('%-34s %8.1f ns/call'
+              % (name, time_case(func, args.number, args.repeat)))
+
+    ms = time_page_render(args.repeat)
+    if ms is not None:
+        print('%-34s %8.2f ms' % ('render a grid page (reportlab)', ms))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+########################################################################
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+
+########################################################################
+
+
+"""Time generate_grid for every available driver over a set of cases
+
+The cases cover a blank mark mode grid of 8 weeks, history mode grids
+of 6 months, 2 years and 10 years of daily data, and synthetic logs of
+1k to 100k daily points (of which mark mode plots the last 8 weeks).
+Every case runs with and without a height, i.e. with and without the
+BMI axis.
+
+For every driver and case, this reports the best wall time of a number
+of runs, the peak memory allocated by Python code during one more run
+under tracemalloc, and the output size. The results can be written as
+JSON or CSV, and a JSON file written before serves as a baseline for
+the relative change in time.
+
+Run from the top level source directory:
+
+    python3 benchmarks/render_suite.py --json baseline.json
+    python3 benchmarks/render_suite.py --baseline baseline.json
+
+The TikZ driver needs pdflatex. Cases which fail, e.g. for lack of
+pdflatex, are reported and skipped.
+"""
+
+
+########################################################################
+
+
+import argparse
+import csv
+import datetime
+import fnmatch
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+########################################################################
+
+
+top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, top_dir)
+
+from weight_cal_grid import drivers, generate_grid, log
+
+
+########################################################################
+
+
+end_date = datetime.date(2016, 5, 22)
+kg_range = (70.0, 80.0)
+height = 1.78
+
+
+class Case(object):
+
+    """One way of calling generate_grid
+
+    points is the number of daily plot points up to end_date, or None
+    for a blank grid.
+    """
+
+    def __init__(self, name, history_mode, points=None, bmi=True):
+        super(Case, self).__init__()
+        self.name = name
+        self.history_mode = history_mode
+        self.points = points
+        self.bmi = bmi
+
+    def date_range(self):
+        if self.points:
+            return (None, None)
+        return (end_date - datetime.timedelta(days=8*7), end_date)
+
+
+def get_cases():
+    """All benchmark cases, each with and without BMI"""
+    cases = [
+        ('mark-blank-8w', False, None),
+        ('history-6m',    True,  183),
+        ('history-2y',    True,  730),
+        ('history-10y',   True,  3653),
+        ('log-1k',        False, 1000),
+        ('log-10k',       False, 10000),
+        ('log-100k',      False, 100000),
+        ]
+    result = []
+    for name, history_mode, points in cases:
+        result.append(Case(name + '-bmi', history_mode, points, True))
+        result.append(Case(name, history_mode, points, False))
+    return result
+
+
+def write_log(fname, points, seed=42):
+    """Write a synthetic log of daily points ending at end_date"""
+    rng = random.Random(seed)
+    begin = end_date - datetime.timedelta(days=points - 1)
+    with open(fname, 'w') as logfile:
+        print('# synthetic weight log, %d points' % points, file=logfile)
+        for i in range(points):
+            date = begin + datetime.timedelta(days=i)
+            kg = 75.0 + 3.0 * math.sin(i / 60.0) + rng.gauss(0.0, 0.4)
+            print('%s %.1f' % (date, kg), file=logfile)
+
+
+########################################################################
+
+
+def run_case(driver_cls, case, log_fname):
+    """Generate the grid for case once, returning the output size"""
+    outfile = io.BytesIO()
+    infile = None
+    if log_fname:
+        infile = open(log_fname, 'r')
+    try:
+        generate_grid(case.bmi and height or None, kg_range,
+                      case.date_range(), infile,
+                      driver_cls, None, outfile,
+                      False, case.history_mode, None, None)
+    finally:
+        if infile:
+            infile.close()
+    return len(outfile.getvalue())
+
+
+def measure(driver_cls, case, log_fname, repeat):
+    """Measure case, returning a result dict"""
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        size = run_case(driver_cls, case, log_fname)
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        run_case(driver_cls, case, log_fname)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'driver': driver_cls.driver_name,
+            'case': case.name,
+            'points': case.points or 0,
+            'bmi': case.bmi,
+            'best_ms': round(1000.0 * min(times), 2),
+            'median_ms': round(1000.0 * statistics.median(times), 2),
+            'peak_kib': round(peak / 1024.0, 1),
+            'output_bytes': size}
+
+
+def run_suite(driver_names, cases, repeat, tmpdir):
+    """Measure every case with every driver, returning the results"""
+    log_fnames = {}
+    for case in cases:
+        if case.points and case.points not in log_fnames:
+            fname = os.path.join(tmpdir, 'log-%d.txt' % case.points)
+            write_log(fname, case.points)
+            log_fnames[case.points] = fname
+    results = []
+    for name in driver_names:
+        driver_cls = drivers.get_driver(name)
+        for case in cases:
+            try:
+                res = measure(driver_cls, case, log_fnames.get(case.points),
+                              repeat)
+            except drivers.basic.DriverError as e:
+                print('skipping %s %s: %s' % (name, case.name, e),
+                      file=sys.stderr)
+                continue
+            print_result(res, None)
+            results.append(res)
+    return results
+
+
+########################################################################
+
+
+columns = ['driver', 'case', 'points', 'bmi', 'best_ms', 'median_ms',
+           'peak_kib', 'output_bytes']
+
+
+def print_header():
+    print('%-10s %-20s %10s %10s %11s %11s  %s'
+          % ('driver', 'case', 'best ms', 'median ms', 'peak KiB',
+             'out bytes', 'vs baseline'))
+
+
+def print_result(res, baseline):
+    change = ''
+    base = baseline and baseline.get((res['driver'], res['case']))
+    if base:
+        change = '%+.1f%%' % (100.0 * (res['best_ms'] / base['best_ms'] - 1.0))
+    print('%-10s %-20s %10.2f %10.2f %11.1f %11d  %s'
+          % (res['driver'], res['case'], res['best_ms'], res['median_ms'],
+             res['peak_kib'], res['output_bytes'], change))
+
+
+def read_baseline(fname):
+    """Get {(driver, case): result} from a JSON file written before"""
+    with open(fname, 'r') as baseline_file:
+        data = json.load(baseline_file)
+    return dict(((res['driver'], res['case']), res)
+                for res in data['results'])
+
+
+def write_json(fname, results, repeat):
+    data = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'results': results}
+    with open(fname, 'w') as json_file:
+        json.dump(data, json_file, indent=2, sort_keys=True)
+        print(file=json_file)
+
+
+def write_csv(fname, results):
+    with open(fname, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+########################################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='time generate_grid per driver and case')
+    parser.add_argument('--driver', action='append', metavar='DRIVER',
+                        help='driver to measure, may be given more than '
+                        'once (default: all available drivers)')
+    parser.add_argument('--case', action='append', metavar='PATTERN',
+                        help='only run the cases matching the shell '
+                        'pattern, may be given more than once')
+    parser.add_argument('--list', action='store_true',
+                        help='list the cases and exit')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed runs per case, the best one counts '
+                        '(default: %(default)s)')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write the results to FILE as JSON')
+    parser.add_argument('--csv', metavar='FILE',
+                        help='write the results to FILE as CSV')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare the times to a JSON file written by '
+                        '--json before')
+    args = parser.parse_args(argv)
+
+    cases = get_cases()
+    if args.case:
+        unmatched = [pattern for pattern in args.case
+                     if not any(fnmatch.fnmatch(case.name, pattern)
+                                for case in cases)]
+        if unmatched:
+            parser.error('no case matches %s (see --list)'
+                         % ', '.join(unmatched))
+        cases = [case for case in cases
+                 if any(fnmatch.fnmatch(case.name, pattern)
+                        for pattern in args.case)]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return 0
+
+    log.level = log.QUIET
+    log.startup_level = log.QUIET
+    driver_names = args.driver or sorted(drivers.load_drivers())
+    baseline = None
+    if args.baseline:
+        baseline = read_baseline(args.baseline)
+
+    print_header()
+    with tempfile.TemporaryDirectory(prefix='wcg-render-suite.') as tmpdir:
+        results = run_suite(driver_names, cases, args.repeat, tmpdir)
+
+    if baseline:
+        print()
+        print_header()
+        for res in results:
+            print_result(res, baseline)
+    if args.json:
+        write_json(args.json, results, args.repeat)
+    if args.csv:
+        write_csv(args.csv, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+########################################################################
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+
+########################################################################
+
+
+"""Measure wcg-cli startup time and check it against a budget
+
+Every case runs wcg-cli in a fresh interpreter. The cold run starts
+with an empty bytecode cache (via PYTHONPYCACHEPREFIX), the warm runs
+reuse the cache filled by the cold run. Runs with -X importtime break
+the import time down by module.
+
+The budget is relative to the startup time of a bare interpreter
+(python -c pass) measured in the same run, so that it holds on slower
+and faster machines alike.
+
+Noise on a busy machine only ever adds time, so every time is the
+minimum over several runs. The reference runs happen both before and
+after the cases. Cases which exceed their budget are measured once
+more before they count as failures.
+
+Run from the top level source directory:
+
+    python3 benchmarks/startup.py               # measure and check
+    python3 benchmarks/startup.py --update      # write a new budget
+
+The exit code is 1 if a warm wall time or an import time exceeds its
+budget by more than the tolerance. Cases which cannot run here, e.g.
+for lack of the driver, are skipped.
+"""
+
+
+########################################################################
+
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+########################################################################
+
+
+top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_budget_fname = os.path.join(top_dir, 'benchmarks',
+                                    'startup_budget.json')
+
+# Modules whose import time is tracked separately, in addition to the
+# total import time of the weight_cal_grid package.
+tracked_modules = [
+    'weight_cal_grid',
+    'weight_cal_grid.cli',
+    'weight_cal_grid.i18n',
+    'weight_cal_grid.log',
+    'weight_cal_grid.trace',
+    'weight_cal_grid.drivers',
+    ]
+
+
+########################################################################
+
+
+def get_cases(driver, outfname):
+    """Benchmark cases as (name, wcg-cli arguments)"""
+    return [
+        ('version', ['--version']),
+        ('list-options', ['--list-options']),
+        ('render-%s' % driver, ['--driver=%s' % driver,
+                                '--height=1.75', '--weight=70-80',
+                                '--begin-date=2015-11-22',
+                                '--output=%s' % outfname]),
+        ]
+
+
+def run_cli(args, env, importtime=False):
+    """Run wcg-cli once, returning (wall time in ms, stderr)"""
+    return run_python([os.path.join(top_dir, 'wcg-cli')] + args,
+                      env, importtime)
+
+
+def run_python(args, env, importtime=False):
+    """Run the interpreter once, returning (wall time in ms, stderr)"""
+    cmd = [sys.executable]
+    if importtime:
+        cmd.extend(['-X', 'importtime'])
+    cmd.extend(args)
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=top_dir, env=env,
+                          stdin=subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE)
+    wall_ms = 1000.0 * (time.perf_counter() - t0)
+    if proc.returncode != 0:
+        raise RuntimeError('%s failed (retcode=%d):\n%s'
+                           % (' '.join(cmd[1:]), proc.returncode,
+                              proc.stderr.decode('utf-8', 'replace')))
+    return wall_ms, proc.stderr.decode('utf-8', 'replace')
+
+
+def parse_importtime(text):
+    """Get {module: cumulative import time in ms} from -X importtime"""
+    times = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(fields[1]) / 1000.0
+        except ValueError:
+            continue # the header line
+        times[fields[2].strip()] = cumulative
+    return times
+
+
+########################################################################
+
+
+def measure(cases, repeat):
+    """Measure all cases, returning the results as a dict
+
+    Warm and import times are the minimum of repeat runs, the latter
+    with -X importtime. The reference time is the minimum of 2*repeat
+    runs before and as many after the cases.
+    """
+    results = {'reference_ms': None, 'cases': {}}
+    with tempfile.TemporaryDirectory(prefix='wcg-pycache.') as cache_dir:
+        env = dict(os.environ)
+        env['PYTHONPYCACHEPREFIX'] = cache_dir
+        # the warm runs need the bytecode written by the cold run
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        run_python(['-c', 'pass'], env)
+        reference = [run_python(['-c', 'pass'], env)[0]
+                     for i in range(2 * repeat)]
+        for name, args in cases:
+            try:
+                cold_ms, errs = run_cli(args, env)
+            except RuntimeError as e:
+                print('skipping %s: %s' % (name, e), file=sys.stderr)
+                continue
+            warm_ms = min(run_cli(args, env)[0] for i in range(repeat))
+            import_runs = [
+                parse_importtime(run_cli(args, env, importtime=True)[1])
+                for i in range(repeat)]
+            results['cases'][name] = {
+                'cold_ms': round(cold_ms, 1),
+                'warm_ms': round(warm_ms, 1),
+                'imports_ms': dict(
+                    (mod, round(min(run[mod] for run in import_runs), 1))
+                    for mod in tracked_modules
+                    if all(mod in run for run in import_runs)),
+                }
+        reference.extend(run_python(['-c', 'pass'], env)[0]
+                         for i in range(2 * repeat))
+        results['reference_ms'] = round(min(reference), 1)
+    return results
+
+
+def merge_results(results, more):
+    """Combine two measurements of the same cases by their minimum"""
+    merged = {'reference_ms': min(results['reference_ms'],
+                                  more['reference_ms']),
+              'cases': dict(results['cases'])}
+    for name, res in more['cases'].items():
+        old = merged['cases'].get(name)
+        if not old:
+            merged['cases'][name] = res
+            continue
+        merged['cases'][name] = {
+            'cold_ms': min(old['cold_ms'], res['cold_ms']),
+            'warm_ms': min(old['warm_ms'], res['warm_ms']),
+            'imports_ms': dict(
+                (mod, min(ms, res['imports_ms'].get(mod, ms)))
+                for mod, ms in old['imports_ms'].items()),
+            }
+    return merged
+
+
+def make_budget(results):
+    """Get a budget relative to the reference time from results"""
+    ref_ms = results['reference_ms']
+    budget = {'reference': 'python -c pass',
+              'reference_ms': ref_ms,
+              'cases': {}}
+    for name, res in results['cases'].items():
+        budget['cases'][name] = {
+            'warm': round(res['warm_ms'] / ref_ms, 3),
+            'imports': dict((mod, round(ms / ref_ms, 3))
+                            for mod, ms in res['imports_ms'].items()),
+            }
+    return budget
+
+
+def get_limits(budget, ref_ms):
+    """Get {case: {'warm_ms': ms, 'imports_ms': {mod: ms}}} from budget"""
+    limits = {}
+    for name, bres in budget.get('cases', {}).items():
+        limits[name] = {
+            'warm_ms': bres['warm'] * ref_ms,
+            'imports_ms': dict((mod, ratio * ref_ms)
+                               for mod, ratio in bres['imports'].items()),
+            }
+    return limits
+
+
+def format_limit(limit):
+    if limit is None:
+        return '-'
+    return '%.1f' % limit
+
+
+def print_results(results, limits):
+    print('%-38s %8.1f ms' % ('python -c pass (reference)',
+                              results['reference_ms']))
+    for name, res in results['cases'].items():
+        print('%s:' % name)
+        lres = limits.get(name, {})
+        print('    %-34s %8.1f ms' % ('cold', res['cold_ms']))
+        print('    %-34s %8.1f ms  (budget %s)'
+              % ('warm', res['warm_ms'], format_limit(lres.get('warm_ms'))))
+        for mod, ms in sorted(res['imports_ms'].items()):
+            print('    %-34s %8.1f ms  (budget %s)'
+                  % ('import ' + mod, ms,
+                     format_limit(lres.get('imports_ms', {}).get(mod))))
+
+
+def check_budget(results, limits, tolerance, slack_ms):
+    """List the (case, message) pairs of measurements over their limit
+
+    A measurement may exceed its limit by the relative tolerance plus
+    slack_ms, which keeps the small imports from failing on noise.
+    """
+    failures = []
+    def check(name, what, value, limit):
+        if limit is not None and value > limit * (1.0 + tolerance) + slack_ms:
+            failures.append((name, '%s %s: %.1f ms exceeds budget %.1f ms '
+                             'by more than %d%%' % (name, what, value, limit,
+                                                    100 * tolerance)))
+    for name, res in results['cases'].items():
+        lres = limits.get(name)
+        if not lres:
+            continue
+        check(name, 'warm', res['warm_ms'], lres.get('warm_ms'))
+        for mod, ms in res['imports_ms'].items():
+            check(name, 'import %s' % mod, ms, lres['imports_ms'].get(mod))
+    return failures
+
+
+########################################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='measure wcg-cli startup time against a budget')
+    parser.add_argument('--budget', metavar='FILE',
+                        default=default_budget_fname,
+                        help='budget file (default: %(default)s)')
+    parser.add_argument('--update', action='store_true',
+                        help='write the measured times as the new budget')
+    parser.add_argument('--driver', default='reportlab',
+                        help='driver for the render case (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of warm runs per case (default: %(default)s)')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative excess over the budget '
+                        '(default: %(default)s)')
+    parser.add_argument('--slack', type=float, default=5.0, metavar='MS',
+                        help='allowed absolute excess over the budget in ms '
+                        '(default: %(default)s)')
+    parser.add_argument('--retries', type=int, default=1,
+                        help='times to measure failing cases again before '
+                        'they count (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.TemporaryDirectory(prefix='wcg-startup.')
+    cases = get_cases(args.driver, os.path.join(tmpdir.name, 'grid.pdf'))
+    results = measure(cases, args.repeat)
+
+    if args.update:
+        tmpdir.cleanup()
+        with open(args.budget, 'w') as budget_file:
+            json.dump(make_budget(results), budget_file,
+                      indent=2, sort_keys=True)
+            budget_file.write('\n')
+        print_results(results, {})
+        print('wrote budget to %s' % args.budget)
+        return 0
+
+    try:
+        with open(args.budget) as budget_file:
+            budget = json.load(budget_file)
+    except FileNotFoundError:
+        budget = {}
+    limits = get_limits(budget, results['reference_ms'])
+    failures = check_budget(results, limits, args.tolerance, args.slack)
+    for retry in range(args.retries):
+        if not failures:
+            break
+        names = set(name for name, message in failures)
+        print('measuring %s again' % ', '.join(sorted(names)))
+        results = merge_results(results, measure(
+            [case for case in cases if case[0] in names], args.repeat))
+        limits = get_limits(budget, results['reference_ms'])
+        failures = check_budget(results, limits, args.tolerance, args.slack)
+    tmpdir.cleanup()
+
+    print_results(results, limits)
+    for name in results['cases']:
+        if name not in limits:
+            print('note: no budget for %s, see --update' % name)
+    for name, message in failures:
+        print('FAIL:', message)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+########################################################################
@@ -48,6 +48,7 @@ setup(
     packages=find_packages(exclude=[
         '*.tests',
     ]),
+    python_requires='>=3.7',
     install_requires=[
         'PyYAML',
     ],
@@ -17,6 +17,7 @@ import time
 
 from . import drivers
 from . import log
+from . import trace
 from .i18n import get_translation
 from .utils import (get_earliest_sunday, get_latest_sunday,
                     get_latest_first, get_next_first)
@@ -25,90 +26,124 @@ from .utils import (get_earliest_sunday, get_latest_sunday,
 ########################################################################
 
 
-def read_plot_data(infile, kg_range, date_range,
-                   history_mode):
-    """If present, read plot data and adapt min_kg, max_kg"""
-    (min_kg, max_kg) = kg_range
-    (begin_date, end_date) = date_range
-    plot_points = []
+class PlotPoints(list):
 
-    if infile:
-        log.verbose("Reading plot data from %s", infile.name)
+    """The (date, kg) plot points read from an input file
 
-        plot_begin  = None
-        plot_end    = None
+    This can be passed to generate_grid() in place of the input file,
+    so that the file is only parsed once for several grids.
+    """
 
-        for line in iter(infile):
-            line = line.strip()
-            if len(line) == 0 or line[0] == '#':
-                continue
-            line = line.split()
+    def __init__(self, name, points=()):
+        super(PlotPoints, self).__init__(points)
+        self.name = name
 
-            date_str, kg_str = line[:2]
-            ts = time.strptime(date_str, '%Y-%m-%d')
-            plot_date = datetime.date(*ts[0:3])
 
-            if (not plot_begin) or (plot_date < plot_begin):
-                plot_begin = plot_date
-            if (not plot_end) or (plot_date > plot_end):
-                plot_end   = plot_date
+def read_plot_points(infile):
+    """Read the (date, kg) plot points from infile into PlotPoints"""
+    log.verbose("Reading plot data from %s", infile.name)
 
-            plot_kg = float(kg_str)
+    plot_points = PlotPoints(infile.name)
 
-            log.debug('read plot point %s %5.2fkg', plot_date, plot_kg)
-            plot_points.append((plot_date, plot_kg))
+    for line in iter(infile):
+        line = line.strip()
+        if len(line) == 0 or line[0] == '#':
+            continue
+        line = line.split()
 
-        log.verbose("Read %d plot points from %s",
-                    len(plot_points), infile.name)
+        date_str, kg_str = line[:2]
+        ts = time.strptime(date_str, '%Y-%m-%d')
+        plot_date = datetime.date(*ts[0:3])
 
-        # calculate moving average
-        i = 0
-        depth = 10
-        depthm1 = 1.0 / depth
-        q = []
+        plot_kg = float(kg_str)
 
-        cur_date, plot_kg = plot_points[i]
-        prev_date = None
-        avg_points = []
+        log.debug('read plot point %s %5.2fkg', plot_date, plot_kg)
+        plot_points.append((plot_date, plot_kg))
 
-        while True:
-            if len(q) < depth:
-                q.insert(0, plot_kg)
-            else:
-                q.pop()
-                q.insert(0, plot_kg)
-
-            qsum = 0.0
-            qcnt = 0
-            for qval in q:
-                if qval != None:
-                    qsum += qval
-                    qcnt += 1
-            if qcnt > 0:
-                qavg = qsum / qcnt
-                qual = qcnt * depthm1
-            else:
-                qavg = None
-                qual = 0.0
+    log.verbose("Read %d plot points from %s",
+                len(plot_points), infile.name)
 
-            avg_points.append((cur_date, plot_kg, (qavg, qual)))
+    return plot_points
 
-            prev_date = cur_date
-            cur_date += datetime.timedelta(days=1)
-            if cur_date > plot_end:
-                break
 
-            # next plot point if date is past current one
-            if cur_date > plot_points[i][0]:
-                i += 1
+def moving_average(plot_points, plot_end):
+    """Add the moving average to every day up to plot_end
 
-            # if date is exact match, set plot_kg to proper value, None otherwise
-            if cur_date == plot_points[i][0]:
-                _plot_date, plot_kg = plot_points[i]
-            else:
-                plot_kg = None
+    Returns a list of (date, kg or None, (avg kg or None, quality))
+    for every day from the first plot point to plot_end.
+    """
+    # calculate moving average
+    i = 0
+    depth = 10
+    depthm1 = 1.0 / depth
+    q = []
+
+    cur_date, plot_kg = plot_points[i]
+    prev_date = None
+    avg_points = []
+
+    while True:
+        if len(q) < depth:
+            q.insert(0, plot_kg)
+        else:
+            q.pop()
+            q.insert(0, plot_kg)
+
+        qsum = 0.0
+        qcnt = 0
+        for qval in q:
+            if qval != None:
+                qsum += qval
+                qcnt += 1
+        if qcnt > 0:
+            qavg = qsum / qcnt
+            qual = qcnt * depthm1
+        else:
+            qavg = None
+            qual = 0.0
+
+        avg_points.append((cur_date, plot_kg, (qavg, qual)))
+
+        prev_date = cur_date
+        cur_date += datetime.timedelta(days=1)
+        if cur_date > plot_end:
+            break
 
-        plot_points = avg_points
+        # next plot point if date is past current one
+        if cur_date > plot_points[i][0]:
+            i += 1
+
+        # if date is exact match, set plot_kg to proper value, None otherwise
+        if cur_date == plot_points[i][0]:
+            _plot_date, plot_kg = plot_points[i]
+        else:
+            plot_kg = None
+
+    return avg_points
+
+
+def read_plot_data(infile, kg_range, date_range,
+                   history_mode):
+    """If present, read plot data and adapt min_kg, max_kg
+
+    infile is an input file or PlotPoints read before.
+    """
+    (min_kg, max_kg) = kg_range
+    (begin_date, end_date) = date_range
+    plot_points = []
+
+    if infile:
+        if isinstance(infile, PlotPoints):
+            plot_points = infile
+        else:
+            with trace.span('read_plot_data.parse'):
+                plot_points = read_plot_points(infile)
+
+        plot_begin = min(d for d, kg in plot_points)
+        plot_end   = max(d for d, kg in plot_points)
+
+        with trace.span('read_plot_data.trend'):
+            plot_points = moving_average(plot_points, plot_end)
 
         if (begin_date, end_date) == (None, None):
             log.debug("Setting (begin, end) to plot dates (%s, %s)",
@@ -173,19 +208,22 @@ def parse_kg_range(kg_range):
 ########################################################################
 
 
-def generate_grid(height,
-                  kg_range,
-                  date_range,
-                  infile,
-                  driver_cls,
-                  output_format,
-                  outfile,
-                  keep_tmp_on_error,
-                  history_mode,
-                  initials,
-                  lang):
+def setup_driver(height,
+                 kg_range,
+                 date_range,
+                 infile,
+                 driver_cls,
+                 output_format,
+                 keep_tmp_on_error,
+                 history_mode,
+                 initials,
+                 lang,
+                 driver_options=None):
 
-    """Generate the things to plot and hand them to the driver."""
+    """Generate the things to plot and lay them out in a driver.
+
+    Returns the driver and the output format to generate with it.
+    """
     (begin_date, end_date) = date_range
     min_kg, max_kg = parse_kg_range(kg_range)
 
@@ -220,7 +258,8 @@ def generate_grid(height,
         clitems.append('--end=%s' % end_date)
     if initials:
         clitems.append('--initials=%s' % initials)
-    clitems.append('--weight=%d-%d' % (int(min_kg), int(max_kg)))
+    if min_kg and max_kg:
+        clitems.append('--weight=%d-%d' % (int(min_kg), int(max_kg)))
     if height:
         clitems.append('--height=%.2f' % height)
     if lang:
@@ -229,6 +268,8 @@ def generate_grid(height,
                                    True:  'history' }[history_mode])
     if infile:
         clitems.append('--input=…')
+    for name, value in sorted((driver_options or {}).items()):
+        clitems.append('--driver-option=%s=%s' % (name, value))
 
     # set up driver
     driver = driver_cls(height, (min_kg, max_kg),
@@ -238,11 +279,35 @@ def generate_grid(height,
                         history_mode=history_mode,
                         initials=initials,
                         translation=get_translation(lang),
-                        cmdline=' '.join(clitems))
+                        cmdline=' '.join(clitems),
+                        driver_options=driver_options)
 
-    driver.count_axes()
+    with trace.span('count_axes'):
+        driver.count_axes()
 
-    driver.gen_outfile(outfile, output_format)
+    return driver, output_format
+
+
+def generate_grid(height,
+                  kg_range,
+                  date_range,
+                  infile,
+                  driver_cls,
+                  output_format,
+                  outfile,
+                  keep_tmp_on_error,
+                  history_mode,
+                  initials,
+                  lang,
+                  driver_options=None):
+
+    """Generate the things to plot and hand them to the driver."""
+    with trace.span('generate_grid', driver=driver_cls.driver_name):
+        driver, output_format = setup_driver(height, kg_range, date_range,
+                                             infile, driver_cls, output_format,
+                                             keep_tmp_on_error, history_mode,
+                                             initials, lang, driver_options)
+        driver.gen_outfile(outfile, output_format)
 
 
 ########################################################################
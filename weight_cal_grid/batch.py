@@ -0,0 +1,388 @@
+########################################################################
+
+
+"""Generate many grids from a job manifest in a single process
+
+A manifest is either a YAML file with a list of jobs, or JSON lines
+with one job per line (a file name ending in .jsonl, or '-' for
+stdin). Every job is a mapping with keys named after the long wcg-cli
+options:
+
+    - output: grid-ab.pdf
+      height: 1.78
+      weight: 70-80
+      begin: 2015-11-22
+      input: ab.dat
+      driver: reportlab
+      format: pdf
+      initials: AB
+      lang: de
+      mode: history
+      driver_options: {compress: no}
+      keep: no
+
+Only output is required, and it must be a file name, not '-' for
+stdout. All jobs are checked before the first one runs. Drivers,
+fonts and translations are loaded once for all jobs, and every input
+file is only read once.
+
+With several workers, the jobs run in a pool of processes, each of
+which loads the drivers, fonts and translations once when it starts.
+"""
+
+
+########################################################################
+
+
+import concurrent.futures
+import datetime
+import json
+import os
+import sys
+import time
+
+
+########################################################################
+
+
+import yaml
+
+
+########################################################################
+
+
+from . import drivers
+from . import generate_grid, read_plot_points
+from . import log
+from .cli import KGRangeType, OutFileType, plot_mode_default, plot_mode_dict
+from .i18n import NoSuchTranslationError, get_translation, languages
+
+
+########################################################################
+
+
+class ManifestError(Exception):
+    """The batch job manifest is invalid"""
+    pass
+
+
+########################################################################
+
+
+job_keys = ['output', 'height', 'weight', 'begin', 'end', 'input',
+            'driver', 'format', 'initials', 'lang', 'mode',
+            'driver_options', 'keep']
+
+
+def parse_date(value):
+    """Get a date from a YAML date or a YYYY-MM-DD string"""
+    if value is None or isinstance(value, datetime.date):
+        return value
+    ts = time.strptime(value, '%Y-%m-%d')
+    return datetime.date(*(ts[0:3]))
+
+
+def parse_weight(value):
+    """Get a kg range like the --weight option does"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return KGRangeType()(str(value if value is not None else 'auto'))
+
+
+class BatchJob(object):
+
+    """One grid to generate, as described by a manifest entry"""
+
+    def __init__(self, number, entry):
+        super(BatchJob, self).__init__()
+        if not isinstance(entry, dict):
+            raise ManifestError('job %d: not a mapping' % number)
+        unknown = sorted(set(entry) - set(job_keys))
+        if unknown:
+            raise ManifestError('job %d: unknown key(s) %s'
+                                % (number, ', '.join(unknown)))
+        if not entry.get('output'):
+            raise ManifestError('job %d: no output given' % number)
+        if entry['output'] == '-':
+            raise ManifestError('job %d: cannot write to stdout, '
+                                'output must be a file name' % number)
+
+        self.number = number
+        self.output = entry['output']
+        try:
+            self.height = entry.get('height')
+            if self.height is not None:
+                self.height = float(self.height)
+            self.weight = parse_weight(entry.get('weight'))
+            self.begin_date = parse_date(entry.get('begin'))
+            self.end_date = parse_date(entry.get('end'))
+        except (AssertionError, TypeError, ValueError) as e:
+            raise ManifestError('job %d: %s' % (number, e))
+        if not (self.height or self.weight):
+            raise ManifestError('job %d: needs height or weight or both'
+                                % number)
+        if (self.begin_date and self.end_date and
+            (self.end_date - self.begin_date).days <= 0):
+            raise ManifestError('job %d: end date must be after begin date'
+                                % number)
+
+        self.input = entry.get('input')
+        self.driver = entry.get('driver')
+        self.output_format = entry.get('format')
+        self.initials = entry.get('initials')
+        if self.initials is not None:
+            self.initials = str(self.initials)
+        self.lang = entry.get('lang')
+        if self.lang is not None and self.lang not in languages:
+            raise ManifestError('job %d: unknown language %s'
+                                % (number, self.lang))
+        self.plot_mode = entry.get('mode', plot_mode_default)
+        if self.plot_mode not in plot_mode_dict:
+            raise ManifestError('job %d: unknown mode %s'
+                                % (number, self.plot_mode))
+        driver_options = entry.get('driver_options') or {}
+        if not isinstance(driver_options, dict):
+            raise ManifestError('job %d: driver_options must be a mapping'
+                                % number)
+        self.driver_options = dict((str(k), v) for k, v in
+                                   driver_options.items())
+        self.keep_tmp_on_error = bool(entry.get('keep', False))
+
+    def __str__(self):
+        return 'job %d (%s)' % (self.number, self.output)
+
+    def get_driver_cls(self):
+        """Look up the driver class and check format and options"""
+        try:
+            driver_cls = drivers.get_driver(self.driver)
+        except drivers.NoSuchDriverError:
+            raise ManifestError('driver %s not available' % self.driver)
+        if (self.output_format and
+            self.output_format not in driver_cls.driver_formats):
+            raise ManifestError('output format %s not handled by driver %s'
+                                % (self.output_format, driver_cls.driver_name))
+        try:
+            driver_cls.parse_driver_options(self.driver_options)
+        except (drivers.basic.NoSuchDriverOptionError, ValueError) as e:
+            raise ManifestError(str(e))
+        return driver_cls
+
+
+########################################################################
+
+
+def read_manifest(fname):
+    """Read the list of BatchJobs from the manifest file fname"""
+    if fname == '-':
+        return parse_jsonl(sys.stdin, '<stdin>')
+    with open(fname, 'r') as manifest_file:
+        if fname.endswith('.jsonl'):
+            return parse_jsonl(manifest_file, fname)
+        try:
+            entries = yaml.safe_load(manifest_file)
+        except yaml.YAMLError as e:
+            raise ManifestError('%s: %s' % (fname, e))
+    if entries is None:
+        entries = []
+    if not isinstance(entries, list):
+        raise ManifestError('%s: manifest must be a list of jobs' % fname)
+    return [BatchJob(n+1, entry) for n, entry in enumerate(entries)]
+
+
+def check_jobs(jobs):
+    """Check driver, format and driver options of all jobs
+
+    Returns the list of error messages.
+    """
+    errors = []
+    for job in jobs:
+        try:
+            job.get_driver_cls()
+        except ManifestError as e:
+            errors.append('job %d: %s' % (job.number, e))
+    return errors
+
+
+def parse_jsonl(manifest_file, name):
+    """Parse BatchJobs from JSON lines, skipping empty lines"""
+    jobs = []
+    for lineno, line in enumerate(manifest_file, start=1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            raise ManifestError('%s:%d: %s' % (name, lineno, e))
+        jobs.append(BatchJob(len(jobs)+1, entry))
+    return jobs
+
+
+########################################################################
+
+
+class BatchRunner(object):
+
+    """Run BatchJobs one after the other in this process
+
+    Parsed input files are kept for the following jobs.
+    """
+
+    def __init__(self, dry_run=False):
+        super(BatchRunner, self).__init__()
+        self.dry_run = dry_run
+        self.plot_points = {}
+
+    def get_plot_points(self, fname):
+        if fname not in self.plot_points:
+            with open(fname, 'r') as infile:
+                self.plot_points[fname] = read_plot_points(infile)
+        return self.plot_points[fname]
+
+    def run_job(self, job):
+        """Generate the grid for job, returning the time it took"""
+        t0 = time.monotonic()
+        driver_cls = job.get_driver_cls()
+        infile = None
+        if job.input:
+            infile = self.get_plot_points(job.input)
+        outfile = OutFileType()(job.output)
+        if self.dry_run:
+            outfile.dry_run()
+        generate_grid(
+            job.height,
+            job.weight,
+            (job.begin_date, job.end_date),
+            infile,
+            driver_cls, job.output_format,
+            outfile,
+            job.keep_tmp_on_error,
+            job.plot_mode == 'history',
+            job.initials,
+            job.lang,
+            job.driver_options)
+        outfile.close()
+        return time.monotonic() - t0
+
+    def try_job(self, job):
+        """Run job, returning (job number, error message or None, duration)
+
+        The result only consists of builtin types, so it can be passed
+        back from a worker process.
+        """
+        t0 = time.monotonic()
+        try:
+            with log.context(job=job.number, driver=job.driver):
+                self.run_job(job)
+            error = None
+        except (drivers.basic.DriverError, ManifestError,
+                NoSuchTranslationError, EnvironmentError, ValueError) as e:
+            error = str(e)
+        except Exception as e:
+            # a bug, but it must not take the other jobs down with it
+            log.debug(exc_info=True)
+            error = 'internal error: %s: %s' % (type(e).__name__, e)
+        return (job.number, error, time.monotonic() - t0)
+
+    def run(self, jobs, max_workers=1):
+        """Run all jobs, returning the number of failed jobs
+
+        A failing job is reported, and the other jobs still run. With
+        max_workers other than 1, the jobs run in a pool of that many
+        processes (0 for the number of CPUs), and are reported in the
+        order they finish.
+        """
+        if max_workers == 1:
+            statuses = map(self.try_job, jobs)
+        else:
+            statuses = self.__run_pool(jobs, max_workers or os.cpu_count())
+        job_dict = dict((job.number, job) for job in jobs)
+        failed = 0
+        for number, error, duration in statuses:
+            job = job_dict[number]
+            extra = {'job': number, 'driver': job.driver,
+                     'output': job.output, 'duration_s': round(duration, 4)}
+            if error:
+                log.error('%s: %s', job, error, extra=extra)
+                failed += 1
+            else:
+                log.verbose('%s: done in %.2fs', job, duration, extra=extra)
+        log.info('%d of %d jobs done, %d failed',
+                 len(jobs) - failed, len(jobs), failed,
+                 extra={'jobs': len(jobs), 'failed': failed})
+        return failed
+
+    def __run_pool(self, jobs, max_workers):
+        log.verbose('running %d jobs in %d worker processes',
+                    len(jobs), max_workers)
+        initargs = (list(set(job.driver for job in jobs)),
+                    list(set(job.lang for job in jobs)),
+                    log.level, self.dry_run)
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers, initializer=init_worker,
+                initargs=initargs) as executor:
+            futures = dict((executor.submit(run_worker_job, job), job)
+                           for job in jobs)
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # e.g. a worker process died
+                    log.debug(exc_info=True)
+                    yield (futures[future].number,
+                           'internal error: %s: %s' % (type(e).__name__, e),
+                           0.0)
+
+
+########################################################################
+
+
+# The BatchRunner of a worker process
+_worker_runner = None
+
+
+def init_worker(driver_names, langs, log_level, dry_run):
+    """Set up a worker process for running BatchJobs"""
+    global _worker_runner
+    log.level = log_level
+    for name in driver_names:
+        try:
+            drivers.get_driver(name).warm_up()
+        except drivers.NoSuchDriverError:
+            pass # reported by the job
+    for lang in langs:
+        try:
+            get_translation(lang)
+        except NoSuchTranslationError:
+            pass # reported by the job
+    _worker_runner = BatchRunner(dry_run=dry_run)
+
+
+def run_worker_job(job):
+    """Run job in a worker process set up by init_worker()"""
+    try:
+        return _worker_runner.try_job(job)
+    finally:
+        # pool workers end without running atexit handlers
+        log.sink.flush()
+
+
+########################################################################
+
+
+def main(manifest_fname, dry_run=False, max_workers=1):
+    """Run the jobs from the manifest, returning the exit status"""
+    try:
+        jobs = read_manifest(manifest_fname)
+    except (ManifestError, EnvironmentError) as e:
+        log.error('%s', e)
+        return 2
+    errors = check_jobs(jobs)
+    if errors:
+        for error in errors:
+            log.error('%s', error)
+        return 2
+    failed = BatchRunner(dry_run=dry_run).run(jobs, max_workers)
+    return 1 if failed else 0
+
+
+########################################################################
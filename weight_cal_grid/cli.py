@@ -24,8 +24,10 @@ from pprint import pprint
 from .      import generate_grid
 from .      import drivers
 from .      import log
+from .      import trace
 from .      import version
 from .i18n  import install_translation, languages, print_language_list
+from .i18n  import NoSuchTranslationError
 
 
 ########################################################################
@@ -69,22 +71,26 @@ class KGRangeType(object):
 class DriverAction(argparse.Action):
 
     def __call__(self, parser, namespace, values, option_string=None):
-        driver_cls = drivers.get_driver(values)
+        try:
+            driver_cls = drivers.get_driver(values)
+        except drivers.NoSuchDriverError:
+            parser.error('driver %s not available (--list-options for a list)'
+                         % values)
         setattr(namespace, self.dest, driver_cls)
 
 
 ########################################################################
 
 
-class OutputFormatAction(argparse.Action):
+class DriverOptionAction(argparse.Action):
 
     def __call__(self, parser, namespace, values, option_string=None):
-        if not namespace.driver_cls:
-            parser.error('driver must be specified before output format')
-        if values not in namespace.driver_cls.driver_formats:
-            parser.error('output format %s not handled by driver %s'
-                         % (values, namespace.driver_cls.driver_name))
-        setattr(namespace, self.dest, values)
+        name, sep, value = values.partition('=')
+        if not (name and sep):
+            parser.error('driver option must be given as NAME=VALUE')
+        options = dict(getattr(namespace, self.dest) or {})
+        options[name] = value
+        setattr(namespace, self.dest, options)
 
 
 ########################################################################
@@ -227,7 +233,8 @@ class OutFileType(argparse.FileType):
     def __call__(self, string):
         log.debug('OutFileType.__call__(%s) for %s', repr(string), self)
         if string == '-':
-            return sys.stdout
+            # The drivers write bytes, so use the binary <stdout>.
+            return getattr(sys.stdout, 'buffer', sys.stdout)
         return OutFileWrapper(string, self._mode, self._bufsize)
 
 
@@ -266,9 +273,15 @@ Note that the KG_RANGE can take one of four forms:
     output_grp.add_argument(
         '-d', '--driver', metavar='DRIVER',
         dest='driver_cls', action=DriverAction,
-        default=drivers.get_driver(None),
+        default=None,
         help='use this output driver (--list-options for a list)')
 
+    output_grp.add_argument(
+        '-D', '--driver-option', metavar='NAME=VALUE',
+        dest='driver_options', action=DriverOptionAction,
+        default={},
+        help='set driver specific option (--list-options for a list)')
+
     global_grp.add_argument(
         '-N', '--dry-run', action='store_true',
         dest='dry_run',
@@ -284,7 +297,6 @@ Note that the KG_RANGE can take one of four forms:
     output_grp.add_argument(
         '-f', '--format', metavar='FORMAT',
         dest='output_format',
-        action=OutputFormatAction,
         help='select output format to use '
         '(default: driver dependent, see --list-options)')
 
@@ -294,6 +306,13 @@ Note that the KG_RANGE can take one of four forms:
         help=("the person's height in m "
               "(give this to plot a BMI axis and BMI based estimations)"))
 
+    cmd_grp.add_argument(
+        '--batch', metavar='MANIFEST',
+        dest='batch', default=None,
+        help='generate the grids for all jobs in MANIFEST (YAML, or JSON '
+        'lines from a *.jsonl file or - for <stdin>) and exit; only -j, '
+        '-N, -q and -v apply to the jobs')
+
     cmd_grp.add_argument(
         '-h', '--help', action='help',
         help='show this help message and exit')
@@ -309,6 +328,12 @@ Note that the KG_RANGE can take one of four forms:
         type=argparse.FileType(mode='r'),
         help='plot weight data into generated grid file')
 
+    global_grp.add_argument(
+        '-j', '--jobs', type=int, metavar='N',
+        dest='jobs', default=1,
+        help='run up to N --batch jobs in parallel processes '
+        '(0 for the number of CPUs, default: 1)')
+
     global_grp.add_argument(
         '-k', '--keep', action='store_true',
         dest='keep_tmp_on_error',
@@ -341,6 +366,12 @@ Note that the KG_RANGE can take one of four forms:
         help='name of output grid file to write '
         '(default: <stdout> if not a TTY)')
 
+    global_grp.add_argument(
+        '--profile', metavar='FILE',
+        dest='profile', default=None,
+        help='write the time spent in each stage to FILE '
+        'as Chrome trace events (like WCG_TRACE=FILE)')
+
     global_grp.add_argument(
         '-q', '--quiet', dest='quiet',
         action='count', default=0,
@@ -366,6 +397,17 @@ Note that the KG_RANGE can take one of four forms:
     ver_qu = args.verbose - args.quiet
     log.level = log.startup_level + ver_qu
 
+    if args.profile:
+        trace.start(args.profile)
+
+    if args.batch:
+        # The batch module uses the cli module, so import it on demand.
+        from . import batch
+        if args.jobs < 0:
+            parser.error('the number of jobs must not be negative')
+        sys.exit(batch.main(args.batch, dry_run=args.dry_run,
+                            max_workers=args.jobs))
+
     if args.weight and args.height:
         pass
     elif args.weight:
@@ -376,9 +418,27 @@ Note that the KG_RANGE can take one of four forms:
         parser.error("Cannot determine plot parameters without either "
                      "--height= or --weight= or both.")
 
+    if not args.driver_cls:
+        args.driver_cls = drivers.get_driver(None)
+
+    # only now that the driver is known, whatever the order of -d and -f
+    if (args.output_format and
+        args.output_format not in args.driver_cls.driver_formats):
+        parser.error('output format %s not handled by driver %s'
+                     % (args.output_format, args.driver_cls.driver_name))
+
+    try:
+        args.driver_cls.parse_driver_options(args.driver_options)
+    except (drivers.basic.NoSuchDriverOptionError, ValueError) as e:
+        parser.error(str(e))
+
     if args.lang:
-        log.verbose('setting locale %s', args.lang)
-        install_translation(args.lang)
+        log.verbose('setting language %s', args.lang)
+        try:
+            install_translation(args.lang)
+        except NoSuchTranslationError as e:
+            log.error('%s', e)
+            sys.exit(1)
 
     if simulated_infile and not args.input:
         log.debug("Using simulated input file")
@@ -408,17 +468,27 @@ Note that the KG_RANGE can take one of four forms:
     log.debug('locale LC_MESSAGES %s', locale.getlocale(locale.LC_MESSAGES))
     log.debug('locale LC_TIME %s', locale.getlocale(locale.LC_TIME))
 
-    generate_grid(
-        args.height,
-        args.weight,
-        (args.begin_date, args.end_date),
-        args.input,
-        args.driver_cls, args.output_format,
-        args.output,
-        args.keep_tmp_on_error,
-        args.plot_mode == 'history',
-        args.initials,
-        args.lang)
+    try:
+        generate_grid(
+            args.height,
+            args.weight,
+            (args.begin_date, args.end_date),
+            args.input,
+            args.driver_cls, args.output_format,
+            args.output,
+            args.keep_tmp_on_error,
+            args.plot_mode == 'history',
+            args.initials,
+            args.lang,
+            args.driver_options)
+    except drivers.basic.DriverError as e:
+        log.error("%s", e)
+        sys.exit(1)
+
+    if hasattr(args.output, 'dry_run'):
+        args.output.close()
+    else:
+        args.output.flush()
 
     sys.exit(0)
 
@@ -18,6 +18,8 @@ from pprint import pprint
 
 from .basic import PageDriver
 from .. import log
+from .. import trace
+from ..sink import open_sink
 from ..utils import InternalLogicError
 
 
@@ -69,8 +71,15 @@ class BaseOutputFormat(object, metaclass=OutputFormatMetaClass):
 
     pt_to_mm = 72 / 25.4
 
+    # Handing a file-like object to the cairo surface constructors
+    # makes pycairo use the *_for_stream variants, so the output is
+    # written to the sink while it is being generated.
+    to_stream = True
+
     def __init__(self, outfile, drv):
         super(BaseOutputFormat, self).__init__()
+        if self.to_stream:
+            outfile = open_sink(outfile)
         self.outfile = outfile
         self.font_face = drv.font_face
         self.page_width = drv.page_width
@@ -108,6 +117,8 @@ class PDFOutputFormat(BaseOutputFormat):
 
     def close(self):
         self.sfc.show_page()
+        self.sfc.finish()
+        self.outfile.flush()
 
 
 ########################################################################
@@ -132,6 +143,8 @@ class EPSOutputFormat(BaseOutputFormat):
 
     def close(self):
         self.sfc.show_page()
+        self.sfc.finish()
+        self.outfile.flush()
 
 
 ########################################################################
@@ -155,6 +168,7 @@ class SVGOutputFormat(BaseOutputFormat):
 
     def close(self):
         self.sfc.finish()
+        self.outfile.flush()
 
 
 ########################################################################
@@ -180,6 +194,7 @@ class PNGOutputFormat(BaseOutputFormat):
 
     def close(self):
         self.sfc.write_to_png(self.outfile)
+        self.outfile.flush()
 
 
 ########################################################################
@@ -190,6 +205,7 @@ class CairoOutputFormat(BaseOutputFormat):
     """Write cairo output to on-screen window or other cairo contexts"""
 
     name = 'CAIRO'
+    to_stream = False
 
     def open(self):
         self.ctx = self.outfile
@@ -247,7 +263,8 @@ class CairoDriver(PageDriver):
         ctx = fmt.get_context()
         self.render(ctx)
 
-        fmt.close()
+        with trace.span('serialize', format=output_format):
+            fmt.close()
 
 
     def __render_text_init(self, ctx, x, y, rotate, bold, italic):
@@ -11,12 +11,14 @@
 
 import math
 import os
+import threading
 from os.path import dirname, join
 
-from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.units import cm, mm
-from reportlab.lib.colors import white, red, black
+from reportlab.lib.colors import Color, white, red, black
 from reportlab.pdfgen import canvas
+from reportlab.graphics import renderPDF, renderSVG
+from reportlab.graphics.shapes import Drawing, Group, Circle, Line, Rect, String
 
 # we know some glyphs are missing, suppress warnings
 import reportlab.rl_config
@@ -28,12 +30,41 @@ from reportlab.pdfbase.ttfonts import TTFont
 ########################################################################
 
 
-from .basic import PageDriver
+from .basic import DriverError, PageDriver
 from .. import log
+from .. import trace
 from .. import version
+from ..sink import open_sink
 from ..utils import InternalLogicError
 
 
+########################################################################
+
+# renderPM needs a rasterizer backend which is installed separately
+# from ReportLab itself. Whether it works is only found out when the
+# first PNG is written, so that starting up does not render anything.
+_renderPM = None
+_renderPM_error = None
+_renderPM_lock = threading.Lock()
+
+def get_renderPM():
+    """Get a working renderPM module, or raise DriverError"""
+    global _renderPM, _renderPM_error
+    with _renderPM_lock:
+        if _renderPM is None and _renderPM_error is None:
+            try:
+                from reportlab.graphics import renderPM
+                renderPM.drawToString(Drawing(1, 1), fmt='PNG')
+                _renderPM = renderPM
+            except Exception as e:
+                log.debug(exc_info=True)
+                _renderPM_error = ('PNG output needs a working ReportLab '
+                                   'renderPM backend: %s'
+                                   % str(e).splitlines()[0])
+        if _renderPM_error:
+            raise DriverError(_renderPM_error)
+        return _renderPM
+
 ########################################################################
 
 class FontNotFound(Exception):
@@ -206,86 +237,166 @@ class CourierSet(FontSet):
     bolditalic = 'Courier-BoldOblique'
 
 
+########################################################################
+
+# Note that the font set lists must contain one of the PDF standard
+# fonts in the end, so that we can actually use some font even if we
+# do not find any TTF files.
+
+sans_font_sets = (LiberationSansSet,
+                  LiberationSansNarrowSet,
+                  DejaVuSansCondensedSet,
+                  DejaVuSansSet,
+                  ReportLabVeraSet,
+                  HelveticaSet)
+
+mono_font_sets = (LiberationMonoSet,
+                  DejaVuSansMonoSet,
+                  CourierSet)
+
+# The PDF standard fonts are never embedded into the output file.
+
+standard_sans_font_sets = (HelveticaSet,)
+
+standard_mono_font_sets = (CourierSet,)
+
+########################################################################
+
+# Process-wide registry of the font set which has won for a given
+# list of font sets. Probing for and parsing the TTF files happens
+# once per process, not once per render.
+
+_fontset_registry = {}
+_fontset_registry_lock = threading.Lock()
+
+def find_fontset(font_sets):
+    """Find first usable font set from font_sets and register its fonts"""
+    with _fontset_registry_lock:
+        if font_sets not in _fontset_registry:
+            for klass in font_sets:
+                try:
+                    _fontset_registry[font_sets] = klass()
+                    log.verbose("Using %s font set", klass.__name__)
+                    break
+                except FontNotFound as e:
+                    log.debug("Font set %s not found: %s", klass.__name__, e)
+            else:
+                raise InternalLogicError()
+        return _fontset_registry[font_sets]
+
+
 ########################################################################
 
 
 class ReportLabDriver(PageDriver):
 
-    """ReportLab driver with PDF output"""
-    # There might be more output formats in the future
+    """ReportLab driver with PDF, SVG and PNG output
+
+    All rendering goes into a single reportlab.graphics Drawing for
+    the page. The output formats are then just different
+    serializations of that Drawing.
+    """
 
 
     driver_name = 'reportlab'
-    driver_formats = ['pdf']
+    driver_formats = ['pdf', 'png', 'svg']
+
+    driver_options = {
+        'compress': (True, 'compress the PDF page content streams'),
+        'embed_fonts': (True, 'embed subsets of TrueType fonts instead '
+                        'of using the PDF standard fonts'),
+    }
+
+    png_dpi = 144
 
     def __init__(self, *args, **kwargs):
         super(ReportLabDriver, self).__init__(*args, **kwargs)
 
+    @classmethod
+    def warm_up(cls):
+        find_fontset(mono_font_sets)
+        find_fontset(sans_font_sets)
+        try:
+            get_renderPM()
+        except DriverError:
+            pass # reported when PNG output is requested
+
     def gen_outfile(self, outfile, output_format):
-        assert(output_format == 'pdf')
-        pdf = canvas.Canvas(outfile, pagesize=landscape(A4))
-        pdf.setCreator('%s %s' % (version.package_name, version.package_version))
-        pdf.setTitle(self._("Weight Calendar Grid"))
-        pdf.setSubject(self._("Draw one mark a day and graphically watch your weight"))
+        self.gen_outfiles([(outfile, output_format)])
+
+    def gen_outfiles(self, outputs):
+        """Write the page to a list of (outfile, output_format) pairs
+
+        The page layout and the Drawing are only generated once for all
+        of the outputs.
+        """
+        if 'png' in [output_format for outfile, output_format in outputs]:
+            get_renderPM() # fail before rendering anything
+        drawing = self.render_drawing()
+        for outfile, output_format in outputs:
+            self.write_drawing(drawing, outfile, output_format)
 
+    def render_drawing(self):
         self.load_fontset_mono()
         self.load_fontset_sans()
 
-        self.render(pdf)
-        pdf.save()
+        drawing = Drawing(self.page_width*mm, self.page_height*mm)
+        self.render(drawing)
+        return drawing
+
+    def write_drawing(self, drawing, outfile, output_format):
+        assert(output_format in self.driver_formats)
+        with trace.span('serialize', format=output_format):
+            sink = open_sink(outfile)
+            if output_format == 'pdf':
+                pdf = canvas.Canvas(sink, pagesize=(drawing.width, drawing.height),
+                                    pageCompression=int(self.options['compress']))
+                pdf.setCreator('%s %s' % (version.package_name, version.package_version))
+                pdf.setTitle(self._("Weight Calendar Grid"))
+                pdf.setSubject(self._("Draw one mark a day and graphically watch your weight"))
+                renderPDF.draw(drawing, pdf, 0, 0)
+                pdf.showPage()
+                pdf.save()
+            elif output_format == 'svg':
+                sink.write(renderSVG.drawToString(drawing).encode('utf-8'))
+            elif output_format == 'png':
+                get_renderPM().drawToFile(drawing, sink, fmt='PNG',
+                                          dpi=self.png_dpi)
+            else:
+                raise InternalLogicError()
+            sink.flush()
 
     def load_fontset_sans(self):
-        # Note that font_sets must contain one of the PDF standard
-        # fonts in the end, so that we can actually use some font even
-        # if we do not find any TTF files.
-        font_sets = [LiberationSansSet,
-                     LiberationSansNarrowSet,
-                     DejaVuSansCondensedSet,
-                     DejaVuSansSet,
-                     ReportLabVeraSet,
-                     HelveticaSet]
-        for klass in font_sets:
-            try:
-                font_set = klass()
-                self.fontname_regular    = font_set.regular
-                self.fontname_bold       = font_set.bold
-                self.fontname_italic     = font_set.italic
-                self.fontname_bolditalic = font_set.bolditalic
-                self.font_size           = font_set.size
-                assert(self.font_size)
-                assert(self.fontname_regular)
-                assert(self.fontname_bold)
-                assert(self.fontname_italic)
-                assert(self.fontname_bolditalic)
-                return
-            except FontNotFound:
-                pass
-        raise InternalLogicError()
+        if self.options['embed_fonts']:
+            font_set = find_fontset(sans_font_sets)
+        else:
+            font_set = find_fontset(standard_sans_font_sets)
+        self.fontname_regular    = font_set.regular
+        self.fontname_bold       = font_set.bold
+        self.fontname_italic     = font_set.italic
+        self.fontname_bolditalic = font_set.bolditalic
+        self.font_size           = font_set.size
+        assert(self.font_size)
+        assert(self.fontname_regular)
+        assert(self.fontname_bold)
+        assert(self.fontname_italic)
+        assert(self.fontname_bolditalic)
 
     def load_fontset_mono(self):
-        # Note that font_sets must contain one of the PDF standard
-        # fonts in the end, so that we can actually use some font even
-        # if we do not find any TTF files.
-        font_sets = [LiberationMonoSet,
-                     DejaVuSansMonoSet,
-                     CourierSet]
-        for klass in font_sets:
-            try:
-                font_set = klass()
-                self.fontname_mono_regular    = font_set.regular
-                self.fontname_mono_bold       = font_set.bold
-                self.fontname_mono_italic     = font_set.italic
-                self.fontname_mono_bolditalic = font_set.bolditalic
-                self.font_size_small          = font_set.size
-                assert(self.font_size_small)
-                assert(self.fontname_mono_regular)
-                assert(self.fontname_mono_bold)
-                assert(self.fontname_mono_italic)
-                assert(self.fontname_mono_bolditalic)
-                return
-            except FontNotFound:
-                pass
-        raise InternalLogicError()
+        if self.options['embed_fonts']:
+            font_set = find_fontset(mono_font_sets)
+        else:
+            font_set = find_fontset(standard_mono_font_sets)
+        self.fontname_mono_regular    = font_set.regular
+        self.fontname_mono_bold       = font_set.bold
+        self.fontname_mono_italic     = font_set.italic
+        self.fontname_mono_bolditalic = font_set.bolditalic
+        self.font_size_small          = font_set.size
+        assert(self.font_size_small)
+        assert(self.fontname_mono_regular)
+        assert(self.fontname_mono_bold)
+        assert(self.fontname_mono_italic)
+        assert(self.fontname_mono_bolditalic)
 
     def _get_y(self, kg):
         y0 = self.sep_south # self.page_height - self.sep_south
@@ -295,86 +406,89 @@ class ReportLabDriver(PageDriver):
     def _get_x(self, _day):
         return super(ReportLabDriver, self)._get_x(_day)*mm
 
-    def render_axis_bmi_begin(self, pdf):
+    def __fontname(self, bold):
+        if bold:
+            return self.fontname_bold
+        else:
+            return self.fontname_regular
+
+    def __line(self, grp, x1, y1, x2, y2, width, color=black, cap=0, dash=None):
+        grp.add(Line(x1, y1, x2, y2,
+                     strokeWidth=width, strokeColor=color,
+                     strokeLineCap=cap, strokeDashArray=dash))
+
+    def __string(self, grp, x, y, text, fontname, fontsize,
+                 color=black, anchor='start'):
+        grp.add(String(x, y, text, textAnchor=anchor,
+                       fontName=fontname, fontSize=fontsize,
+                       fillColor=color))
+
+    def __text_runs(self, grp, x, y, runs, color=black):
+        """Place (fontname, text) runs one after the other starting at x"""
+        for fontname, text in runs:
+            self.__string(grp, x, y, text, fontname, self.font_size, color)
+            x += pdfmetrics.stringWidth(text, fontname, self.font_size)
+        return x
+
+    def render_axis_bmi_begin(self, drawing):
         pass
 
-    def render_axis_bmi_end(self, pdf):
+    def render_axis_bmi_end(self, drawing):
         pass
 
-    def render_axis_bmi_tick(self, pdf, y, bmi, strbmi, p):
-        pdf.saveState()
+    def render_axis_bmi_tick(self, drawing, y, bmi, strbmi, p):
+        self.__line(drawing, p.begin_ofs*mm, y, (self.page_width-p.end_ofs)*mm, y,
+                    p.line_width, Color(*p.line_color), cap=1)
 
-        pdf.setLineWidth(p.line_width)
-        pdf.setLineCap(1)
-        pdf.setStrokeColorRGB(*p.line_color)
-        pdf.line(p.begin_ofs*mm, y, (self.page_width-p.end_ofs)*mm, y)
+        fontname = self.__fontname(p.font_bold)
+        font_color = Color(*p.font_color)
+        self.__string(drawing, (self.page_width - p.end_ofs + 0.5)*mm, y-1.25*mm,
+                      strbmi, fontname, self.font_size, font_color)
+        self.__string(drawing, (p.begin_ofs-0.5)*mm, y-1.25*mm,
+                      strbmi, fontname, self.font_size, font_color, anchor='end')
 
-        pdf.setFillColorRGB(*p.font_color)
-        if p.font_bold:
-            pdf.setFont(self.fontname_bold, self.font_size)
-        else:
-            pdf.setFont(self.fontname_regular, self.font_size)
-        pdf.drawString((self.page_width - p.end_ofs + 0.5)*mm, y-1.25*mm, strbmi)
-        pdf.drawRightString((p.begin_ofs-0.5)*mm, y-1.25*mm, strbmi)
-        pdf.restoreState()
-
-    def render_time_tick(self, pdf, style, date, label_str, id_str):
-        pdf.saveState()
+    def render_time_tick(self, drawing, style, date, label_str, id_str):
         x = self._get_x(date)
         south_ofs = style.begin_ofs
         north_ofs = style.end_ofs
-        pdf.setLineWidth(style.line_width)
-        pdf.setLineCap(1)
-        pdf.setStrokeColor(black)
-        pdf.line(x, north_ofs*mm, x, (self.page_height-south_ofs)*mm)
+        self.__line(drawing, x, north_ofs*mm, x, (self.page_height-south_ofs)*mm,
+                    style.line_width, cap=1)
 
         if style.do_label:
-            pdf.setFillColor(black)
-            if style.font_bold:
-                pdf.setFont(self.fontname_bold, self.font_size)
-            else:
-                pdf.setFont(self.fontname_regular, self.font_size)
-            pdf.drawCentredString(x, (style.end_ofs - 3.0)*mm, label_str)
-            pdf.drawCentredString(x, (self.page_height-style.begin_ofs+1.0)*mm, label_str)
-        pdf.restoreState()
-
-    def render_cmdline(self, pdf, sep_west, sep_south, cmdline):
-        pdf.saveState()
-        pdf.setFillColor(black)
-        pdf.setFont(self.fontname_mono_regular, self.font_size_small)
-        pdf.drawString(sep_west*mm, sep_south*mm, cmdline)
-        pdf.restoreState()
-
-    def render_initials(self, pdf):
-        pdf.saveState()
-        pdf.setFillColor(black)
-        pdf.setFont(self.fontname_regular, self.font_size)
-        pdf.drawString(7*mm, 7*mm, self.initials)
-        pdf.drawRightString((self.page_width-7)*mm, 7*mm, self.initials)
-        pdf.drawString(7*mm, (self.page_height-7)*mm-0.5*self.font_size, self.initials)
-        pdf.drawRightString((self.page_width-7)*mm,
-                            (self.page_height-7)*mm-0.5*self.font_size, self.initials)
-        pdf.restoreState()
-
-    def render_beginning(self, pdf):
+            fontname = self.__fontname(style.font_bold)
+            self.__string(drawing, x, (style.end_ofs - 3.0)*mm,
+                          label_str, fontname, self.font_size, anchor='middle')
+            self.__string(drawing, x, (self.page_height-style.begin_ofs+1.0)*mm,
+                          label_str, fontname, self.font_size, anchor='middle')
+
+    def render_cmdline(self, drawing, sep_west, sep_south, cmdline):
+        self.__string(drawing, sep_west*mm, sep_south*mm, cmdline,
+                      self.fontname_mono_regular, self.font_size_small)
+
+    def render_initials(self, drawing):
+        top_y = (self.page_height-7)*mm-0.5*self.font_size
+        for x, y, anchor in [(7*mm, 7*mm, 'start'),
+                             ((self.page_width-7)*mm, 7*mm, 'end'),
+                             (7*mm, top_y, 'start'),
+                             ((self.page_width-7)*mm, top_y, 'end')]:
+            self.__string(drawing, x, y, self.initials,
+                          self.fontname_regular, self.font_size, anchor=anchor)
+
+    def render_beginning(self, drawing):
         pass
 
-    def render_ending(self, pdf):
-        pdf.saveState()
+    def render_ending(self, drawing):
+        weight_runs = [(self.fontname_regular, self._("weight in ")),
+                       (self.fontname_bold, "kg")]
 
-        # Determine text width (can't use .stringWidth due to different fonts)
-        text = pdf.beginText()
-        text.setTextOrigin(0, 0)
-        text.setFont(self.fontname_regular, self.font_size)
-        text.textOut(self._("weight in "))
-        text.setFont(self.fontname_bold, self.font_size)
-        text.textOut("kg")
-        w = text.getX();
+        # Determine text width
+        w = self.__text_runs(Group(), 0, 0, weight_runs)
 
         # Determine em size
-        em = pdf.stringWidth('m', self.fontname_bold, self.font_size)
+        em = pdfmetrics.stringWidth('m', self.fontname_bold, self.font_size)
 
-        pdf.rotate(90)
+        rotated = Group()
+        rotated.rotate(90)
 
         # rotated coordinates
         if self.height:
@@ -386,136 +500,83 @@ class ReportLabDriver(PageDriver):
             ry_left = -self.sep_west*mm + 10*mm
             ry_right = self.sep_east*mm - self.page_width*mm - 10*mm - self.font_size
 
-        pdf.setFillColor(black)
-        text = pdf.beginText()
-        text.setTextOrigin(rx, ry_left)
-        text.setFont(self.fontname_regular, self.font_size)
-        text.textOut(self._("weight in "))
-        text.setFont(self.fontname_bold, self.font_size)
-        text.textOut("kg")
-        pdf.drawText(text)
-
-        text = pdf.beginText()
-        text.setTextOrigin(rx, ry_right)
-        text.setFont(self.fontname_regular, self.font_size)
-        text.textOut(self._("weight in "))
-        text.setFont(self.fontname_bold, self.font_size)
-        text.textOut("kg")
-        pdf.drawText(text)
+        self.__text_runs(rotated, rx, ry_left, weight_runs)
+        self.__text_runs(rotated, rx, ry_right, weight_runs)
 
         if self.height:
-            pdf.setFillColor(red)
-            text = pdf.beginText()
-            text.setTextOrigin(0.5*self.page_height*mm+5*mm, -7*mm)
-            text.setFont(self.fontname_bold, self.font_size)
-            text.textOut('BMI')
-            text.setFont(self.fontname_regular, self.font_size)
-            text.textOut(self._(" for height %.2fm") % self.height)
-            pdf.drawText(text)
-
-            text = pdf.beginText()
-            text.setTextOrigin(0.5*self.page_height*mm+5*mm, (5-self.page_width)*mm)
-            text.setFont(self.fontname_bold, self.font_size)
-            text.textOut('BMI')
-            text.setFont(self.fontname_regular, self.font_size)
-            text.textOut(self._(" for height %.2fm") % self.height)
-            pdf.drawText(text)
-
-        pdf.restoreState()
+            bmi_runs = [(self.fontname_bold, 'BMI'),
+                        (self.fontname_regular,
+                         self._(" for height %.2fm") % self.height)]
+            self.__text_runs(rotated, 0.5*self.page_height*mm+5*mm, -7*mm,
+                             bmi_runs, red)
+            self.__text_runs(rotated, 0.5*self.page_height*mm+5*mm,
+                             (5-self.page_width)*mm, bmi_runs, red)
+
+        drawing.add(rotated)
 
         if not self.history_mode: # print usage note
-            pdf.saveState()
             # TODO: Use platypus Flowables to add the marks to the text.
-            pdf.setFillColor(black)
-            textobject = pdf.beginText()
-            textobject.setTextOrigin(self.sep_west*mm, 7*mm)
-            textobject.setFont(self.fontname_bold, self.font_size)
-            # print(textobject.getCursor())
-            textobject.textOut(r"%s " % self._("Use:"))
-            textobject.setFont(self.fontname_regular, self.font_size)
-            # print(textobject.getCursor())
-            textobject.textOut(self._("Print this page. "
-                                 "Keep in accessible place with pen. "
-                                 "Mark one "))
-            # print(textobject.getCursor())
-            textobject.setFont(self.fontname_bold, self.font_size)
-            textobject.textOut('x')
-            textobject.setFont(self.fontname_regular, self.font_size)
-            textobject.textOut(self._(" every day. "
-                                 "Connect "))
-            # print(textobject.getCursor())
-            textobject.setFont(self.fontname_bold, self.font_size)
-            textobject.textOut('x-x')
-            textobject.setFont(self.fontname_regular, self.font_size)
-            textobject.textOut(self._(" to yesterday's mark. "
-                                 "Type marked values into computer as deemed useful."))
-            # print(textobject.getCursor())
-            pdf.drawText(textobject)
-            pdf.restoreState()
+            self.__text_runs(drawing, self.sep_west*mm, 7*mm, [
+                (self.fontname_bold, r"%s " % self._("Use:")),
+                (self.fontname_regular, self._("Print this page. "
+                                               "Keep in accessible place with pen. "
+                                               "Mark one ")),
+                (self.fontname_bold, 'x'),
+                (self.fontname_regular, self._(" every day. "
+                                               "Connect ")),
+                (self.fontname_bold, 'x-x'),
+                (self.fontname_regular, self._(" to yesterday's mark. "
+                                               "Type marked values into computer as deemed useful.")),
+            ])
 
     # TODO: Actually plot weight data
-    def render_plot_mark(self, pdf, point):
+    def render_plot_mark(self, drawing, point):
         (x, y) = point
-        pdf.saveState()
-        pdf.setStrokeColorRGB(*(self.plot_color))
-        pdf.setLineCap(1)
-        pdf.setLineWidth(self.plot_line_width)
-        pdf.line(x-self.mark_delta*mm, y-self.mark_delta*mm,
-                 x+self.mark_delta*mm, y+self.mark_delta*mm)
-        pdf.line(x-self.mark_delta*mm, y+self.mark_delta*mm,
-                 x+self.mark_delta*mm, y-self.mark_delta*mm)
-        pdf.restoreState()
+        md = self.mark_delta*mm
+        color = Color(*self.plot_color)
+        self.__line(drawing, x-md, y-md, x+md, y+md,
+                    self.plot_line_width, color, cap=1)
+        self.__line(drawing, x-md, y+md, x+md, y-md,
+                    self.plot_line_width, color, cap=1)
 
     # TODO: Actually plot weight data
-    def render_plot_mavg_segment(self, pdf, point1, point2, color):
+    def render_plot_mavg_segment(self, drawing, point1, point2, color):
         (x1, y1) = point1
         (x2, y2) = point2
-        pdf.saveState()
-        pdf.setLineWidth(2*self.plot_line_width)
-        pdf.setLineCap(1)
-        pdf.setStrokeColor(color)
-        pdf.line(x1, y1, x2, y2)
-        pdf.restoreState()
+        self.__line(drawing, x1, y1, x2, y2,
+                    2*self.plot_line_width, Color(*color), cap=1)
 
     # TODO: Actually plot weight data
-    def render_plot_point(self, pdf, point):
+    def render_plot_point(self, drawing, point):
         (x, y) = point
 
     # TODO: Actually plot weight data
-    def render_plot_stem(self, pdf, coords, color):
+    def render_plot_stem(self, drawing, coords, color):
         (x, y, ay) = coords
-        pdf.saveState()
-        pdf.setLineWidth(self.plot_line_width)
-        pdf.setLineCap(1)
-        pdf.setStrokeColor(color)
-        pdf.line(x, ay, x, y)
-        pdf.restoreState()
+        self.__line(drawing, x, ay, x, y,
+                    self.plot_line_width, Color(*color), cap=1)
 
     # TODO: Actually plot weight data
-    def render_plot_stem_point(self, pdf, point, color):
+    def render_plot_stem_point(self, drawing, point, color):
         (x, y) = point
-        pdf.saveState()
-        pdf.setFillColor(white)
-        pdf.setStrokeColor(color)
-        pdf.circle(x, y, self.plot_stem_point_radius*mm, stroke=1, fill=1)
-        pdf.restoreState()
-
-    def render_plot_value_line_begin(self, pdf, shorten_segments):
-        pdf.saveState()
+        drawing.add(Circle(x, y, self.plot_stem_point_radius*mm,
+                           fillColor=white, strokeColor=Color(*color),
+                           strokeWidth=1))
+
+    def render_plot_value_line_begin(self, drawing, shorten_segments):
         self.shorten_value_line_segments = shorten_segments
-        pdf.setStrokeColor(self.plot_color)
-        pdf.setLineWidth(self.plot_line_width)
-        pdf.setLineCap(1)
 
-    def render_plot_value_line_end(self, pdf):
-        pdf.restoreState()
+    def render_plot_value_line_end(self, drawing):
+        pass
 
-    def render_plot_value_line_segment(self, pdf, point1, point2, dashed=False):
+    def render_plot_value_line_segment(self, drawing, point1, point2, dashed=False):
         (x1, y1) = point1
         (x2, y2) = point2
-        pdf.saveState()
         if dashed:
-            pdf.setDash(1*mm, 1.5*mm)
+            dash = [1*mm, 1.5*mm]
+        else:
+            dash = None
+        color = Color(*self.plot_color)
         if self.shorten_value_line_segments:
             # shorten the line at start and finish
             dx, dy = x2-x1, y2-y1
@@ -523,12 +584,13 @@ class ReportLabDriver(PageDriver):
             f = self.plot_line_shorten/dr
             if f < 0.5:
                 sx, sy = f*dx*mm, f*dy*mm
-                pdf.line(x1+sx, y1+sy, x2-sx, y2-sy)
+                self.__line(drawing, x1+sx, y1+sy, x2-sx, y2-sy,
+                            self.plot_line_width, color, cap=1, dash=dash)
         else:
-            pdf.line(x1, y1, x2, y2)
-        pdf.restoreState()
+            self.__line(drawing, x1, y1, x2, y2,
+                        self.plot_line_width, color, cap=1, dash=dash)
 
-    def render_calendar_range(self, pdf, date_range, is_first_last,
+    def render_calendar_range(self, drawing, date_range, is_first_last,
                               level, label_str, p, north=False):
         (begin_date, end_date) = date_range
         (is_begin_first, is_end_last) = is_first_last
@@ -552,64 +614,50 @@ class ReportLabDriver(PageDriver):
             y0 = self.sep_south - yofs
         y0 = y0*mm
 
-        pdf.saveState()
-
-        pdf.setLineWidth(p.line_width)
-        pdf.setStrokeColorRGB(*(p.line_color))
+        line_color = Color(*(p.line_color))
 
         # line along the range
-        pdf.line(begin_x, y0, end_x, y0)
+        self.__line(drawing, begin_x, y0, end_x, y0, p.line_width, line_color)
 
         # arrow tip for beginning of range
         if is_begin_first:
-            pdf.line(begin_x, y0-1.2*mm, begin_x, y0+1.2*mm)
-        else:
-            pass
+            self.__line(drawing, begin_x, y0-1.2*mm, begin_x, y0+1.2*mm,
+                        p.line_width, line_color)
 
         # arrow tip for end of range
         if is_end_last:
-            pdf.line(end_x, y0-1.2*mm, end_x, y0+1.2*mm)
-        else:
-            pass
+            self.__line(drawing, end_x, y0-1.2*mm, end_x, y0+1.2*mm,
+                        p.line_width, line_color)
 
         if label_str:
-            if p.font_bold:
-                w = pdf.stringWidth(label_str, self.fontname_bold, self.font_size)
-                pdf.setFont(self.fontname_bold, self.font_size)
-            else:
-                w = pdf.stringWidth(label_str, self.fontname_regular, self.font_size)
-                pdf.setFont(self.fontname_regular, self.font_size)
+            fontname = self.__fontname(p.font_bold)
+            w = pdfmetrics.stringWidth(label_str, fontname, self.font_size)
 
             cx = 0.5*(begin_x+end_x)
             cy = y0-1.25*mm
-            pdf.setFillColor(white)
-            pdf.rect(cx-0.5*w-0.5*mm, cy-0.5*mm, w+2*0.5*mm,
-                     self.font_size, stroke=0, fill=1)
-            pdf.setFillColorRGB(*(p.font_color))
-            pdf.drawCentredString(cx, cy, label_str)
-        pdf.restoreState()
-
-    def render_axis_kg_begin(self, pdf):
+            drawing.add(Rect(cx-0.5*w-0.5*mm, cy-0.5*mm, w+2*0.5*mm,
+                             self.font_size,
+                             strokeColor=None, fillColor=white))
+            self.__string(drawing, cx, cy, label_str, fontname, self.font_size,
+                          Color(*(p.font_color)), anchor='middle')
+
+    def render_axis_kg_begin(self, drawing):
         pass
 
-    def render_axis_kg_tick(self, pdf, y, kg_str, p):
-        pdf.saveState()
-        pdf.setLineWidth(p.line_width)
-        pdf.setLineCap(1)
-        pdf.setStrokeColorRGB(*p.line_color)
-        pdf.line(p.begin_ofs*mm, y, (self.page_width-p.end_ofs)*mm, y)
+    def render_axis_kg_tick(self, drawing, y, kg_str, p):
+        self.__line(drawing, p.begin_ofs*mm, y, (self.page_width-p.end_ofs)*mm, y,
+                    p.line_width, Color(*p.line_color), cap=1)
 
         if p.do_label:
-            pdf.setFillColorRGB(*p.font_color)
-            if p.font_bold:
-                pdf.setFont(self.fontname_bold, self.font_size)
-            else:
-                pdf.setFont(self.fontname_regular, self.font_size)
-            pdf.drawString((self.page_width - p.end_ofs + 0.5)*mm, y-1.25*mm, kg_str)
-            pdf.drawRightString((p.begin_ofs-0.5)*mm, y-1.25*mm, kg_str)
-        pdf.restoreState()
-
-    def render_axis_kg_end(self, pdf):
+            fontname = self.__fontname(p.font_bold)
+            font_color = Color(*p.font_color)
+            self.__string(drawing, (self.page_width - p.end_ofs + 0.5)*mm, y-1.25*mm,
+                          kg_str, fontname, self.font_size, font_color)
+            self.__string(drawing, (p.begin_ofs-0.5)*mm, y-1.25*mm,
+                          kg_str, fontname, self.font_size, font_color,
+                          anchor='end')
+
+    def render_axis_kg_end(self, drawing):
         pass
 
 
@@ -7,114 +7,48 @@
 ########################################################################
 
 
-import os
-import re
-import subprocess
-import sys
-import tempfile
+import collections
+import shutil
 
 
 ########################################################################
 
 
-def __import_check():
-    for path in os.getenv('PATH').split(os.path.pathsep):
-        if os.path.exists(os.path.join(path, 'pdflatex')):
-            return True
+if not shutil.which('pdflatex'):
     raise ImportError('The TikZ driver requires pdflatex')
 
-__import_check()
-del __import_check
-
 
 ########################################################################
 
 
 from .basic import PageDriver
+from . import latex
 from .. import log
+from .. import trace
 
 
 ########################################################################
 
 
-def _latex_to_pdf(texstr, keep_tmp_on_error, outfile):
-
-    basename = 'weight-calendar-grid'
-
-    workdir = tempfile.mkdtemp(prefix='%s.' % basename, suffix='.wd')
-    log.debug("created workdir %s", workdir)
-
-    def cleanup_workdir():
-        for (dirpath, dirnames, filenames) in os.walk(workdir, topdown=False):
-            for f in filenames:
-                os.unlink(os.path.join(dirpath, f))
-        for d in dirnames:
-            os.rmdir(os.path.join(dirpath, d))
-        os.rmdir(workdir)
-        log.debug("cleaned up workdir %s", workdir)
-
-    texfname = os.path.join(workdir, '%s.tex' % basename)
-    with open(texfname, 'w') as texfile:
-        texfile.write(texstr)
-
-    def run_latex(stage, stages):
-        global stage_counter # hack
-        log.verbose("pdflatex run %d/%d for %s",
-                    stage, stages, outfile.name)
-        proc = subprocess.Popen(['pdflatex', basename],
-                                 cwd = workdir,
-                                 stdin=subprocess.DEVNULL,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.STDOUT,
-                                 shell=False)
-        # FIXME: Our caller wants to print the process output in case
-        #        of us raising an exception.
-        try:
-            outs, errs = proc.communicate(timeout=300)
-        except TimeoutExpired:
-            proc.kill()
-            outs, errs = proc.communicate()
-            raise
-        if proc.returncode != 0:
-            log.error("Error running pdflatex (retcode=%d). Aborting.",
-                      proc.returncode)
-            sys.exit(1)
-        return outs
-
-    try:
-        stage  = 1
-        stages = 2
-        while True:
-            tty_text = run_latex(stage, stages)
-            stage += 1
-            if stage > stages:
-                break
-    except:
-        sys.stdout.write(tty_text)
-        if not keep_tmp_on_error:
-            cleanup_workdir()
-            log.warn("To examine the workdir, run with '--keep' option.")
-        else:
-            log.warn("kept workdir %s", workdir)
-            log.warn("examine %s", texfname)
-            r = re.compile(r'^l\.(\d+) ', re.MULTILINE)
-            line_no = 0
-            try:
-                a = r.findall(tty_text)
-                if a:
-                    line_no = int(a[-1])
-                    print("%s:%d: hello emacs" % (texfname, line_no, ),
-                          file=sys.stderr)
-            except:
-                pass
-        raise # re-raise error while running pdflatex
-
-    with open(os.path.join(workdir, "%s.pdf" % basename), 'rb') as pdf_file:
-        pdf_data = pdf_file.read()
-    cleanup_workdir()
-
-    outfile.write(pdf_data)
-    outfile.close()
+def tikz_point(point):
+    """Format (x, y) in mm for use inside a page coords scope"""
+    return '(%.2f,%.2f)' % point
+
+
+def letter_index(i):
+    """Count a, b, ..., z, ba, bb, ..."""
+    letters = ''
+    while True:
+        letters = chr(ord('a') + i % 26) + letters
+        i //= 26
+        if not i:
+            return letters
+
+
+def axis_style_key(p):
+    """Key for the TikZ style of the axis parameters p"""
+    return (p.line_width, tuple(p.line_color),
+            p.font_bold, tuple(p.font_color), p.rotate_labels)
 
 
 ########################################################################
@@ -129,6 +63,18 @@ class TikZDriver(PageDriver):
     driver_name = 'tikz'
     driver_formats = ['pdf']
 
+    driver_options = {
+        'precompile': (True, 'load the LaTeX preamble from a format file '
+                       'cached in the user cache directory'),
+        'workdir_root': ('', 'directory to create the LaTeX work directories in '
+                         '(default: $XDG_RUNTIME_DIR or /dev/shm if available)'),
+        'server': (False, 'keep pdflatex processes with the precompiled '
+                   'format loaded waiting for the next document'),
+        'server_size': (latex.default_server_size,
+                        'number of waiting pdflatex processes per format '
+                        'with the server option'),
+    }
+
 
     def __init__(self, *args, **kwargs):
         super(TikZDriver, self).__init__(*args, **kwargs)
@@ -144,27 +90,39 @@ class TikZDriver(PageDriver):
 
     def gen_outfile(self, outfile, output_format):
         assert(output_format == 'pdf')
+        self.latex_job(outfile).run()
 
-        tex_lines = []
-        self.render(tex_lines)
 
-        for lines in tex_lines:
-            for line in lines.splitlines():
+    def latex_job(self, outfile):
+        """Render the page into a LaTeX job writing the PDF to outfile"""
+        preamble = self.latex_preamble()
+        if log.enabled(log.DATA):
+            for line in preamble.splitlines():
                 log.data(line)
 
-        tex_data = '\n'.join(tex_lines)
-        _latex_to_pdf(tex_data, self.keep_tmp_on_error,
-                      outfile)
+        with trace.span('serialize', format='tex'):
+            tex = latex.TexWriter()
+            tex.append(r'\begin{document}')
+            self.render(tex)
+            tex.append(r'\end{document}')
+        tex.log_data()
 
+        return latex.LatexJob(preamble, tex.getvalue(), outfile,
+                              keep_tmp_on_error=self.keep_tmp_on_error,
+                              precompile=self.options['precompile'],
+                              workdir_root=self.options['workdir_root'] or None,
+                              server=(latex.get_server(
+                                          self.options['server_size'])
+                                      if self.options['server'] else None))
 
-    def render_beginning(self, ctx):
-        d = dict(globals())
-        d['mark_delta'] = self.mark_delta
-        d['plot_line_shorten'] = self.plot_line_shorten
-        d['plot_line_width'] = self.plot_line_width
-        d['plot_mark_line_width'] = self.plot_mark_line_width
-        d['plot_point_line_width'] = 2* self.plot_mark_line_width
-        d['plot_stem_point_radius'] = self.plot_stem_point_radius
+
+    def latex_preamble(self):
+        """The static part of the LaTeX preamble
+
+        This only depends on the language, so it can be preloaded from
+        a precompiled format file.
+        """
+        d = {}
 
         # for e.g. German, babel_opt should translate to "english,ngerman"
         babel_opt   = self._("<language specific options to LaTeX babel package>")
@@ -172,7 +130,7 @@ class TikZDriver(PageDriver):
             babel_opt = 'english'
         d['babel_opt'] = babel_opt
 
-        ctx.append(r"""\documentclass[a4paper,10pt,landscape]{article}
+        return (r"""\documentclass[a4paper,10pt,landscape]{article}
 
 \usepackage[%(babel_opt)s]{babel}
 \usepackage[T1]{fontenc}
@@ -198,6 +156,21 @@ class TikZDriver(PageDriver):
 
 \def\TikZ{Ti\emph{k}Z}
 """ % d)
+
+
+    def render_beginning(self, ctx):
+        d = dict(globals())
+        d['mark_delta'] = self.mark_delta
+        d['plot_line_shorten'] = self.plot_line_shorten
+        d['plot_line_width'] = self.plot_line_width
+        d['plot_mark_line_width'] = self.plot_mark_line_width
+        d['plot_point_line_width'] = 2* self.plot_mark_line_width
+        d['plot_mavg_line_width'] = 2* self.plot_line_width
+        d['plot_stem_point_radius'] = self.plot_stem_point_radius
+
+        # Everything is defined inside the tikzpicture group, so that
+        # several pages with their own definitions can share a document.
+        ctx.append(r'\begin{tikzpicture}[remember picture, overlay, font=\sffamily]')
         ctx.append(r'\definecolor{plotlinecolor}{rgb}{%f, %f, %f}' % self.plot_color)
         ctx.append(r"""
 \tikzset{plot line/.style={draw=plotlinecolor,
@@ -217,20 +190,26 @@ class TikZDriver(PageDriver):
 \tikzset{plot point/.style={draw=plotlinecolor,
                            line cap=round,
                            line width=%(plot_point_line_width)fpt}}
+\tikzset{plot mavg/.style={draw=plotmavglinecolor,
+                           line cap=round,
+                           line width=%(plot_mavg_line_width)fpt}}
+\tikzset{plot stem/.style={draw=plotstemcolor,
+                           line cap=round,
+                           line width=%(plot_line_width)fpt}}
 \tikzset{every node/.style={}}
 
+%% local coordinate system in mm from the lower left page corner
+\tikzset{page coords/.style={shift={(current page.south west)},x=1mm,y=1mm}}
+
 \newcommand{\plotmark}[2]{%%
 \draw[plot mark,xshift=#1,yshift=#2]
    (-%(mark_delta)fmm,-%(mark_delta)fmm) -- (+%(mark_delta)fmm,+%(mark_delta)fmm)
    (-%(mark_delta)fmm,+%(mark_delta)fmm) -- (+%(mark_delta)fmm,-%(mark_delta)fmm);
 }
 
-\begin{document}
-
-\begin{tikzpicture}[remember picture, overlay, font=\sffamily]
-
 \begin{scope}[every node/.style={inner xsep=1.5pt}]
 """ % d)
+        self.__define_axis_styles(ctx)
 
 
     def render_ending(self, ctx):
@@ -341,9 +320,9 @@ class TikZDriver(PageDriver):
   \end{scope}
 \end{scope}""" % d)
 
-        d['weight_label_text'] = _(r'weight in %s') % r'\bfseries kg'
+        d['weight_label_text'] = self._(r'weight in %s') % r'\bfseries kg'
         if self.show_bmi: # label vertical axes
-            d['bmi_label_text']    = (_(r'%s for height %.2f\,m')
+            d['bmi_label_text']    = (self._(r'%s for height %.2f\,m')
                                       % (r'\textbf{BMI}', self.height))
             ctx.append(r"""
 %% axis labels
@@ -373,10 +352,19 @@ class TikZDriver(PageDriver):
         ctx.append(r"""
 \end{scope}
 \end{tikzpicture}
-\end{document}
 """ % d)
 
 
+    def render_plot_begin(self, ctx):
+        self.render_comment(ctx, 'plot')
+        ctx.append(r'\begin{scope}[page coords]')
+        self.defined_colors = {}
+
+
+    def render_plot_end(self, ctx):
+        ctx.append(r'\end{scope}')
+
+
     def render_plot_value_line_begin(self, ctx, shorten_segments):
         self.render_comment(ctx, 'plot line and points')
         if shorten_segments:
@@ -390,89 +378,44 @@ class TikZDriver(PageDriver):
 
 
     def render_plot_value_line_segment(self, ctx, point1, point2, dashed=False):
-        (x1, y1) = point1
-        (x2, y2) = point2
-        draw_style = {
-            False: '',
-            True:  'dash pattern=on 1mm off 1.5mm',
+        draw_cmd = {
+            False: r'\draw',
+            True:  r'\draw[dash pattern=on 1mm off 1.5mm]',
         }[dashed]
-        ctx.append('\\draw[%s] '
-                   '([xshift=%fmm,yshift=%fmm]current page.south west) -- '
-                   '([xshift=%fmm,yshift=%fmm]current page.south west)'
-                   ';' % (draw_style, x1, y1, x2, y2))
+        ctx.append('%s %s -- %s;' % (draw_cmd, tikz_point(point1),
+                                     tikz_point(point2)))
 
 
     def render_plot_stem_point(self, ctx, point, color):
-        (x, y) = point
-        d = { 'x': x,
-              'y': y,
-              }
-        ctx.append(r'\definecolor{plotmavglinecolor}{rgb}{%f, %f, %f}' % color)
-        ctx.append('\\path[plot stem point,draw=plotmavglinecolor] '
-                   '([xshift=%(x)fmm,yshift=%(y)fmm]current page.south west) '
-                   'circle'
-                   ';'
-                   % d)
+        self.__color(ctx, 'plotmavglinecolor', color)
+        ctx.append(r'\path[plot stem point,draw=plotmavglinecolor] %s circle;'
+                   % tikz_point(point))
 
 
     def render_plot_mavg_segment(self, ctx, point1, point2, color):
-        (x1, y1) = point1
-        (x2, y2) = point2
-        ctx.append(r'\definecolor{plotmavglinecolor}{rgb}{%f, %f, %f}' % color)
-        d = { 'x1': x1,
-              'y1': y1,
-              'x2': x2,
-              'y2': y2,
-              'lw': 2.0 * self.plot_line_width,
-              }
-        ctx.append(r'\draw[line width=%(lw)fpt,draw=plotmavglinecolor,line cap=round] '
-                   '([xshift=%(x1)fmm,yshift=%(y1)fmm]current page.south west) -- '
-                   '([xshift=%(x2)fmm,yshift=%(y2)fmm]current page.south west);'
-                   % d)
+        self.__color(ctx, 'plotmavglinecolor', color)
+        ctx.append(r'\draw[plot mavg] %s -- %s;' % (tikz_point(point1),
+                                                   tikz_point(point2)))
 
 
     def render_plot_stem(self, ctx, coords, color):
         (x, y, ay) = coords
-        d = { 'x': x,
-              'y': y,
-              'ay': ay,
-              'lw': self.plot_line_width,
-              }
-        ctx.append(r'\definecolor{plotstemcolor}{rgb}{%f, %f, %f}' % color)
-        ctx.append('\\draw[line width=%(lw)fpt,draw=plotstemcolor,line cap=round]'
-                   '([xshift=%(x)fmm,yshift=%(y)fmm]current page.south west) -- '
-                   '([xshift=%(x)fmm,yshift=%(ay)fmm]current page.south west)'
-                   ';'
-                   % d)
+        self.__color(ctx, 'plotstemcolor', color)
+        ctx.append(r'\draw[plot stem] %s -- %s;' % (tikz_point((x, y)),
+                                                   tikz_point((x, ay))))
 
 
     def render_plot_point(self, ctx, point):
-        (x, y) = point
-        d = { 'x': x,
-              'y': y,
-              }
-        ctx.append('\\draw[plot point]'
-                   '([xshift=%(x)fmm,yshift=%(y)fmm]current page.south west) -- '
-                   '([xshift=%(x)fmm,yshift=%(y)fmm]current page.south west)'
-                   ';'
-                   % d)
+        ctx.append(r'\draw[plot point] %s -- %s;' % (tikz_point(point),
+                                                    tikz_point(point)))
 
 
     def render_plot_mark(self, ctx, point):
         (x, y) = point
         md = self.mark_delta
-        d = { 'x1': x-md,
-              'x2': x+md,
-              'y1': y-md,
-              'y2': y+md,
-              }
-        ctx.append('\\draw[plot mark]'
-                   '([xshift=%(x1)fmm,yshift=%(y1)fmm]current page.south west) -- '
-                   '([xshift=%(x2)fmm,yshift=%(y2)fmm]current page.south west)'
-                   '([xshift=%(x2)fmm,yshift=%(y1)fmm]current page.south west) -- '
-                   '([xshift=%(x1)fmm,yshift=%(y2)fmm]current page.south west)'
-                   ';'
-                   % d)
+        ctx.append(r'\draw[plot mark] %s -- %s %s -- %s;'
+                   % (tikz_point((x-md, y-md)), tikz_point((x+md, y+md)),
+                      tikz_point((x+md, y-md)), tikz_point((x-md, y+md))))
 
 
     def render_comment(self, ctx, msg):
@@ -489,38 +432,102 @@ class TikZDriver(PageDriver):
         ctx.append('\\end{scope}\n')
 
 
-    def render_time_tick(self, ctx, style, date, label_str, id_str):
-        d = style
-        ctx.append('\definecolor{daylinecolor}{rgb}{%f, %f, %f}' % d.line_color)
-        ctx.append('\definecolor{daytextcolor}{rgb}{%f, %f, %f}' % d.font_color)
-        d['day_line_style'] = "line width=%fpt,draw=daylinecolor" % d.line_width
+    def __color(self, ctx, name, color):
+        """Define color name unless it already has that value in this scope"""
+        color = tuple(color)
+        if self.defined_colors.get(name) != color:
+            ctx.append(r'\definecolor{%s}{rgb}{%.3f, %.3f, %.3f}'
+                       % ((name,) + color))
+            self.defined_colors[name] = color
+
+
+    def __define_axis_styles(self, ctx):
+        """Define one pair of line and label styles per distinct axis style"""
+        self.axis_style_names = {}
+        axes = [('time', self.axis_time), ('kg', self.axis_kg)]
+        if self.show_bmi:
+            axes.append(('bmi', self.axis_bmi))
+        for kind, axis in axes:
+            params = [p for p in axis.styles.values() if p]
+            # e.g. TimeAxisMonths creates most of its styles on demand
+            default_factory = getattr(axis.styles, 'default_factory', None)
+            if default_factory:
+                params.append(default_factory())
+            for p in params:
+                key = (kind, axis_style_key(p))
+                if key in self.axis_style_names:
+                    continue
+                # xcolor wants plain letters in color names
+                name = kind + letter_index(len(self.axis_style_names))
+                self.axis_style_names[key] = name
+                d = {'name': name,
+                     'line_width': p.line_width,
+                     'rotate': '',
+                     'font': r'\sffamily'}
+                if p.rotate_labels:
+                    d['rotate'] = 'rotate=%d,' % p.rotate_labels
+                if p.font_bold:
+                    d['font'] = r'\sffamily\bfseries'
+                ctx.append(r'\definecolor{%sline}{rgb}{%.3f, %.3f, %.3f}'
+                           % ((name,) + tuple(p.line_color)))
+                ctx.append(r'\definecolor{%stext}{rgb}{%.3f, %.3f, %.3f}'
+                           % ((name,) + tuple(p.font_color)))
+                ctx.append(r'\tikzset{%(name)s line/.style={line width=%(line_width).2fpt,'
+                           r'draw=%(name)sline,line cap=round},' % d)
+                ctx.append(r'  %(name)s label/.style={%(rotate)stext=%(name)stext,'
+                           r'font=%(font)s}}' % d)
+
+
+    def __axis_style_name(self, kind, p):
+        return self.axis_style_names[(kind, axis_style_key(p))]
+
+
+    def render_time_begin(self, ctx):
+        ctx.append(r'\begin{scope}[page coords]')
+        self.defined_colors = {}
+        self.time_ticks = []
+
+
+    def render_time_end(self, ctx):
+        self.__flush_time_ticks(ctx)
+        ctx.append(r'\end{scope}')
 
-        if d.font_bold:
-            d['day_text_style'] = "rotate=%d,text=daytextcolor,font=\\sffamily\\bfseries" % style.rotate_labels
-        else:
-            d['day_text_style'] = "rotate=%d,text=daytextcolor,font=\\sffamily" % style.rotate_labels
-
-        x = self._get_x(date)
-        ctx.append('%% date %s' % id_str)
-        ctx.append('\\draw[%s,line cap=round] '
-                   '([xshift=%fmm,yshift=-%fmm]current page.north west)'
-                   ' -- '
-                   '([xshift=%fmm,yshift=%fmm]current page.south west)'
-                   ';' % (d.day_line_style, x, d.begin_ofs, x, d.end_ofs))
-        if d.do_label:
-            yshift = 2.0
-            ctx.append('\\node[%s] at '
-                       '([xshift=%fmm,yshift=-%fmm]current page.north west)'
-                       '{%s}'
-                       ';' % (d.day_text_style, x, d.begin_ofs-yshift, label_str))
-            ctx.append('\\node[%s] at '
-                       '([xshift=%fmm,yshift=+%fmm]current page.south west)'
-                       '{%s}'
-                       ';' % (d.day_text_style, x, d.end_ofs-yshift, label_str))
+
+    def render_time_tick(self, ctx, style, date, label_str, id_str):
+        # Buffer the ticks so that all ticks of one style can be drawn
+        # with a single \foreach loop.
+        name = self.__axis_style_name('time', style)
+        key = (name, style.do_label, style.begin_ofs, style.end_ofs)
+        self.time_ticks.append((key, self._get_x(date), label_str))
+
+
+    def __flush_time_ticks(self, ctx):
+        ticks = collections.OrderedDict()
+        for key, x, label_str in self.time_ticks:
+            ticks.setdefault(key, []).append((x, label_str))
+        self.time_ticks = []
+
+        for (name, do_label, begin_ofs, end_ofs), xl in ticks.items():
+            d = {'name': name,
+                 'top': self.page_height - begin_ofs,
+                 'bottom': end_ofs,
+                 'north_label': self.page_height - (begin_ofs - 2.0),
+                 'south_label': end_ofs - 2.0,
+                 'xs': ','.join('%.2f' % x for x, _l in xl),
+                 # braces keep a ',' or '/' in a label out of the list syntax
+                 'xls': ','.join('%.2f/{%s}' % (x, l) for x, l in xl),
+                 }
+            ctx.append(r'\draw[%(name)s line] \foreach \x in {%(xs)s}'
+                       r' {(\x,%(top).2f) -- (\x,%(bottom).2f)};' % d)
+            if do_label:
+                ctx.append(r'\foreach \x/\txt in {%(xls)s}'
+                           r' {\node[%(name)s label] at (\x,%(north_label).2f) {\txt};'
+                           r' \node[%(name)s label] at (\x,%(south_label).2f) {\txt};}'
+                           % d)
 
 
     def render_axis_bmi_begin(self, ctx):
-        ctx.append('\\begin{scope}[on background layer]')
+        ctx.append('\\begin{scope}[on background layer,page coords]')
 
 
     def render_axis_bmi_end(self, ctx):
@@ -528,55 +535,36 @@ class TikZDriver(PageDriver):
 
 
     def render_axis_bmi_tick(self, ctx, y, bmi, strbmi, p):
-        p['line_style'] = "line width=%fpt, draw=bmilinecolor, line cap=round" % p.line_width
-
-        if p.font_bold:
-            p['text_style'] = "text=bmitextcolor, font=\\sffamily\\bfseries"
-        else:
-            p['text_style'] = "text=bmitextcolor, font=\\sffamily"
-
-        ctx.append('\definecolor{bmilinecolor}{rgb}{%f, %f, %f}' % p.line_color)
-        ctx.append('\definecolor{bmitextcolor}{rgb}{%f, %f, %f}' % p.font_color)
-
-        p.y = y
-        p['bmil'] = strbmi.replace('.','_')
-        p['strbmi'] = strbmi
-        fs = ['%% BMI %(strbmi)s',
-              '\\draw[%(line_style)s]'
-              ' ([xshift=%(begin_ofs)fmm,yshift=%(y)fmm]current page.south west)'
-              ' -- ([xshift=-%(end_ofs)fmm,yshift=%(y)fmm]current page.south east);']
+        d = {'name': self.__axis_style_name('bmi', p),
+             'west': tikz_point((p.begin_ofs, y)),
+             'east': tikz_point((self.page_width - p.end_ofs, y)),
+             'bmil': strbmi.replace('.','_'),
+             'strbmi': strbmi,
+             }
+        ctx.append(r'\draw[%(name)s line] %(west)s -- %(east)s;' % d)
         if p.do_label:
-            fs.extend([
-                    '\\node[anchor=east,%(text_style)s] '
-                    'at ([xshift=%(begin_ofs)fmm,yshift=%(y)fmm]current page.south west)'
-                    ' (bmi label west %(bmil)s)'
-                    ' {%(strbmi)s};',
-                    '\\node[anchor=west,%(text_style)s]'
-                    ' at ([xshift=-%(end_ofs)fmm,yshift=%(y)fmm]current page.south east)'
-                    ' (bmi label east %(bmil)s)'
-                    ' {%(strbmi)s};',
-                    ''])
-            self.bmi_label_nodes.append('(bmi label west %(bmil)s)' % p)
-            self.bmi_label_nodes.append('(bmi label east %(bmil)s)' % p)
-        ctx.extend([s % p for s in fs])
+            ctx.append(r'\node[%(name)s label,anchor=east] at %(west)s'
+                       r' (bmi label west %(bmil)s) {%(strbmi)s};' % d)
+            ctx.append(r'\node[%(name)s label,anchor=west] at %(east)s'
+                       r' (bmi label east %(bmil)s) {%(strbmi)s};' % d)
+            self.bmi_label_nodes.append('(bmi label west %(bmil)s)' % d)
+            self.bmi_label_nodes.append('(bmi label east %(bmil)s)' % d)
 
 
     def render_calendar_range(self, ctx, date_range, is_first_last,
                               level, label_str, p, north=False):
 
-        # Caution: render_ticks_days() must be run earlier so that
-        #          nodes with lables will be available when referenced.
+        # Draw the pending day ticks first to keep the drawing order.
+        self.__flush_time_ticks(ctx)
 
         (begin_date, end_date) = date_range
         (begin_first, end_last) = is_first_last
         yofs = 2.0 + 1.5 + 3.5 * (level + 0)
 
         if north:
-            p.relnode = 'current page.north west'
-            p.yofs = - (self.sep_north - yofs)
+            y = self.page_height - (self.sep_north - yofs)
         else:
-            p.relnode = 'current page.south west'
-            p.yofs = + (self.sep_south - yofs)
+            y = self.sep_south - yofs
 
         ctx.append('%% level %d range %s from %s to %s'
                  % (level, label_str, begin_date, end_date))
@@ -588,33 +576,34 @@ class TikZDriver(PageDriver):
         else:
             dx2 = 0.0
 
-        # FIXME: Idea: Add locals() to p as another dict to look up stuff from?
-        p.begin_x = self._get_x(begin_date) - dx2
-        p.end_x   = self._get_x(end_date)   + dx2
-        p.label_str = label_str
-
         # TODO: Support unused line color, font bold, etc. pp.
         if begin_first: a1 = '|'
         else:           a1 = ''
         if end_last:    a2 = '|'
         else:           a2 = ''
-        p.arrows = '%s-%s' % (a1, a2)
+
+        d = {'line_width': p.line_width,
+             'arrows': '%s-%s' % (a1, a2),
+             'begin': tikz_point((self._get_x(begin_date) - dx2, y)),
+             'end': tikz_point((self._get_x(end_date) + dx2, y)),
+             'label_str': label_str,
+             }
 
         # print "Cal range %s (%s): %s to %s" % (label, yofs, first_day, last_day)
-        ctx.append('\definecolor{calrangelinecolor}{rgb}{%f, %f, %f}' % p.line_color)
-        ctx.append('\definecolor{calrangetextcolor}{rgb}{%f, %f, %f}' % p.font_color)
-        ctx.append('\\path[draw=calrangelinecolor, line width=%(line_width)fpt, '
-                   '       arrows=%(arrows)s, >=angle 90, line cap=round]'
-                   ' ([xshift=%(begin_x)fmm,yshift=%(yofs)fmm]%(relnode)s)'
-                   ' -- ([xshift=%(end_x)fmm,yshift=%(yofs)fmm]%(relnode)s)' % p)
+        self.__color(ctx, 'calrangelinecolor', p.line_color)
+        self.__color(ctx, 'calrangetextcolor', p.font_color)
+        ctx.append(r'\path[draw=calrangelinecolor,line width=%(line_width).2fpt,'
+                   r'arrows=%(arrows)s,>=angle 90,line cap=round]'
+                   r' %(begin)s -- %(end)s' % d)
         if label_str:
-            ctx.append('  node[midway,fill=white,inner xsep=1pt,inner ysep=0,text=calrangetextcolor] {%(label_str)s}' % p)
+            ctx.append(r'  node[midway,fill=white,inner xsep=1pt,inner ysep=0,'
+                       r'text=calrangetextcolor] {%(label_str)s}' % d)
         ctx.append(';')
 
 
     def render_axis_kg_begin(self, ctx):
         self.render_comment(ctx, 'kg axis lines')
-        ctx.append('\\begin{scope}[line cap=round]')
+        ctx.append('\\begin{scope}[line cap=round,page coords]')
 
 
     def render_axis_kg_end(self, ctx):
@@ -623,41 +612,20 @@ class TikZDriver(PageDriver):
 
 
     def render_axis_kg_tick(self, ctx, y, kg_str, p):
-        ctx.append('\definecolor{kglinecolor}{rgb}{%f, %f, %f}' % p.line_color)
-        ctx.append('\definecolor{kgtextcolor}{rgb}{%f, %f, %f}' % p.font_color)
-        p['line_style'] = "line width=%fpt,draw=kglinecolor" % p.line_width
-
-        if p.font_bold:
-            p['text_style'] = "text=kgtextcolor,font=\\sffamily\\bfseries"
-        else:
-            p['text_style'] = "text=kgtextcolor,font=\\sffamily"
-
-        p.y = y
-        p.kg_str = kg_str
-        p.kg_str_id = kg_str.replace('.', '_')
-
-        fs = ['%% %(kg_str)s kg',
-              '\\draw[%(line_style)s]'
-              ' ([xshift=%(begin_ofs)fmm,yshift=%(y)fmm]current page.south west)'
-              ' -- ([xshift=-%(end_ofs)fmm,yshift=%(y)fmm]current page.south east);',
-              ]
-        ctx.extend([ s % p for s in fs ])
-
+        d = {'name': self.__axis_style_name('kg', p),
+             'west': tikz_point((p.begin_ofs, y)),
+             'east': tikz_point((self.page_width - p.end_ofs, y)),
+             'kg_str': kg_str,
+             'kg_str_id': kg_str.replace('.', '_'),
+             }
+        ctx.append(r'\draw[%(name)s line] %(west)s -- %(east)s;' % d)
         if p.do_label:
-            fs = ['\\node[anchor=east,%(text_style)s]'
-                  ' at ([xshift=%(begin_ofs)fmm,yshift=%(y)fmm]current page.south west)'
-                  ' (kg label west %(kg_str_id)s)'
-                  ' {%(kg_str)s};',
-                  '\\node[anchor=west,%(text_style)s]'
-                  ' at ([xshift=-%(end_ofs)fmm,yshift=%(y)fmm]current page.south east)'
-                  ' (kg label east %(kg_str_id)s)'
-                  ' {%(kg_str)s};',
-                  ]
-            self.kg_label_nodes.append('(kg label west %(kg_str_id)s)' % p)
-            self.kg_label_nodes.append('(kg label east %(kg_str_id)s)' % p)
-            ctx.extend([ s % p for s in fs ])
-
-        ctx.append('')
+            ctx.append(r'\node[%(name)s label,anchor=east] at %(west)s'
+                       r' (kg label west %(kg_str_id)s) {%(kg_str)s};' % d)
+            ctx.append(r'\node[%(name)s label,anchor=west] at %(east)s'
+                       r' (kg label east %(kg_str_id)s) {%(kg_str)s};' % d)
+            self.kg_label_nodes.append('(kg label west %(kg_str_id)s)' % d)
+            self.kg_label_nodes.append('(kg label east %(kg_str_id)s)' % d)
 
 
     def render_initials(self, ctx):
@@ -677,7 +645,7 @@ class TikZDriver(PageDriver):
 
 
     def render_cmdline(self, ctx, sep_west, sep_south, cmdline):
-        cl = cmdline.replace('--', '-\/-')
+        cl = latex.escape_text(cmdline).replace('--', '-\/-')
         ctx.append(r'\node[anchor=base west,font=\ttfamily\scriptsize]'
                    r' at ([xshift=%fmm,yshift=%fmm]current page.south west)'
                    r' {%s};' % (sep_west, sep_south, cl))
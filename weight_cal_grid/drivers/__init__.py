@@ -3,8 +3,9 @@
 
 """Driver infrastructure for loading and finding drivers
 
-This module loads all drivers which can actually be loaded on this
-system.
+The driver modules, and with them the libraries they need, are only
+imported once a driver is looked up by name, or once all drivers are
+loaded for listing them.
 
 Afterwards, you can print the list of drivers or get the driver class
 you want.
@@ -14,9 +15,8 @@ you want.
 ########################################################################
 
 
-import datetime
+import collections
 import importlib
-import os
 import sys
 
 
@@ -24,14 +24,64 @@ import sys
 
 
 from .. import log as log
-from .basic import GenericDriver
+from .basic import GenericDriver, NoSuchDriverError, format_option_value
+
+
+########################################################################
+
+
+# Driver name and module for every driver, in the order of preference
+# for the default driver.
+driver_modules = collections.OrderedDict([
+    ('tikz',      'TikZ'),
+    ('cairo',     'Cairo'),
+    ('reportlab', 'ReportLab'),
+])
+
+
+########################################################################
+
+
+# Drivers whose module could not be imported, so that we only try once
+_failed_drivers = set()
+
+
+def load_driver(drv):
+    """Import the module of driver drv, returning whether that worked"""
+    if drv in GenericDriver.drivers:
+        return True
+    if drv not in driver_modules or drv in _failed_drivers:
+        return False
+    try:
+        importlib.import_module('.'.join([__name__, driver_modules[drv]]))
+    except ImportError as e:
+        log.debug(exc_info=True)
+        log.warn("Could not load %s driver: %s", repr(drv), e)
+        _failed_drivers.add(drv)
+        return False
+    return drv in GenericDriver.drivers
+
+
+def load_drivers():
+    """Load all drivers which can be loaded, returning the driver dict"""
+    for drv in driver_modules:
+        load_driver(drv)
+    return GenericDriver.drivers
 
 
 ########################################################################
 
 
 def get_driver(drv):
-    """Find driver class by name"""
+    """Find driver class by name, or the default driver for None"""
+    if drv is None:
+        for drv in driver_modules:
+            if load_driver(drv):
+                return GenericDriver.drivers[drv]
+        log.error("Error: No drivers found.")
+        sys.exit(13)
+    if not load_driver(drv):
+        raise NoSuchDriverError(drv)
     return GenericDriver.get_driver(drv)
 
 
@@ -43,6 +93,7 @@ def print_driver_list(outfile=None):
     if not outfile:
         outfile = sys.stdout
     print("List of output drivers:", file=outfile)
+    load_drivers()
     for drv in sorted(GenericDriver.drivers):
         print("   ", "driver", drv, file=outfile)
         formats = GenericDriver.drivers[drv].driver_formats
@@ -52,33 +103,11 @@ def print_driver_list(outfile=None):
                 print("   ", "   ", "format", fmt, '(driver default)', file=outfile)
             else:
                 print("   ", "   ", "format", fmt, file=outfile)
-
-
-########################################################################
-
-
-def __load_drivers():
-
-    # List all driver modules, in shell syntax: [A-Z]*.py
-    driver_module_list = [ os.path.splitext(fn)[0]
-                           for fn in os.listdir(os.path.dirname(__file__))
-                           if ((os.path.splitext(fn)[1] == '.py') and
-                               ('A' <= fn[0]) and (fn[0] <= 'Z')) ]
-    for driver_module_name in driver_module_list:
-        try:
-            importlib.import_module('.'.join([__name__, driver_module_name]), __name__)
-        except ImportError as e:
-            log.debug(exc_info=True)
-            log.warn("Could not load %s driver, looking for another driver",
-                     repr(driver_module_name))
-
-    if len(GenericDriver.drivers) == 0:
-        log.error("Error: No drivers found.")
-        sys.exit(13)
-
-
-__load_drivers()
-del __load_drivers
+        options = GenericDriver.drivers[drv].driver_options
+        for name in sorted(options):
+            default, descr = options[name]
+            print("   ", "   ", "option", '%s=%s' % (name, format_option_value(default)),
+                  '(%s)' % descr, file=outfile)
 
 
 ########################################################################
@@ -25,6 +25,7 @@ from abc import ABCMeta
 
 
 from .. import log
+from .. import trace
 from ..utils import (get_latest_first, get_next_first, get_latest_sunday,
                      InternalLogicError)
 
@@ -88,6 +89,22 @@ class NoSuchDriverError(Exception):
 ########################################################################
 
 
+class NoSuchDriverOptionError(Exception):
+    """The driver does not know the given driver option"""
+    pass
+
+
+########################################################################
+
+
+class DriverError(Exception):
+    """The driver has failed to generate its output"""
+    pass
+
+
+########################################################################
+
+
 class DriverMetaClass(ABCMeta):
 
     """Driver registry metaclass.
@@ -167,18 +184,48 @@ def is_last_day_of_year(date):
 ########################################################################
 
 
+def convert_option_value(default, value):
+    """Convert value (possibly a string) to the type of default"""
+    if not isinstance(value, str) or isinstance(default, str):
+        return value
+    if isinstance(default, bool):
+        if value.lower() in ('1', 'yes', 'true', 'on'):
+            return True
+        if value.lower() in ('0', 'no', 'false', 'off'):
+            return False
+        raise ValueError('invalid boolean option value %s' % repr(value))
+    return type(default)(value)
+
+
+def format_option_value(value):
+    """Format option value like convert_option_value() would read it"""
+    if isinstance(value, bool):
+        return {True: 'yes', False: 'no'}[value]
+    return str(value)
+
+
+########################################################################
+
+
 class GenericDriver(object, metaclass=DriverMetaClass):
 
     """Abstract base class for output drivers"""
 
 
+    # Driver specific options as {name: (default_value, description)}.
+    # Option values given as strings are converted to the type of the
+    # default value.
+    driver_options = {}
+
+
     def __init__(self, height, kg_range, date_range,
                  plot_points=None,
                  keep_tmp_on_error=False,
                  history_mode=False,
                  initials=None,
                  translation=None,
-                 cmdline=None):
+                 cmdline=None,
+                 driver_options=None):
 
         (min_kg, max_kg) = kg_range
         (begin_date, end_date) = date_range
@@ -204,11 +251,33 @@ class GenericDriver(object, metaclass=DriverMetaClass):
             self.plot_points = []
 
         self.keep_tmp_on_error = keep_tmp_on_error
-        self.translation = translation or gettext.NullTranslation()
+        self.translation = translation or gettext.NullTranslations()
+        # the message dict of DictTranslations, for lookups without gettext
+        self.messages = getattr(self.translation, 'messages', None)
         self.cmdline = cmdline
+        self.options = self.parse_driver_options(driver_options)
+
+    @classmethod
+    def parse_driver_options(cls, driver_options=None):
+        """Return the complete option dict with the given options applied"""
+        options = dict((k, v[0]) for k, v in cls.driver_options.items())
+        for name, value in (driver_options or {}).items():
+            if name not in cls.driver_options:
+                raise NoSuchDriverOptionError(
+                    'Driver %s has no option %s'
+                    % (repr(cls.driver_name), repr(name)))
+            options[name] = convert_option_value(options[name], value)
+        return options
+
+    @classmethod
+    def warm_up(cls):
+        """Load what rendering needs once per process (e.g. fonts)"""
+        pass
 
     def _(self, msg):
-        return self.translation.gettext(msg)
+        if self.messages is None:
+            return self.translation.gettext(msg)
+        return self.messages.get(msg, msg)
 
     def count_axes(self):
         self.fix_dimensions()
@@ -835,26 +904,31 @@ class Receiver(object):
         self.ctx = ctx
         self.range_style = range_style
 
+    # These run for every tick, so they avoid building log message
+    # arguments while DEBUG is off.
+
     def day_tick(self, style, date):
         # log.debug("Receiver.day_tick %s", date)
         self.obj.render_day_tick(self.ctx, style, date)
 
     def week_tick(self, style, date):
-        log.debug("Receiver.week_tick %s", date)
+        if log.enabled(log.DEBUG):
+            log.debug("Receiver.week_tick %s", date)
         self.obj.render_week_tick(self.ctx, style, date)
 
     def month_tick(self, style, date):
-        log.debug("Receiver.month_tick %s", date)
+        if log.enabled(log.DEBUG):
+            log.debug("Receiver.month_tick %s", date)
         self.obj.render_month_tick(self.ctx, style, date)
 
     def month_range(self, begin, end):
         log.debug("Receiver.month_range %s (from %s to %s)",
-                  begin.strftime('%Y-%m'), begin, end)
+                  log.lazy(begin.strftime, '%Y-%m'), begin, end)
         self.obj.render_month_range(self.ctx, self.range_style, begin, end)
 
     def year_range(self, begin, end):
         log.debug("Receiver.year_range %s (from %s to %s)",
-                  begin.strftime('%Y'), begin, end)
+                  log.lazy(begin.strftime, '%Y'), begin, end)
         self.obj.render_year_range(self.ctx, self.range_style, begin, end)
 
 
@@ -1078,21 +1152,27 @@ class PageDriver(GenericDriver):
 
 
     def render(self, ctx):
-        self.render_beginning(ctx)
+        with trace.span('render.beginning'):
+            self.render_beginning(ctx)
 
         if self.show_bmi:
-            self.__render_axis_bmi(ctx)
-        self.__render_axis_time(ctx)
-        self.__render_axis_kg(ctx)
-        self.__render_plot(ctx,
-                           ((self.end_date - self.begin_date).days < 250) )
+            with trace.span('render.axis_bmi'):
+                self.__render_axis_bmi(ctx)
+        with trace.span('render.axis_time'):
+            self.__render_axis_time(ctx)
+        with trace.span('render.axis_kg'):
+            self.__render_axis_kg(ctx)
+        with trace.span('render.plot'):
+            self.__render_plot(ctx,
+                               ((self.end_date - self.begin_date).days < 250) )
         if self.initials:
             self.render_initials(ctx)
 
         if self.cmdline:
             self.render_cmdline(ctx, self.sep_west, 5, self.cmdline)
 
-        self.render_ending(ctx)
+        with trace.span('render.ending'):
+            self.render_ending(ctx)
 
 
     @abstractmethod
@@ -1130,6 +1210,8 @@ class PageDriver(GenericDriver):
             else:
                 raise InternalLogicError()
 
+        self.render_plot_begin(ctx)
+
         stems = [
             ( avg_color(aq),
               self._get_x(day),
@@ -1188,6 +1270,15 @@ class PageDriver(GenericDriver):
                     p_day, p_x, p_y = day, x, y
             self.render_plot_value_line_end(ctx)
 
+        self.render_plot_end(ctx)
+
+
+    def render_plot_begin(self, ctx):
+        pass
+
+    def render_plot_end(self, ctx):
+        pass
+
 
     def render_plot_value_line_begin(self, ctx, shorten_segments):
         pass
@@ -1309,7 +1400,7 @@ class PageDriver(GenericDriver):
 
 
     def render_month_tick(self, ctx, style, date):
-        label_str = date.strftime("%b")[0]
+        label_str = self._(month_short_names[date.month])[0]
         self.time_tick_id_fmt = "%Y-%m"
         id_str = date.strftime(self.time_tick_id_fmt)
         self.render_time_tick(ctx, style, date, label_str, id_str)
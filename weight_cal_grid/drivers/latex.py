@@ -0,0 +1,714 @@
+########################################################################
+
+
+"""pdflatex helpers for the TikZ driver
+
+Loading the LaTeX preamble (babel, fonts, TikZ and its libraries)
+dominates the pdflatex run time. So we dump the preamble into a
+custom format file once, keep it in the user's cache directory, and
+have pdflatex start from that format on subsequent runs.
+
+Similarly, the .aux file from an earlier run of an identical document
+is cached so that a single pdflatex run suffices to resolve the page
+coordinates. Only .aux files which pdflatex left unchanged are cached,
+and only the most recently used max_cached_aux_files of them are kept.
+Failing to write to the cache never fails a document.
+
+For long running processes, a LatexServer keeps pdflatex processes
+waiting with the format already loaded, so that a document does not
+have to wait for pdflatex to start up.
+"""
+
+
+########################################################################
+
+
+import hashlib
+import io
+import multiprocessing.util
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+########################################################################
+
+
+from .basic import DriverError
+from .. import log
+from .. import trace
+from ..sink import open_sink
+from ..utils import get_cache_dir
+
+
+########################################################################
+
+
+format_subdir = 'latex-formats'
+aux_subdir = 'latex-aux'
+
+# Upper limit for pdflatex runs while waiting for the .aux file to settle
+max_latex_runs = 4
+
+# Number of .aux files kept in the cache, the least recently used go first
+max_cached_aux_files = 256
+
+_format_lock = threading.Lock()
+_pdflatex_version = None
+
+
+########################################################################
+
+
+def get_pdflatex_version():
+    """Get the pdflatex version banner, once per process"""
+    global _pdflatex_version
+    if _pdflatex_version is None:
+        proc = subprocess.run(['pdflatex', '--version'],
+                              stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL)
+        _pdflatex_version = proc.stdout.decode('utf-8', 'replace')
+    return _pdflatex_version
+
+
+def format_name(preamble):
+    """Name of the format for preamble and the installed pdflatex"""
+    h = hashlib.sha1()
+    h.update(get_pdflatex_version().encode('utf-8'))
+    h.update(preamble.encode('utf-8'))
+    return 'wcg-%s' % h.hexdigest()[:16]
+
+
+########################################################################
+
+
+def __dump_format(preamble, fmt_dir, fmt_name):
+    # Dump into a work directory inside fmt_dir, so that the finished
+    # format can be atomically moved into place for other processes.
+    workdir = tempfile.mkdtemp(prefix='%s.' % fmt_name, suffix='.wd',
+                               dir=fmt_dir)
+    try:
+        texfname = os.path.join(workdir, '%s.tex' % fmt_name)
+        with open(texfname, 'w') as texfile:
+            texfile.write(preamble)
+            texfile.write('\n\\dump\n')
+        with trace.span('pdflatex.dump_format'):
+            proc = subprocess.run(['pdflatex', '-ini',
+                                   '-jobname=%s' % fmt_name,
+                                   '&pdflatex', texfname],
+                                  cwd=workdir,
+                                  stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.STDOUT)
+        if proc.returncode != 0:
+            for line in proc.stdout.decode('utf-8', 'replace').splitlines():
+                log.debug(line)
+            log.warn("Could not dump LaTeX format (retcode=%d), "
+                     "loading the full preamble instead.", proc.returncode)
+            return False
+        os.replace(os.path.join(workdir, '%s.fmt' % fmt_name),
+                   os.path.join(fmt_dir, '%s.fmt' % fmt_name))
+        log.verbose("dumped LaTeX format %s", fmt_name)
+        return True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def get_format(preamble):
+    """Get (fmt_dir, fmt_name) of a format with preamble preloaded
+
+    The format is dumped on first use. Returns None if the format
+    cannot be dumped.
+    """
+    with _format_lock:
+        fmt_name = format_name(preamble)
+        try:
+            fmt_dir = get_cache_dir(format_subdir)
+            if os.path.exists(os.path.join(fmt_dir, '%s.fmt' % fmt_name)):
+                log.debug("using cached LaTeX format %s", fmt_name)
+            elif not __dump_format(preamble, fmt_dir, fmt_name):
+                return None
+        except EnvironmentError as e:
+            log.verbose("could not cache LaTeX format: %s", e)
+            return None
+        return (fmt_dir, fmt_name)
+
+
+def file_digest(fname):
+    """Get the SHA1 digest of the file contents, or None if missing"""
+    try:
+        with open(fname, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def aux_cache_fname(texstr):
+    """Cache file name for the .aux file resulting from texstr"""
+    h = hashlib.sha1()
+    h.update(get_pdflatex_version().encode('utf-8'))
+    h.update(texstr.encode('utf-8'))
+    return os.path.join(get_cache_dir(aux_subdir), '%s.aux' % h.hexdigest())
+
+
+def restore_aux(texstr, aux_fname):
+    """Copy a cached .aux file for texstr to aux_fname, if there is one"""
+    try:
+        cache_fname = aux_cache_fname(texstr)
+        shutil.copyfile(cache_fname, aux_fname)
+    except EnvironmentError:
+        return False
+    log.debug("restored cached .aux file for %s", aux_fname)
+    try:
+        # mark as recently used for prune_aux_cache()
+        os.utime(cache_fname)
+    except EnvironmentError:
+        pass
+    return True
+
+
+def store_aux(texstr, aux_fname):
+    """Store the stable .aux file aux_fname resulting from texstr
+
+    The cache is only an optimization, so failing to write it is
+    logged and otherwise ignored. Returns whether the file was stored.
+    """
+    tmp_fname = None
+    try:
+        cache_fname = aux_cache_fname(texstr)
+        fd, tmp_fname = tempfile.mkstemp(suffix='.tmp',
+                                         dir=os.path.dirname(cache_fname))
+        os.close(fd)
+        shutil.copyfile(aux_fname, tmp_fname)
+        os.replace(tmp_fname, cache_fname)
+    except EnvironmentError as e:
+        log.verbose("could not cache .aux file: %s", e)
+        if tmp_fname:
+            try:
+                os.unlink(tmp_fname)
+            except EnvironmentError:
+                pass
+        return False
+    prune_aux_cache(os.path.dirname(cache_fname))
+    return True
+
+
+def prune_aux_cache(cache_dir, max_files=None):
+    """Remove the least recently used .aux files beyond max_files"""
+    if max_files is None:
+        max_files = max_cached_aux_files
+    try:
+        entries = [entry for entry in os.scandir(cache_dir)
+                   if entry.name.endswith('.aux')]
+        if len(entries) <= max_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - max_files]:
+            os.unlink(entry.path)
+        log.debug("pruned %d cached .aux files",
+                  len(entries) - max_files)
+    except EnvironmentError as e:
+        # e.g. another process pruning at the same time
+        log.debug("could not prune .aux cache: %s", e)
+
+
+def pdflatex_command(fmt=None):
+    """Get (args, env) to run pdflatex, optionally with a cached format"""
+    if not fmt:
+        return (['pdflatex'], None)
+    fmt_dir, fmt_name = fmt
+    env = dict(os.environ)
+    # The trailing path separator keeps the default search path.
+    env['TEXFORMATS'] = os.pathsep.join([fmt_dir,
+                                         env.get('TEXFORMATS', '')])
+    return (['pdflatex', '-fmt=%s' % fmt_name], env)
+
+
+########################################################################
+
+
+def default_workdir_root():
+    """Get a RAM backed directory for the work directories, if any"""
+    for root in [os.environ.get('XDG_RUNTIME_DIR'), '/dev/shm']:
+        if root and os.path.isdir(root) and os.access(root, os.W_OK|os.X_OK):
+            return root
+    return None
+
+
+########################################################################
+
+
+tex_specials = {
+    '\\': r'\textbackslash{}',
+    '{': r'\{',
+    '}': r'\}',
+    '$': r'\$',
+    '&': r'\&',
+    '#': r'\#',
+    '%': r'\%',
+    '_': r'\_',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+}
+
+
+def escape_text(text):
+    """Escape the characters with a special meaning in TeX text mode"""
+    return re.sub(r'[\\{}$&#%_~^]', lambda m: tex_specials[m.group(0)], text)
+
+
+class TexWriter(io.StringIO):
+
+    """Collect generated TeX source in memory
+
+    Drivers render into anything with an append() method, so this
+    takes the place of a list of fragments without a final join.
+    """
+
+    def append(self, fragment):
+        self.write(fragment)
+        self.write('\n')
+
+    def log_data(self):
+        """Dump the TeX source, if DATA level messages are printed"""
+        if log.enabled(log.DATA):
+            for line in self.getvalue().splitlines():
+                log.data(line)
+
+
+########################################################################
+
+
+class WarmLatex(object):
+
+    """A pdflatex process which has loaded a format ahead of time
+
+    pdflatex loads the format before executing its first line, which
+    here waits for another line from stdin. Sending that line starts
+    the compilation of the document copied into the process' work
+    directory. Every process compiles a single document.
+    """
+
+    basename = 'weight-calendar-grid'
+
+    def __init__(self, fmt, workdir_root=None):
+        super(WarmLatex, self).__init__()
+        self.fmt = fmt
+        self.workdir = tempfile.mkdtemp(prefix='%s.' % self.basename,
+                                        suffix='.warm', dir=workdir_root)
+        latex_args, latex_env = pdflatex_command(fmt)
+        self.proc = subprocess.Popen(latex_args +
+                                     ['-jobname=%s' % self.basename,
+                                      r'\read-1to\wcgnext\wcgnext'],
+                                     cwd = self.workdir,
+                                     env = latex_env,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT,
+                                     shell=False)
+        log.debug("started warm pdflatex process %d", self.proc.pid)
+
+    def alive(self):
+        """Whether the process is still waiting for its document"""
+        return self.proc.poll() is None
+
+    def input_line(self, workdir):
+        """Copy the document from workdir, returning the line to send"""
+        for ext in ['tex', 'aux']:
+            fname = os.path.join(workdir, '%s.%s' % (self.basename, ext))
+            if os.path.exists(fname):
+                shutil.copy(fname, self.workdir)
+        return ('\\input %s.tex\n' % self.basename).encode('utf-8')
+
+    def copy_results(self, workdir):
+        """Copy the files written by pdflatex back to workdir"""
+        for ext in ['aux', 'log', 'pdf']:
+            fname = os.path.join(self.workdir, '%s.%s' % (self.basename, ext))
+            if os.path.exists(fname):
+                shutil.copy(fname, workdir)
+
+    def close(self):
+        """Kill the process if necessary and remove its work directory"""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        for pipe in [self.proc.stdin, self.proc.stdout]:
+            if not pipe.closed:
+                pipe.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+default_server_size = 2
+
+
+class LatexServer(object):
+
+    """Keep warm pdflatex processes ready to compile documents
+
+    For every format, up to size processes are started ahead of
+    time, and taking one out starts its replacement. Processes which
+    have died while waiting are discarded and replaced.
+
+    Processes are started and stopped outside of the server's lock,
+    so that jobs taking a process never wait for others to start.
+    """
+
+    def __init__(self, size=default_server_size, workdir_root=None):
+        super(LatexServer, self).__init__()
+        if size < 1:
+            raise ValueError('LaTeX server size must be at least 1, not %d'
+                             % size)
+        self.size = size
+        self.workdir_root = workdir_root or default_workdir_root()
+        self.__lock = threading.Lock()
+        self.__ready = {}
+        self.__starting = {}
+        # changed by close(), so that processes being started are not
+        # put into a pool which has been closed in the meantime
+        self.__generation = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __reserve(self, fmt):
+        """Count the processes to start for fmt, with the lock held"""
+        missing = (self.size - len(self.__ready.get(fmt, []))
+                   - self.__starting.get(fmt, 0))
+        if missing <= 0:
+            return 0
+        self.__starting[fmt] = self.__starting.get(fmt, 0) + missing
+        return missing
+
+    def __start(self, fmt, count, generation):
+        """Start count processes reserved for fmt, without the lock"""
+        started = []
+        try:
+            for i in range(count):
+                started.append(WarmLatex(fmt, self.workdir_root))
+        finally:
+            with self.__lock:
+                self.__starting[fmt] -= count
+                if generation == self.__generation:
+                    self.__ready.setdefault(fmt, []).extend(started)
+                    started = []
+            for warm in started:
+                warm.close()
+
+    def prepare(self, fmt):
+        """Start the processes for fmt without waiting for a document"""
+        with self.__lock:
+            count = self.__reserve(fmt)
+            generation = self.__generation
+        self.__start(fmt, count, generation)
+
+    def acquire(self, fmt):
+        """Take a warm process for fmt out of the pool"""
+        dead = []
+        with self.__lock:
+            ready = self.__ready.setdefault(fmt, [])
+            warm = None
+            while ready and not warm:
+                warm = ready.pop(0)
+                if not warm.alive():
+                    dead.append(warm)
+                    warm = None
+            count = self.__reserve(fmt)
+            generation = self.__generation
+        for died in dead:
+            log.warn("warm pdflatex process %d died (retcode=%d), "
+                     "replacing it", died.proc.pid, died.proc.returncode)
+            died.close()
+        if not warm:
+            warm = WarmLatex(fmt, self.workdir_root)
+        self.__start(fmt, count, generation)
+        return warm
+
+    def resize(self, size):
+        """Keep size processes per format, stopping any beyond that"""
+        if size < 1:
+            raise ValueError('LaTeX server size must be at least 1, not %d'
+                             % size)
+        surplus = []
+        with self.__lock:
+            self.size = size
+            for ready in self.__ready.values():
+                while len(ready) > size:
+                    surplus.append(ready.pop())
+        for warm in surplus:
+            warm.close()
+
+    def close(self):
+        """Stop all waiting processes"""
+        with self.__lock:
+            ready_lists = list(self.__ready.values())
+            self.__ready = {}
+            self.__generation += 1
+        for ready in ready_lists:
+            for warm in ready:
+                warm.close()
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_server(size=default_server_size):
+    """Get the LatexServer shared by the jobs of this process
+
+    The server keeps size processes per format from now on. Its
+    processes and their work directories are cleaned up when the
+    process exits, including the worker processes of a process pool,
+    which do not run atexit handlers.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = LatexServer(size)
+            multiprocessing.util.Finalize(None, _server.close,
+                                          exitpriority=0)
+        elif _server.size != size:
+            _server.resize(size)
+        return _server
+
+
+########################################################################
+
+
+def parse_latex_output(tty_text):
+    """Find the first error message and its line number in pdflatex output
+
+    Returns (error, line), with None for what could not be found.
+    """
+    m = re.search(r'^! (.*)$', tty_text, re.MULTILINE)
+    if not m:
+        return (None, None)
+    error = m.group(1)
+    m = re.compile(r'^l\.(\d+) ', re.MULTILINE).search(tty_text, m.end())
+    if not m:
+        return (error, None)
+    return (error, int(m.group(1)))
+
+
+class LatexResult(object):
+
+    """Outcome of compiling a LaTeX document
+
+    returncode is None if pdflatex has been killed after a timeout.
+    duration is in seconds, for all runs of pdflatex together.
+    """
+
+    def __init__(self, returncode, tty_text, duration, runs=1):
+        super(LatexResult, self).__init__()
+        self.returncode = returncode
+        self.tty_text = tty_text
+        self.duration = duration
+        self.runs = runs
+        self.error, self.error_line = parse_latex_output(tty_text)
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def __str__(self):
+        if self.returncode is None:
+            status = 'timed out'
+        else:
+            status = 'retcode=%d' % self.returncode
+        s = 'pdflatex %s after %.1fs' % (status, self.duration)
+        if self.error:
+            s = '%s: %s' % (s, self.error)
+            if self.error_line:
+                s = '%s (line %d)' % (s, self.error_line)
+        return s
+
+
+########################################################################
+
+
+class LatexError(DriverError):
+
+    """Running pdflatex has failed
+
+    The LatexResult of the failed run is in the result attribute.
+    """
+
+    def __init__(self, result, name=None):
+        super(LatexError, self).__init__(
+            '%s: %s' % (name, result) if name else str(result))
+        self.result = result
+
+
+########################################################################
+
+
+class LatexJob(object):
+
+    """Compile one LaTeX document in its own work directory
+
+    The resulting PDF is written to outfile.
+
+    The work directory is created in workdir_root, which defaults to
+    default_workdir_root() and then to the system's temp directory.
+
+    With a LatexServer, the pdflatex runs use its warm processes
+    whenever the preamble has been precompiled into a format.
+    """
+
+    basename = 'weight-calendar-grid'
+
+    def __init__(self, preamble, body, outfile,
+                 keep_tmp_on_error=False, precompile=True, timeout=300,
+                 workdir_root=None, server=None):
+        super(LatexJob, self).__init__()
+        self.preamble = preamble
+        self.body = body
+        self.outfile = outfile
+        self.keep_tmp_on_error = keep_tmp_on_error
+        self.precompile = precompile
+        self.timeout = timeout
+        self.workdir_root = workdir_root or default_workdir_root()
+        self.server = server
+
+    @property
+    def name(self):
+        return getattr(self.outfile, 'name', '<stream>')
+
+    def __run_latex(self, workdir, latex_args, latex_env, stage, fmt):
+        log.verbose("pdflatex run %d (of at most %d) for %s",
+                    stage, max_latex_runs, self.name)
+        warm = None
+        if self.server and fmt:
+            warm = self.server.acquire(fmt)
+            proc = warm.proc
+            stdin_data = warm.input_line(workdir)
+        else:
+            proc = subprocess.Popen(latex_args + [self.basename],
+                                    cwd = workdir,
+                                    env = latex_env,
+                                    stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    shell=False)
+            stdin_data = None
+        t0 = time.monotonic()
+        timed_out = False
+        try:
+            outs, errs = proc.communicate(stdin_data, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            outs, errs = proc.communicate()
+            timed_out = True
+        finally:
+            if warm:
+                warm.copy_results(workdir)
+                warm.close()
+        result = LatexResult(None if timed_out else proc.returncode,
+                             outs.decode('utf-8', 'replace'),
+                             time.monotonic() - t0, stage)
+        if not result.ok:
+            raise LatexError(result, self.name)
+        return result
+
+    def run(self):
+        """Run pdflatex as often as needed and write the PDF to outfile
+
+        Returns the LatexResult of the last pdflatex run, with the
+        number of runs and their total duration. Raises LatexError if
+        pdflatex fails or times out.
+        """
+        t0 = time.monotonic()
+        fmt = None
+        if self.precompile:
+            fmt = get_format(self.preamble)
+        if fmt:
+            texstr = '%% preamble preloaded from format %s\n%s' % (fmt[1],
+                                                                    self.body)
+        else:
+            texstr = '\n'.join([self.preamble, self.body])
+        latex_args, latex_env = pdflatex_command(fmt)
+
+        workdir = tempfile.mkdtemp(prefix='%s.' % self.basename, suffix='.wd',
+                                   dir=self.workdir_root)
+        log.debug("created workdir %s", workdir)
+
+        def cleanup_workdir():
+            shutil.rmtree(workdir)
+            log.debug("cleaned up workdir %s", workdir)
+
+        texfname = os.path.join(workdir, '%s.tex' % self.basename)
+        with open(texfname, 'w') as texfile:
+            texfile.write(texstr)
+
+        # The remember picture and current page coordinates are only
+        # known after pdflatex has written them into the .aux file. Run
+        # pdflatex until the .aux file stops changing. A cached .aux file
+        # from an identical earlier run makes the first run the last one.
+        auxfname = os.path.join(workdir, '%s.aux' % self.basename)
+        aux_restored = restore_aux(texstr, auxfname)
+        aux_stable = False
+
+        try:
+            stage  = 1
+            aux_digest = file_digest(auxfname)
+            while True:
+                with trace.span('pdflatex', job=self.name, run=stage,
+                                warm=bool(self.server and fmt)):
+                    result = self.__run_latex(workdir, latex_args, latex_env,
+                                              stage, fmt)
+                new_aux_digest = file_digest(auxfname)
+                if new_aux_digest == aux_digest:
+                    log.verbose(".aux file stable after %d pdflatex run(s)",
+                                stage)
+                    aux_stable = True
+                    break
+                if stage >= max_latex_runs:
+                    log.warn(".aux file still changing after %d pdflatex runs",
+                             stage)
+                    break
+                aux_digest = new_aux_digest
+                stage += 1
+        except BaseException as e:
+            error_line = None
+            if isinstance(e, LatexError):
+                for line in e.result.tty_text.splitlines():
+                    log.verbose(line)
+                error_line = e.result.error_line
+            if not self.keep_tmp_on_error:
+                cleanup_workdir()
+                log.warn("To examine the workdir, run with '--keep' option.")
+            else:
+                log.warn("kept workdir %s", workdir)
+                log.warn("examine %s", texfname)
+                if error_line:
+                    print("%s:%d: hello emacs" % (texfname, error_line, ),
+                          file=sys.stderr)
+            raise # re-raise error while running pdflatex
+
+        # Only cache an .aux file which pdflatex left unchanged, and
+        # which is not the very file restored from the cache.
+        if aux_stable and aux_digest is not None and \
+           not (aux_restored and stage == 1):
+            store_aux(texstr, auxfname)
+
+        sink = open_sink(self.outfile)
+        with open(os.path.join(workdir, "%s.pdf" % self.basename),
+                  'rb') as pdf_file:
+            sink.copy_from(pdf_file)
+        cleanup_workdir()
+        sink.flush()
+
+        result.runs = stage
+        result.duration = time.monotonic() - t0
+        return result
+
+
+########################################################################
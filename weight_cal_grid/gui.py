@@ -23,7 +23,7 @@ from pprint import pprint
 
 from .      import generate_grid
 from .utils import get_earliest_sunday, get_latest_sunday
-from .      import drivers
+from .drivers import Cairo
 from .      import version
 from .i18n  import install_translation
 from .utils import InternalLogicError
@@ -172,7 +172,7 @@ class WeightGrid(Gtk.DrawingArea):
             return
 
         # set up scaling
-        drv = drivers.Cairo.CairoDriver
+        drv = Cairo.CairoDriver
         width  = self.get_allocated_width()
         height = self.get_allocated_height()
 
@@ -189,8 +189,8 @@ class WeightGrid(Gtk.DrawingArea):
             (self.user_weight_lo, self.user_weight_hi),
             (self.begin_date, self.end_date),
             infile=None, # open('ndim.dat', 'r'),
-            driver_cls=drivers.Cairo.CairoDriver,
-            output_format=drivers.Cairo.CairoOutputFormat.name,
+            driver_cls=Cairo.CairoDriver,
+            output_format=Cairo.CairoOutputFormat.name,
             outfile=cr,
             keep_tmp_on_error=False,
             history_mode=False,
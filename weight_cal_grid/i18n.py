@@ -8,8 +8,11 @@ i18n related utility functions
 
 import locale
 import gettext
+import io
 import os
+import struct
 import sys
+import threading
 from os.path import abspath, dirname, join
 
 ########################################################################
@@ -39,36 +42,118 @@ def print_language_list(outfile=None):
 
 ########################################################################
 
+class NoSuchTranslationError(Exception):
+    """There is no translation catalog for the language"""
+    pass
+
+########################################################################
+
+def mo_message_ids(data, charset=None):
+    """List the message ids in the contents of a .mo file
+
+    The layout of .mo files is documented in the GNU gettext manual.
+    Plural entries appear as msgid1 NUL msgid2.
+    """
+    for fmt in ['<I', '>I']:
+        if struct.unpack(fmt, data[:4])[0] == 0x950412de:
+            break
+    else:
+        raise OSError('bad magic number in .mo file')
+    count, ids_offset = struct.unpack(fmt[0] + '2I', data[8:16])
+    ids = []
+    for i in range(count):
+        length, offset = struct.unpack(fmt[0] + '2I',
+                                       data[ids_offset+8*i:ids_offset+8*i+8])
+        ids.append(data[offset:offset+length].decode(charset or 'ascii'))
+    return ids
+
+class DictTranslations(gettext.NullTranslations):
+
+    """Translations looked up in a plain dict read from a .mo file
+
+    The dict maps every message id of the catalog to its translation,
+    so that looking up a message is a single dict lookup. Plural forms
+    can be given under (message id, index) keys. For a .mo file, the
+    dict is filled through GNUTranslations.gettext(), and plural forms
+    are left to the GNUTranslations as the fallback.
+    """
+
+    def __init__(self, messages=None, plural=None):
+        super(DictTranslations, self).__init__()
+        self.messages = messages or {}
+        self.plural = plural or (lambda n: int(n != 1))
+
+    @classmethod
+    def read(cls, fp):
+        data = fp.read()
+        gnu = gettext.GNUTranslations(io.BytesIO(data))
+        messages = dict((msgid, gnu.gettext(msgid))
+                        for msgid in mo_message_ids(data, gnu.charset())
+                        if msgid and '\x00' not in msgid)
+        translations = cls(messages)
+        translations.add_fallback(gnu)
+        return translations
+
+    def gettext(self, message):
+        try:
+            return self.messages[message]
+        except KeyError:
+            return super(DictTranslations, self).gettext(message)
+
+    def ngettext(self, msgid1, msgid2, n):
+        try:
+            return self.messages[(msgid1, self.plural(n))]
+        except KeyError:
+            return super(DictTranslations, self).ngettext(msgid1, msgid2, n)
+
+########################################################################
+
+# The translations never touch the process wide locale, so that grids
+# in different languages can be generated concurrently. All text in
+# the output comes from the translation object.
+
+locale_dir = join(abspath(dirname(__file__)), 'locale')
+
 def load_translation(lang=None):
     if lang == None or lang == default_language:
-        locale.setlocale(locale.LC_ALL, '')
         log.warn('Using NULL translation')
-        return gettext.NullTranslations()
-
-    for l in (locale.LC_ALL, locale.LC_MESSAGES, locale.LC_TIME):
-        locale.setlocale(l, languages[lang][1])
+        return DictTranslations()
 
-    locale_dir = join(abspath(dirname(__file__)), 'locale')
-    log.debug('Looking for lang %s in %s', repr(lang), locale_dir)
+    mo_fname = join(locale_dir, lang, 'LC_MESSAGES', '%s.mo' % text_domain)
+    log.debug('Loading lang %s from %s', repr(lang), mo_fname)
     try:
-        t = gettext.translation(text_domain, locale_dir,
-                                    [languages[lang][1], lang])
-        log.debug("Found %s translation in %s", repr(lang), locale_dir)
-        return t
+        with open(mo_fname, 'rb') as mo_file:
+            return DictTranslations.read(mo_file)
     except FileNotFoundError as e:
-        log.error("Could not find translation for %s. I tried the following:",
-                 repr(lang))
-        log.error("    %s", locale_dir)
-        sys.exit(1)
+        raise NoSuchTranslationError(
+            'Could not find translation for %s in %s'
+            % (repr(lang), locale_dir))
 
 ########################################################################
 
 __trans_cache = {}
+__trans_lock = threading.Lock()
 
 def get_translation(lang=None):
-    if lang not in __trans_cache:
-        __trans_cache[lang] = load_translation(lang)
-    return __trans_cache[lang]
+    with __trans_lock:
+        if lang not in __trans_cache:
+            __trans_cache[lang] = load_translation(lang)
+        return __trans_cache[lang]
+
+def preload_translations(langs=None):
+    """Load the translations for langs (default: all) into the cache
+
+    Returns the languages which have been loaded. The others are
+    reported and skipped.
+    """
+    loaded = []
+    for lang in (langs or sorted(languages)):
+        try:
+            get_translation(lang)
+            loaded.append(lang)
+        except NoSuchTranslationError as e:
+            log.warn('%s', e)
+    return loaded
 
 ########################################################################
 
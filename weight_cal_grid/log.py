@@ -13,8 +13,13 @@ much less error prone in use.
 
 ########################################################################
 
+import atexit
+import contextlib
+import contextvars
 import os
 import sys
+import threading
+import time
 import traceback
 
 ########################################################################
@@ -39,97 +44,326 @@ outfile = sys.stderr
 ########################################################################
 
 try:
-    # Two variants possible: For make -j processing with PID, and without.
-    # No way to distinguish between the cases, so always print the PID.
-    try:
-        _prog = os.path.basename(sys.argv[0])
-    except:
-        _prog = 'wcg-unknown'
-    prog = "%s(%d)" % (_prog, os.getpid())
-    del _prog
-except ImportError:
-    prog = None
+    prog_name = os.path.basename(sys.argv[0])
+except:
+    prog_name = 'wcg-unknown'
+
+def get_prog(pid=None):
+    """Program name and PID (default: the current one) for log lines
+
+    Two variants possible: For make -j processing with PID, and without.
+    No way to distinguish between the cases, so always print the PID.
+    The PID is looked up every time, as worker processes log, too.
+    """
+    return "%s(%d)" % (prog_name, pid or os.getpid())
 
 ########################################################################
 
-def log(lvl, msg, *args, **kwargs):
+def enabled(lvl):
+    """Whether messages at level lvl are currently printed
+
+    Check this before building expensive log message arguments, e.g.
+
+        if log.enabled(log.DEBUG):
+            log.debug('%s', expensive())
+    """
+    return ((level != None) and (level >= lvl)) or (startup_level >= lvl)
+
+########################################################################
 
-    """Generic logging function"""
+class LazyValue(object):
 
-    if ((level != None) and (level >= lvl)) or (startup_level >= lvl):
+    """Log message argument computed only when the message is printed"""
 
-        if 'exc_info' in kwargs:
-            exc_info = kwargs['exc_info']
-            if not isinstance(exc_info, tuple):
-                exc_info = sys.exc_info()
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+    def __repr__(self):
+        return repr(self.func(*self.args))
+
+def lazy(func, *args):
+    """Defer func(*args) until a %s or %r in the message needs it"""
+    return LazyValue(func, args)
+
+########################################################################
+
+level_names = {
+    DATA:    'data',
+    DEBUG:   'debug',
+    VERBOSE: 'verbose',
+    INFO:    'info',
+    QUIET:   'quiet',
+    WARN:    'warn',
+    ERROR:   'error',
+    }
 
+########################################################################
+
+_context = contextvars.ContextVar('wcg_log_context', default={})
+
+@contextlib.contextmanager
+def context(**fields):
+
+    """Add fields to all records logged inside the with block
+
+    The fields nest, and follow the current thread or asyncio task,
+    e.g. for the job number and driver while running a batch job.
+    Only structured sinks show them.
+    """
+
+    token = _context.set(dict(_context.get(), **fields))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+def get_context():
+    """The fields of the innermost context() block"""
+    return _context.get()
+
+########################################################################
+
+class TextSink(object):
+
+    """Print records as text lines to the module's outfile"""
+
+    catmsg = {
+        DATA:    'DATA:  ',
+        DEBUG:   'DEBUG: ',
+        VERBOSE: 'VERB:  ',
+        INFO:    'INFO:  ',
+        QUIET:   'QUIET: ',
+        WARN:    'WARN:  ',
+        ERROR:   'ERROR: ',
+        }
+
+    def emit(self, lvl, message, exc_info, extra):
+        if exc_info:
             traceback.print_exception(
                 exc_info[0], exc_info[1], exc_info[2],
                 None, sys.stderr)
+        if message:
+            print("%s: %s%s" % (get_prog(), self.catmsg[lvl], message),
+                  file=outfile)
 
-        if msg:
-            p = {}
+    def flush(self):
+        pass
 
-            if args:
-                p['message'] = msg % args
-            else:
-                p['message'] = msg
+########################################################################
+
+class JSONLinesSink(object):
+
+    """Write records as JSON objects, one per line
+
+    Each record has the keys ts, level, prog, pid and msg, an exc
+    traceback if there is one, and the fields from context() and
+    extra.  Lines are buffered, and written when buffer_size records
+    have accumulated, at WARN and ERROR records, and on flush(), which
+    happens at exit and in set_sink() for the current sink.  Without a
+    stream, the records go to the module's outfile.
+    """
+
+    def __init__(self, stream=None, buffer_size=64):
+        super(JSONLinesSink, self).__init__()
+        import json
+        self.dumps = json.dumps
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.lock = threading.Lock()
+
+    def after_fork(self):
+        # a forked worker must not write its parent's records again
+        self.buffer = []
+        self.lock = threading.Lock()
+
+    def record(self, lvl, message, exc_info, extra):
+        pid = os.getpid()
+        rec = {'ts': round(time.time(), 6),
+               'level': level_names[lvl],
+               'prog': get_prog(pid),
+               'pid': pid,
+               'msg': message}
+        if exc_info:
+            rec['exc'] = ''.join(traceback.format_exception(*exc_info))
+        rec.update(_context.get())
+        if extra:
+            rec.update(extra)
+        return rec
+
+    def emit(self, lvl, message, exc_info, extra):
+        line = self.dumps(self.record(lvl, message, exc_info, extra),
+                          default=str, ensure_ascii=False)
+        with self.lock:
+            self.buffer.append(line)
+            if lvl > WARN and len(self.buffer) < self.buffer_size:
+                return
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            lines = '\n'.join(self.buffer) + '\n'
+            del self.buffer[:]
+        stream = self.stream or outfile
+        stream.write(lines)
+        stream.flush()
+
+########################################################################
+
+class LoggingSink(object):
+
+    """Pass records on to a logger of Python's stock 'logging' module
+
+    The fields from context() and extra become attributes of the
+    logging.LogRecord, prefixed with wcg_ where they would clash with
+    the record's own attributes.  The level mapping keeps the order of
+    levels.
+    """
+
+    def __init__(self, logger='weight_cal_grid'):
+        super(LoggingSink, self).__init__()
+        import logging
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.reserved = set(vars(logging.makeLogRecord({})))
+        self.reserved.update(['message', 'asctime'])
+        self.levels = {
+            DATA:    logging.DEBUG - 5,
+            DEBUG:   logging.DEBUG,
+            VERBOSE: logging.INFO - 5,
+            INFO:    logging.INFO,
+            QUIET:   logging.INFO + 5,
+            WARN:    logging.WARNING,
+            ERROR:   logging.ERROR,
+            }
+
+    def emit(self, lvl, message, exc_info, extra):
+        fields = dict(_context.get())
+        if extra:
+            fields.update(extra)
+        for key in self.reserved.intersection(fields):
+            fields['wcg_' + key] = fields.pop(key)
+        self.logger.log(self.levels[lvl], '%s', message or '',
+                        exc_info=exc_info, extra=fields)
+
+    def flush(self):
+        for handler in self.logger.handlers:
+            handler.flush()
+
+########################################################################
+
+sink = TextSink()
+
+def set_sink(new_sink):
+    """Send all further records to new_sink, returning the old sink"""
+    global sink
+    old_sink, sink = sink, new_sink
+    old_sink.flush()
+    return old_sink
+
+def _flush_sink():
+    sink.flush()
+
+def _sink_after_fork():
+    after_fork = getattr(sink, 'after_fork', None)
+    if after_fork:
+        after_fork()
+
+# Registered once for whichever sink is current, not for every sink.
+atexit.register(_flush_sink)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_sink_after_fork)
+
+########################################################################
+
+def log(lvl, msg, *args, **kwargs):
+
+    """Generic logging function
+
+    The message is formatted and handed to the current sink only if
+    lvl is enabled.  Keyword arguments are exc_info (True or an
+    exception tuple) and extra, a dict of fields for structured sinks.
+    """
+
+    if enabled(lvl):
+        _emit(lvl, msg, args, kwargs)
 
-            p['prog'] = prog
+def _emit(lvl, msg, args, kwargs):
+    """Format the message and hand it to the sink, whatever lvl is"""
 
-            p['catmsg'] = {
-                DATA:    'DATA:  ',
-                DEBUG:   'DEBUG: ',
-                VERBOSE: 'VERB:  ',
-                INFO:    'INFO:  ',
-                QUIET:   'QUIET: ',
-                WARN:    'WARN:  ',
-                ERROR:   'ERROR: ',
-                }[lvl]
+    exc_info = None
+    if 'exc_info' in kwargs:
+        exc_info = kwargs['exc_info']
+        if not isinstance(exc_info, tuple):
+            exc_info = sys.exc_info()
 
-            print("%(prog)s: %(catmsg)s%(message)s" % p, file=outfile)
+    if msg and args:
+        message = msg % args
+    else:
+        message = msg
+
+    sink.emit(lvl, message, exc_info, kwargs.get('extra'))
 
 ########################################################################
 
+# The level functions compare the levels themselves instead of calling
+# enabled() and log(), so that a disabled call is a single function call.
+
 def data(msg=None, *args, **kwargs):
     """Log message at DATA level"""
-    log(DATA, msg, *args, **kwargs)
+    if (level != None and level >= DATA) or startup_level >= DATA:
+        _emit(DATA, msg, args, kwargs)
 
 ########################################################################
 
 def debug(msg=None, *args, **kwargs):
     """Log message at DEBUG level"""
-    log(DEBUG, msg, *args, **kwargs)
+    if (level != None and level >= DEBUG) or startup_level >= DEBUG:
+        _emit(DEBUG, msg, args, kwargs)
 
 ########################################################################
 
 def verbose(msg=None, *args, **kwargs):
     """Log message at VERBOSE level"""
-    log(VERBOSE, msg, *args, **kwargs)
+    if (level != None and level >= VERBOSE) or startup_level >= VERBOSE:
+        _emit(VERBOSE, msg, args, kwargs)
 
 ########################################################################
 
 def info(msg=None, *args, **kwargs):
     """Log message at INFO level"""
-    log(INFO, msg, *args, **kwargs)
+    if (level != None and level >= INFO) or startup_level >= INFO:
+        _emit(INFO, msg, args, kwargs)
 
 ########################################################################
 
 def quiet(msg=None, *args, **kwargs):
     """Log message at QUIET level"""
-    log(QUIET, msg, *args, **kwargs)
+    if (level != None and level >= QUIET) or startup_level >= QUIET:
+        _emit(QUIET, msg, args, kwargs)
 
 ########################################################################
 
 def warn(msg=None, *args, **kwargs):
     """Log message at WARN level"""
-    log(WARN, msg, *args, **kwargs)
+    if (level != None and level >= WARN) or startup_level >= WARN:
+        _emit(WARN, msg, args, kwargs)
 
 ########################################################################
 
 def error(msg=None, *args, **kwargs):
     """Log message at ERROR level"""
-    log(ERROR, msg, *args, **kwargs)
+    if (level != None and level >= ERROR) or startup_level >= ERROR:
+        _emit(ERROR, msg, args, kwargs)
 
 ########################################################################
 
@@ -180,3 +414,22 @@ if env_name in os.environ:
         sys.exit(2)
 
 ########################################################################
+
+format_env_name = 'WCG_LOG_FORMAT'
+
+if os.environ.get(format_env_name):
+    format_map = {'text':    TextSink,
+                  'json':    JSONLinesSink,
+                  'logging': LoggingSink,
+    }
+    env_value = os.environ[format_env_name]
+    if env_value in format_map:
+        sink = format_map[env_value]()
+    else:
+        error('Invalid value for %s OS environment variable: %s',
+              format_env_name, repr(env_value))
+        error('%s must be one of: %s', format_env_name,
+              ' '.join(sorted(format_map)))
+        sys.exit(2)
+
+########################################################################
@@ -0,0 +1,398 @@
+########################################################################
+
+
+"""Asyncio HTTP server generating weight calendar grids
+
+The server takes the same query parameters as the WSGI application in
+weight_cal_grid.wsgi, and only needs the asyncio streams from the
+standard library:
+
+    python3 -m weight_cal_grid.server --port 8000 --workers 4
+
+The grids are rendered in a pool of worker processes, each of which
+loads the drivers and translations once when it starts. Concurrent
+requests for the same grid (same canonical parameters) share a single
+rendering. Requests waiting for a worker go into a bounded queue, and
+when that is full, the server answers 503 with a Retry-After header
+instead of piling up more work.
+
+Every response carries a Server-Timing header with the latencies of
+the parse, wait (in the queue), layout and render stages. GET /_stats
+returns request counts and the mean stage latencies as JSON, including
+the encode stage (building and writing the response).
+"""
+
+
+########################################################################
+
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+
+########################################################################
+
+
+from . import drivers
+from . import log
+from . import wsgi
+from .version import package_name
+
+
+########################################################################
+
+
+stages = ['parse', 'wait', 'layout', 'render', 'encode']
+
+
+status_reasons = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    }
+
+
+class ServerBusy(Exception):
+    """The render queue is full"""
+    pass
+
+
+########################################################################
+
+
+def init_worker(langs, log_level):
+    """Set up a worker process for rendering GridRequests"""
+    log.level = log_level
+    wsgi.make_app(langs)
+
+
+def render_request(request):
+    """Render request in a worker, returning (body, stage timings)"""
+    timings = {}
+    body = request.render(timings)
+    return body, timings
+
+
+########################################################################
+
+
+def parse_request_head(head):
+    """Parse the request line and headers of an HTTP request
+
+    Returns (method, target, version, headers) with the header names
+    in lower case. Raises ValueError for a malformed request.
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ')
+    if not version.startswith('HTTP/1.'):
+        raise ValueError('unsupported protocol %s' % version)
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise ValueError('malformed header line %s' % repr(line))
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def format_server_timing(timings):
+    """Format stage timings in seconds as a Server-Timing header value"""
+    return ', '.join('%s;dur=%.1f' % (stage, 1000.0 * timings[stage])
+                     for stage in stages if stage in timings)
+
+
+def text_response(status, text, headers=()):
+    return (status,
+            [('Content-Type', 'text/plain; charset=utf-8')] + list(headers),
+            text.encode('utf-8'))
+
+
+########################################################################
+
+
+class GridServer(object):
+
+    """HTTP server rendering grids in a pool of workers
+
+    At most max_queue distinct renderings wait for one of the
+    max_workers workers at any time. Without an executor, the workers
+    are processes.
+    """
+
+    def __init__(self, max_workers=None, max_queue=None, langs=None,
+                 executor=None):
+        super(GridServer, self).__init__()
+        self.max_workers = max_workers or os.cpu_count()
+        if max_queue is None:
+            max_queue = 4 * self.max_workers
+        assert(max_queue > 0)
+        self.app = wsgi.make_app(langs)
+        if executor is None:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                self.max_workers, initializer=init_worker,
+                initargs=(langs, log.level))
+        self.executor = executor
+        self.queue = asyncio.Queue(max_queue)
+        self.in_flight = {}
+        self.dispatchers = []
+        self.server = None
+        self.stats = collections.Counter()
+        self.stage_totals = collections.Counter()
+
+    async def start(self, host='localhost', port=0):
+        """Start serving, returning the asyncio server"""
+        self.start_dispatch()
+        self.server = await asyncio.start_server(self.handle_connection,
+                                                 host, port)
+        return self.server
+
+    def start_dispatch(self):
+        """Start the tasks handing queued renderings to the workers"""
+        if not self.dispatchers:
+            self.dispatchers = [asyncio.ensure_future(self.dispatch())
+                                for i in range(self.max_workers)]
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.dispatchers = []
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def render(self, request):
+        """Get (body, timings) for request
+
+        A rendering of the same grid already queued or running is
+        shared. Raises ServerBusy if the queue is full.
+        """
+        key = request.canonical()
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((request, future, time.perf_counter()))
+            except asyncio.QueueFull:
+                self.stats['busy'] += 1
+                raise ServerBusy()
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self.in_flight.pop(key, None))
+        # one client going away must not cancel the shared rendering
+        return await asyncio.shield(future)
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request, future, t_queued = await self.queue.get()
+            wait = time.perf_counter() - t_queued
+            try:
+                body, timings = await loop.run_in_executor(
+                    self.executor, render_request, request)
+                timings['wait'] = wait
+                self.stats['renders'] += 1
+                future.set_result((body, timings))
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one (keep-alive) connection"""
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    break
+                keep_alive = await self.handle_request(head, writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, head, writer):
+        """Answer one request, returning whether to keep the connection"""
+        t0 = time.perf_counter()
+        try:
+            method, target, version, headers = parse_request_head(head)
+        except ValueError as e:
+            method, target = '-', '-'
+            status, out_headers, body = text_response(
+                400, 'malformed request: %s\n' % e)
+            timings = {}
+            keep_alive = False
+        else:
+            connection = headers.get('connection', '').lower()
+            keep_alive = (connection != 'close' if version == 'HTTP/1.1'
+                          else connection == 'keep-alive')
+            # we never read request bodies, so we cannot go on after one
+            if headers.get('content-length', '0') != '0' or \
+               'transfer-encoding' in headers:
+                keep_alive = False
+            try:
+                status, out_headers, body, timings = await self.respond(
+                    method, target, headers, t0)
+            except Exception:
+                log.error('server: %s %s failed', method, target,
+                          exc_info=True)
+                status, out_headers, body = text_response(
+                    500, 'internal server error\n')
+                timings = {}
+
+        t1 = time.perf_counter()
+        out_headers.append(('Content-Length', str(len(body))))
+        out_headers.append(('Server-Timing', format_server_timing(timings)))
+        if not keep_alive:
+            out_headers.append(('Connection', 'close'))
+        lines = ['HTTP/1.1 %d %s' % (status, status_reasons[status])]
+        lines.extend('%s: %s' % header for header in out_headers)
+        lines.extend(['', ''])
+        writer.write('\r\n'.join(lines).encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(body)
+        await writer.drain()
+        timings['encode'] = time.perf_counter() - t1
+
+        self.record(status, timings)
+        if log.enabled(log.VERBOSE):
+            timings_ms = dict((stage, round(1000.0 * timings[stage], 3))
+                              for stage in stages if stage in timings)
+            log.verbose('server: %s %s %d %s', method, target, status,
+                        ' '.join('%s=%.1fms' % (stage, timings_ms[stage])
+                                 for stage in stages if stage in timings_ms),
+                        extra={'method': method, 'target': target,
+                               'status': status, 'bytes': len(body),
+                               'timings_ms': timings_ms})
+        return keep_alive
+
+    async def respond(self, method, target, headers, t0):
+        """Get (status, headers, body, timings) for a request"""
+        timings = {}
+        if method not in ('GET', 'HEAD'):
+            return text_response(405, 'method %s not allowed\n' % method,
+                                 [('Allow', 'GET, HEAD')]) + (timings,)
+        path, sep, query = target.partition('?')
+        if path == '/_stats':
+            body = json.dumps(self.get_stats(), indent=2, sort_keys=True)
+            return (200, [('Content-Type', 'application/json')],
+                    body.encode('utf-8'), timings)
+        if path != '/':
+            return text_response(404, 'no such path %s\n' % path) + (timings,)
+
+        try:
+            request = self.app.parse_request(query)
+        except wsgi.BadRequest as e:
+            return text_response(400, '%s\n' % e) + (timings,)
+        timings['parse'] = time.perf_counter() - t0
+
+        etag = request.etag()
+        out_headers = [('ETag', etag),
+                       ('Cache-Control', 'public, max-age=86400')]
+        if wsgi.etag_matches(etag, headers.get('if-none-match')):
+            return 304, out_headers, b'', timings
+
+        try:
+            body, render_timings = await self.render(request)
+        except ServerBusy:
+            return text_response(503, 'render queue full, try again\n',
+                                 [('Retry-After', '1')]) + (timings,)
+        except drivers.basic.DriverError as e:
+            log.error('server: %s: %s', request.canonical(), e)
+            return text_response(500, 'failed to generate the grid\n') + \
+                (timings,)
+        timings.update(render_timings)
+
+        fname = '%s.%s' % (package_name, request.output_format)
+        out_headers.extend([
+            ('Content-Type', wsgi.content_types[request.output_format]),
+            ('Content-Disposition', 'inline; filename="%s"' % fname),
+            ])
+        return 200, out_headers, body, timings
+
+    def record(self, status, timings):
+        self.stats['requests'] += 1
+        self.stats['status %d' % status] += 1
+        for stage, duration in timings.items():
+            self.stage_totals[stage] += duration
+            self.stats['timed %s' % stage] += 1
+
+    def get_stats(self):
+        """Request counts and mean stage latencies in ms"""
+        stats = dict(self.stats)
+        stats['queued'] = self.queue.qsize()
+        stats['in flight'] = len(self.in_flight)
+        stats['mean ms'] = dict(
+            (stage, round(1000.0 * self.stage_totals[stage] /
+                          self.stats['timed %s' % stage], 3))
+            for stage in stages if self.stats['timed %s' % stage])
+        return stats
+
+
+########################################################################
+
+
+async def serve(args):
+    grid_server = GridServer(args.workers, args.queue)
+    async with grid_server:
+        server = await grid_server.start(args.host, args.port)
+        for sock in server.sockets:
+            log.info('serving on http://%s:%d/', *sock.getsockname()[:2])
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='serve weight calendar grids over HTTP')
+    parser.add_argument('--host', default='localhost',
+                        help='host name or address to bind to '
+                        '(default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='port to listen on (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help='number of render worker processes '
+                        '(default: number of CPUs)')
+    parser.add_argument('--queue', type=int, default=None, metavar='N',
+                        help='number of renderings which may wait for a '
+                        'worker before requests get a 503 '
+                        '(default: 4 per worker)')
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+########################################################################
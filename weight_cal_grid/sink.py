@@ -0,0 +1,136 @@
+########################################################################
+
+
+"""Streaming output sinks for the output drivers
+
+The drivers write their output into an OutputSink. A sink only ever
+writes to the wrapped file object. It never seeks, tells or reads
+back, so the same code path serves regular files, <stdout>, pipes
+and sockets with bounded memory.
+"""
+
+
+########################################################################
+
+
+import os
+import shutil
+
+
+########################################################################
+
+
+from . import log
+
+
+########################################################################
+
+
+# Chunk size for copying data from intermediate files into a sink
+chunk_size = 64 * 1024
+
+
+########################################################################
+
+
+class OutputSink(object):
+
+
+    """Write-only byte stream wrapped around a file-like object"""
+
+
+    def __init__(self, fileobj, close_fileobj=False):
+        super(OutputSink, self).__init__()
+        self._fileobj = fileobj
+        self._close_fileobj = close_fileobj
+        self.bytes_written = 0
+
+
+    @property
+    def name(self):
+        return getattr(self._fileobj, 'name', '<%s>' % type(self._fileobj).__name__)
+
+
+    def write(self, data):
+        self._fileobj.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+
+    def flush(self):
+        if hasattr(self._fileobj, 'flush'):
+            self._fileobj.flush()
+
+
+    def close(self):
+        self.flush()
+        if self._close_fileobj:
+            self._fileobj.close()
+
+
+    def seekable(self):
+        return False
+
+
+    def isatty(self):
+        return False
+
+
+    def copy_from(self, srcfile):
+        """Copy the rest of the open binary srcfile into this sink
+
+        Uses os.sendfile() where both ends are actual file
+        descriptors, and a chunked copy otherwise.
+        """
+        try:
+            src_fd = srcfile.fileno()
+            dst_fd = self._fileobj.fileno()
+        except (AttributeError, OSError, ValueError):
+            src_fd, dst_fd = None, None
+
+        before = self.bytes_written
+        if (src_fd != None) and hasattr(os, 'sendfile'):
+            self.flush()
+            try:
+                self.__sendfile(src_fd, dst_fd)
+                copied = self.bytes_written - before
+                log.debug('sent %d bytes to %s via sendfile', copied, self.name)
+                return copied
+            except OSError:
+                log.debug('sendfile to %s failed, falling back to copying',
+                          self.name)
+                srcfile.seek(os.lseek(src_fd, 0, os.SEEK_CUR))
+
+        shutil.copyfileobj(srcfile, self, chunk_size)
+        copied = self.bytes_written - before
+        log.debug('copied %d bytes to %s', copied, self.name)
+        return copied
+
+
+    def __sendfile(self, src_fd, dst_fd):
+        offset = os.lseek(src_fd, 0, os.SEEK_CUR)
+        copied = 0
+        try:
+            while True:
+                sent = os.sendfile(dst_fd, src_fd, offset + copied, chunk_size)
+                if sent == 0:
+                    break
+                copied += sent
+        finally:
+            # Leave srcfile positioned for a chunked copy fallback
+            os.lseek(src_fd, offset + copied, os.SEEK_SET)
+            self.bytes_written += copied
+        return copied
+
+
+########################################################################
+
+
+def open_sink(outfile):
+    """Wrap outfile into an OutputSink unless it already is one"""
+    if isinstance(outfile, OutputSink):
+        return outfile
+    return OutputSink(outfile)
+
+
+########################################################################
@@ -0,0 +1,162 @@
+########################################################################
+
+
+import datetime
+import os
+import tempfile
+from unittest import TestCase, mock
+
+
+########################################################################
+
+
+from .. import batch
+
+
+########################################################################
+
+
+class TestManifest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, fname, text):
+        fname = os.path.join(self.tmpdir.name, fname)
+        with open(fname, 'w') as f:
+            f.write(text)
+        return fname
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_yaml(self):
+        fname = self.write('jobs.yaml', '\n'.join([
+            '- output: a.pdf',
+            '  height: 1.78',
+            '  weight: 70-80',
+            '  begin: 2015-11-22',
+            '- output: b.pdf',
+            '  weight: 75+-5',
+            '  mode: history',
+            '  driver_options: {compress: no}',
+            '']))
+        jobs = batch.read_manifest(fname)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0].weight, (70.0, 80.0))
+        self.assertEqual(jobs[0].begin_date, datetime.date(2015, 11, 22))
+        self.assertEqual(jobs[1].weight, (70.0, 80.0))
+        self.assertEqual(jobs[1].plot_mode, 'history')
+        self.assertEqual(jobs[1].driver_options, {'compress': False})
+
+    def test_002_jsonl(self):
+        fname = self.write('jobs.jsonl', '\n'.join([
+            '{"output": "a.pdf", "weight": 75, "begin": "2015-11-22"}',
+            '',
+            '{"output": "b.pdf", "height": 1.8, "lang": "de"}',
+            '']))
+        jobs = batch.read_manifest(fname)
+        self.assertEqual([job.number for job in jobs], [1, 2])
+        self.assertEqual(jobs[0].weight, 75.0)
+        self.assertEqual(jobs[0].begin_date, datetime.date(2015, 11, 22))
+        self.assertEqual(jobs[1].lang, 'de')
+
+    def test_003_invalid(self):
+        for entry in ['[1, 2]',
+                      '{"weight": 75}',
+                      '{"output": "a.pdf"}',
+                      '{"output": "a.pdf", "weight": 75, "colour": "red"}',
+                      '{"output": "a.pdf", "weight": 75, "mode": "paint"}',
+                      '{"output": "a.pdf", "weight": 75, "begin": "2015-11-22",'
+                      ' "end": "2015-11-01"}',
+                      '{"output": "a.pdf", "weight": 75, "driver_options": [1]}',
+                      '{"output": "a.pdf", "weight": 75, "driver_options": 1}',
+                      '{"output": "-", "weight": 75}',
+                      ]:
+            fname = self.write('jobs.jsonl', entry)
+            self.assertRaises(batch.ManifestError, batch.read_manifest, fname)
+
+
+########################################################################
+
+
+try:
+    from ..drivers import ReportLab
+
+    class TestBatchRunner(TestCase):
+
+        def test_000_nothing(self):
+            pass
+
+        def test_001_run(self):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                infname = os.path.join(tmpdir, 'ab.dat')
+                with open(infname, 'w') as infile:
+                    infile.write('2015-11-20 75.0\n2015-11-23 74.6\n')
+                jobs = [batch.BatchJob(n+1, entry) for n, entry in enumerate([
+                    {'output': os.path.join(tmpdir, 'a.pdf'),
+                     'weight': '70-80', 'driver': 'reportlab'},
+                    {'output': os.path.join(tmpdir, 'b.svg'),
+                     'height': 1.78, 'input': infname,
+                     'driver': 'reportlab', 'format': 'svg'},
+                    {'output': os.path.join(tmpdir, 'c.pdf'),
+                     'height': 1.78, 'input': infname, 'mode': 'history',
+                     'driver': 'reportlab'},
+                    {'output': os.path.join(tmpdir, 'd.pdf'),
+                     'weight': 75, 'driver': 'no-such-driver'},
+                    ])]
+                runner = batch.BatchRunner()
+                self.assertEqual(runner.run(jobs), 1)
+                self.assertEqual(list(runner.plot_points), [infname])
+                for fname in ['a.pdf', 'b.svg', 'c.pdf']:
+                    self.assertTrue(os.path.getsize(os.path.join(tmpdir, fname)))
+                self.assertFalse(os.path.exists(os.path.join(tmpdir, 'd.pdf')))
+
+        def test_002_process_pool(self):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fnames = [os.path.join(tmpdir, '%d.pdf' % n) for n in range(4)]
+                jobs = [batch.BatchJob(n+1, {'output': fname, 'weight': 75,
+                                             'driver': 'reportlab'})
+                        for n, fname in enumerate(fnames)]
+                jobs.append(batch.BatchJob(5, {'output': 'x.pdf', 'weight': 75,
+                                               'driver': 'no-such-driver'}))
+                self.assertEqual(batch.BatchRunner().run(jobs, max_workers=2), 1)
+                for fname in fnames:
+                    self.assertTrue(os.path.getsize(fname))
+
+        def test_003_unexpected_error(self):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fnames = [os.path.join(tmpdir, '%d.pdf' % n) for n in range(3)]
+                jobs = [batch.BatchJob(n+1, {'output': fname, 'height': 1.8,
+                                             'driver': 'reportlab'})
+                        for n, fname in enumerate(fnames)]
+                generate_grid = batch.generate_grid
+                def fail_first(*args):
+                    if args[6].name == fnames[0]:
+                        raise TypeError('boom')
+                    return generate_grid(*args)
+                with mock.patch.object(batch, 'generate_grid', fail_first):
+                    self.assertEqual(batch.BatchRunner().run(jobs), 1)
+                for fname in fnames[1:]:
+                    self.assertTrue(os.path.getsize(fname))
+
+        def test_004_check_jobs(self):
+            jobs = [batch.BatchJob(n+1, dict(entry, output='x.pdf', weight=75))
+                    for n, entry in enumerate([
+                        {'driver': 'reportlab'},
+                        {'driver': 'no-such-driver'},
+                        {'driver': 'reportlab', 'format': 'dvi'},
+                        {'driver': 'reportlab', 'driver_options': {'x': 1}},
+                        ])]
+            errors = batch.check_jobs(jobs)
+            self.assertEqual([e.split(':')[0] for e in errors],
+                             ['job 2', 'job 3', 'job 4'])
+
+except ImportError:
+    pass
+
+
+########################################################################
@@ -131,6 +131,16 @@ class TestCmdline(TestCase):
     def test_003_list_options(self):
         self.__test_main(['--list-options'])
 
+    def test_004_format_before_driver(self):
+        if not drivers.load_driver('reportlab'):
+            return
+        svg_path = os.path.join(tempdir, 'TESTCASE-format.svg')
+        self.__test_main(['-f', 'svg', '-d', 'reportlab', '-W', '70-80',
+                          '--output=%s' % svg_path])
+        self.assertTrue(os.path.getsize(svg_path))
+        self.__test_main(['-d', 'reportlab', '-f', 'dvi', '-W', '70-80',
+                          '--output=%s' % svg_path], expect_code=2)
+
     # TODO: Test plotting actual weight data.
 
 
@@ -189,19 +199,20 @@ def test_comprehensive():
     # try all combinations of the following arguments
 
     arg_driver = ArgList('--driver')
+    driver_dict = drivers.load_drivers()
     if 'WCG_TEST_DRIVERS' in os.environ:
         drv_list = os.environ['WCG_TEST_DRIVERS'].split(',')
         for drv in drv_list:
             if drv == '':
                 continue
-            elif drv in drivers.GenericDriver.drivers:
+            elif drv in driver_dict:
                 arg_driver.append(drv)
             else:
                 log.error('Did not find driver %s in list of drivers (%s)',
-                          repr(drv), ', '.join(drivers.GenericDriver.drivers))
+                          repr(drv), ', '.join(driver_dict))
                 sys.exit(1)
     else:
-        for drv in drivers.GenericDriver.drivers:
+        for drv in driver_dict:
             arg_driver.append(drv)
 
     arg_lang = ArgList('--lang', [None, 'en', 'de'])
@@ -0,0 +1,49 @@
+########################################################################
+
+
+import subprocess
+import sys
+from unittest import TestCase
+
+
+########################################################################
+
+
+from .. import drivers
+
+
+########################################################################
+
+
+class TestDriverLookup(TestCase):
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_unknown_driver(self):
+        self.assertRaises(drivers.NoSuchDriverError,
+                          drivers.get_driver, 'no-such-driver')
+
+    def test_002_default_driver(self):
+        drv = drivers.get_driver(None)
+        self.assertIn(drv.driver_name, drivers.driver_modules)
+        self.assertIs(drivers.get_driver(drv.driver_name), drv)
+
+    def test_003_lazy_import(self):
+        # Only looking up a driver may import its module.
+        script = '\n'.join([
+            'import sys',
+            'import weight_cal_grid.cli',
+            'print(",".join(m for m in sys.modules',
+            '               if m.startswith("weight_cal_grid.drivers.")))',
+            ])
+        proc = subprocess.run([sys.executable, '-c', script],
+                              stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE,
+                              check=True)
+        loaded = proc.stdout.decode().strip().split(',')
+        for module in drivers.driver_modules.values():
+            self.assertNotIn('weight_cal_grid.drivers.%s' % module, loaded)
+
+
+########################################################################
@@ -0,0 +1,125 @@
+########################################################################
+
+
+import datetime
+import gettext
+import io
+import locale
+import struct
+from unittest import TestCase, mock
+
+
+########################################################################
+
+
+from .. import i18n
+
+
+########################################################################
+
+
+class FakeTranslation(gettext.NullTranslations):
+
+    def gettext(self, message):
+        return {'Jan': 'Xan', 'Feb': 'Yeb'}.get(message, message)
+
+
+def make_mo(catalog):
+    """Contents of a .mo file for catalog {msgid: msgstr}, like msgfmt"""
+    ids = sorted(catalog)
+    keys = [msgid.encode('utf-8') for msgid in ids]
+    values = [catalog[msgid].encode('utf-8') for msgid in ids]
+    ids_offset = 28
+    strs_offset = ids_offset + 8 * len(ids)
+    offset = strs_offset + 8 * len(ids)
+    tables, strings = [], b''
+    for data in keys + values:
+        tables.append(struct.pack('<2I', len(data), offset + len(strings)))
+        strings += data + b'\x00'
+    return (struct.pack('<7I', 0x950412de, 0, len(ids), ids_offset,
+                        strs_offset, 0, 0) +
+            b''.join(tables) + strings)
+
+
+class TestTranslation(TestCase):
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_locale_untouched(self):
+        before = locale.setlocale(locale.LC_ALL)
+        with mock.patch.object(locale, 'setlocale') as setlocale:
+            i18n.load_translation(None)
+            i18n.load_translation('en')
+            self.assertFalse(setlocale.called)
+        self.assertEqual(locale.setlocale(locale.LC_ALL), before)
+
+    def test_002_no_catalog(self):
+        with mock.patch.dict(i18n.languages, {'xx': ('Test', 'xx_XX')}):
+            self.assertRaises(i18n.NoSuchTranslationError,
+                              i18n.load_translation, 'xx')
+            self.assertEqual(i18n.preload_translations(['en', 'xx']), ['en'])
+
+    def test_003_dict_translations(self):
+        t = i18n.DictTranslations({'Mar': 'M\xe4r', ('day', 1): 'Tage'})
+        self.assertEqual(t.gettext('Mar'), 'M\xe4r')
+        self.assertEqual(t.gettext('Feb'), 'Feb')
+        self.assertEqual(t.ngettext('day', 'days', 2), 'Tage')
+        self.assertEqual(t.ngettext('day', 'days', 1), 'day')
+
+    def test_004_read_mo(self):
+        mo = make_mo({'': 'Content-Type: text/plain; charset=UTF-8\n'
+                          'Plural-Forms: nplurals=2; plural=(n != 1);\n',
+                      'Mar': 'M\xe4r',
+                      'day\x00days': 'Tag\x00Tage'})
+        self.assertEqual(i18n.mo_message_ids(mo),
+                         ['', 'Mar', 'day\x00days'])
+        t = i18n.DictTranslations.read(io.BytesIO(mo))
+        self.assertEqual(t.messages, {'Mar': 'M\xe4r'})
+        self.assertEqual(t.gettext('Mar'), 'M\xe4r')
+        self.assertEqual(t.gettext('Feb'), 'Feb')
+        self.assertEqual(t.ngettext('day', 'days', 1), 'Tag')
+        self.assertEqual(t.ngettext('day', 'days', 2), 'Tage')
+        self.assertRaises(OSError, i18n.mo_message_ids, b'\x00' * 28)
+
+
+########################################################################
+
+
+try:
+    from ..drivers import ReportLab
+
+    class TestMonthNames(TestCase):
+
+        def test_000_nothing(self):
+            pass
+
+        def test_001_month_tick(self):
+            driver = ReportLab.ReportLabDriver(
+                1.78, (70.0, 80.0),
+                (datetime.date(2015, 11, 22), datetime.date(2016, 5, 15)),
+                translation=FakeTranslation())
+            driver.count_axes()
+            with mock.patch.object(driver, 'render_time_tick') as tick:
+                driver.render_month_tick(None, None, datetime.date(2016, 1, 1))
+                driver.render_month_tick(None, None, datetime.date(2016, 2, 1))
+            labels = [args[3] for args, kwargs in tick.call_args_list]
+            self.assertEqual(labels, ['X', 'Y'])
+
+        def test_002_no_gettext(self):
+            translation = i18n.DictTranslations({'Dec': 'Dez'})
+            driver = ReportLab.ReportLabDriver(
+                1.78, (70.0, 80.0),
+                (datetime.date(2015, 11, 22), datetime.date(2016, 1, 17)),
+                translation=translation)
+            driver.count_axes()
+            with mock.patch.object(translation, 'gettext') as gettext_:
+                driver.gen_outfile(io.BytesIO(), 'pdf')
+            self.assertFalse(gettext_.called)
+            self.assertEqual(driver._('Dec'), 'Dez')
+
+except ImportError:
+    pass
+
+
+########################################################################
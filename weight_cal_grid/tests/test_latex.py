@@ -0,0 +1,489 @@
+########################################################################
+
+
+import concurrent.futures
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase, mock
+
+
+########################################################################
+
+
+from ..drivers import latex
+
+
+########################################################################
+
+
+class TestLatexFormat(TestCase):
+
+    def setUp(self):
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.dict(os.environ,
+                            {'XDG_CACHE_HOME': self.cache_home.name}),
+            mock.patch.object(latex, 'get_pdflatex_version',
+                              return_value='pdfTeX 3.14'),
+            ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.cache_home.cleanup()
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_format_name(self):
+        self.assertEqual(latex.format_name('a'), latex.format_name('a'))
+        self.assertNotEqual(latex.format_name('a'), latex.format_name('b'))
+
+    def test_002_cached_format(self):
+        fmt_name = latex.format_name('preamble')
+        fmt_dir = os.path.join(self.cache_home.name, 'weight-calendar-grid',
+                               latex.format_subdir)
+        os.makedirs(fmt_dir)
+        open(os.path.join(fmt_dir, '%s.fmt' % fmt_name), 'wb').close()
+        with mock.patch.object(latex.subprocess, 'run') as run:
+            fmt = latex.get_format('preamble')
+        self.assertFalse(run.called)
+        self.assertEqual(fmt, (fmt_dir, fmt_name))
+
+        args, env = latex.pdflatex_command(fmt)
+        self.assertIn('-fmt=%s' % fmt_name, args)
+        self.assertTrue(env['TEXFORMATS'].startswith(fmt_dir + os.pathsep))
+
+    def test_003_failed_dump(self):
+        with mock.patch.object(latex.subprocess, 'run') as run:
+            run.return_value.returncode = 1
+            run.return_value.stdout = b'! LaTeX Error'
+            self.assertIsNone(latex.get_format('broken preamble'))
+        self.assertEqual(latex.pdflatex_command(None), (['pdflatex'], None))
+
+    def test_004_aux_cache(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            aux_fname = os.path.join(workdir, 'doc.aux')
+            self.assertFalse(latex.restore_aux('doc', aux_fname))
+            self.assertIsNone(latex.file_digest(aux_fname))
+            with open(aux_fname, 'w') as aux_file:
+                aux_file.write('\\relax\n')
+            digest = latex.file_digest(aux_fname)
+            latex.store_aux('doc', aux_fname)
+            os.unlink(aux_fname)
+            self.assertFalse(latex.restore_aux('other doc', aux_fname))
+            self.assertTrue(latex.restore_aux('doc', aux_fname))
+            self.assertEqual(latex.file_digest(aux_fname), digest)
+
+            with mock.patch.object(latex, 'get_cache_dir',
+                                   side_effect=PermissionError('read-only')):
+                self.assertFalse(latex.store_aux('doc', aux_fname))
+                self.assertFalse(latex.restore_aux('doc', aux_fname))
+
+    def test_005_workdir_root(self):
+        with tempfile.TemporaryDirectory() as runtime_dir:
+            with mock.patch.dict(os.environ, {'XDG_RUNTIME_DIR': runtime_dir}):
+                self.assertEqual(latex.default_workdir_root(), runtime_dir)
+                job = latex.LatexJob('', '', None)
+                self.assertEqual(job.workdir_root, runtime_dir)
+                job = latex.LatexJob('', '', None, workdir_root='/var/tmp')
+                self.assertEqual(job.workdir_root, '/var/tmp')
+
+    def test_006_aux_cache_pruned(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            aux_fname = os.path.join(workdir, 'doc.aux')
+            open(aux_fname, 'w').close()
+            with mock.patch.object(latex, 'max_cached_aux_files', 3):
+                for n in range(5):
+                    self.assertTrue(latex.store_aux('doc %d' % n, aux_fname))
+                    # distinct mtimes, latest stored last
+                    os.utime(latex.aux_cache_fname('doc %d' % n), (n, n))
+                cache_dir = os.path.dirname(latex.aux_cache_fname('doc'))
+                self.assertEqual(len(os.listdir(cache_dir)), 3)
+                self.assertFalse(latex.restore_aux('doc 0', aux_fname))
+                self.assertTrue(latex.restore_aux('doc 4', aux_fname))
+
+    def test_007_aux_stable_only(self):
+        def fake_run_latex(job, workdir, latex_args, latex_env, stage, fmt):
+            base = os.path.join(workdir, job.basename)
+            with open(base + '.aux', 'w') as aux_file:
+                aux_file.write(aux_text(stage))
+            open(base + '.pdf', 'wb').close()
+            return latex.LatexResult(0, '', 0.0)
+        for body, aux_text, cached in [
+                ('changing', lambda stage: 'run %d' % stage, False),
+                ('settling', lambda stage: 'run %d' % min(stage, 2), True)]:
+            job = latex.LatexJob('', body, io.BytesIO(), precompile=False)
+            with mock.patch.object(latex.LatexJob, '_LatexJob__run_latex',
+                                   fake_run_latex), \
+                 mock.patch.object(latex.log, 'warn'):
+                job.run()
+            with tempfile.TemporaryDirectory() as workdir:
+                self.assertEqual(latex.restore_aux('\n' + body,
+                                                   os.path.join(workdir, 'x')),
+                                 cached)
+
+
+########################################################################
+
+
+tty_text = r"""This is pdfTeX, Version 3.14159265-2.6-1.40.20
+(./weight-calendar-grid.tex
+! Undefined control sequence.
+l.42 \tikzsetx
+               {plot line/.style={draw=plotlinecolor,
+! Emergency stop.
+l.57
+"""
+
+
+class TestLatexResult(TestCase):
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_parse(self):
+        self.assertEqual(latex.parse_latex_output(tty_text),
+                         ('Undefined control sequence.', 42))
+        self.assertEqual(latex.parse_latex_output('! Emergency stop.\n'),
+                         ('Emergency stop.', None))
+        self.assertEqual(latex.parse_latex_output('Output written\n'),
+                         (None, None))
+
+    def test_002_error(self):
+        result = latex.LatexResult(1, tty_text, 0.25)
+        self.assertFalse(result.ok)
+        e = latex.LatexError(result, 'grid.pdf')
+        self.assertIsInstance(e, latex.DriverError)
+        self.assertEqual(str(e), 'grid.pdf: pdflatex retcode=1 after 0.2s: '
+                         'Undefined control sequence. (line 42)')
+        result = latex.LatexResult(None, '', 300.0)
+        self.assertEqual(str(result), 'pdflatex timed out after 300.0s')
+
+
+########################################################################
+
+
+class TestTexWriter(TestCase):
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_append(self):
+        tex = latex.TexWriter()
+        tex.append(r'\begin{document}')
+        tex.append(r'\end{document}')
+        self.assertEqual(tex.getvalue(),
+                         '\\begin{document}\n\\end{document}\n')
+
+    def test_002_log_data_gated(self):
+        tex = latex.TexWriter()
+        tex.append('a\nb')
+        with mock.patch.object(latex.log, 'data') as data:
+            with mock.patch.object(latex.log, 'enabled', return_value=False):
+                tex.log_data()
+            self.assertFalse(data.called)
+            with mock.patch.object(latex.log, 'enabled', return_value=True):
+                tex.log_data()
+            self.assertEqual(data.call_count, 2)
+
+    def test_003_escape_text(self):
+        self.assertEqual(latex.escape_text('a_b 50% #1 & $x'),
+                         r'a\_b 50\% \#1 \& \$x')
+        self.assertEqual(latex.escape_text('~/{x}^\\'),
+                         r'\textasciitilde{}/\{x\}\textasciicircum{}'
+                         r'\textbackslash{}')
+
+
+########################################################################
+
+
+class FakeWarmLatex(object):
+
+    """Stand-in for a WarmLatex without a pdflatex process"""
+
+    def __init__(self, fmt, workdir_root=None):
+        self.fmt = fmt
+        self.proc = mock.Mock(pid=0, returncode=1)
+        self.dead = False
+        self.closed = False
+
+    def alive(self):
+        return not self.dead
+
+    def close(self):
+        self.closed = True
+
+
+class TestLatexServer(TestCase):
+
+    def setUp(self):
+        self.patch = mock.patch.object(latex, 'WarmLatex', FakeWarmLatex)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_refill(self):
+        with latex.LatexServer(size=2) as server:
+            server.prepare('fmt')
+            warm = server.acquire('fmt')
+            self.assertEqual(warm.fmt, 'fmt')
+            other = server.acquire('other fmt')
+            self.assertEqual(other.fmt, 'other fmt')
+            self.assertIsNot(server.acquire('fmt'), warm)
+
+    def test_002_replace_dead(self):
+        started = []
+        def start(fmt, workdir_root=None):
+            started.append(FakeWarmLatex(fmt, workdir_root))
+            return started[-1]
+        with mock.patch.object(latex, 'WarmLatex', start):
+            server = latex.LatexServer(size=1)
+            server.prepare('fmt')
+            started[0].dead = True
+            warm = server.acquire('fmt')
+            self.assertTrue(started[0].closed)
+            self.assertIsNot(warm, started[0])
+            self.assertTrue(warm.alive())
+            server.close()
+            self.assertTrue(started[-1].closed)
+            self.assertEqual(len(started), 3)
+
+    def test_003_resize(self):
+        with latex.LatexServer(size=3) as server:
+            server.prepare('fmt')
+            warm = server.acquire('fmt')
+            server.resize(1)
+            self.assertEqual(server.size, 1)
+            other = server.acquire('fmt')
+            self.assertIsNot(other, warm)
+            self.assertFalse(other.closed)
+        self.assertRaises(ValueError, latex.LatexServer, 0)
+        self.assertRaises(ValueError, server.resize, 0)
+
+    def test_004_get_server_size(self):
+        with mock.patch.object(latex, '_server', None), \
+             mock.patch.object(latex.multiprocessing.util,
+                               'Finalize') as finalize:
+            server = latex.get_server(3)
+            finalize.assert_called_once_with(None, server.close,
+                                             exitpriority=0)
+            self.assertEqual(server.size, 3)
+            self.assertIs(latex.get_server(1), server)
+            self.assertEqual(server.size, 1)
+            server.close()
+
+    def test_005_start_unlocked(self):
+        locked = []
+        def start(fmt, workdir_root=None):
+            locked.append(server._LatexServer__lock.locked())
+            return FakeWarmLatex(fmt, workdir_root)
+        with mock.patch.object(latex, 'WarmLatex', start):
+            with latex.LatexServer(size=2) as server:
+                server.prepare('fmt')
+                server.acquire('fmt')
+                server.acquire('other fmt')
+        self.assertEqual(len(locked), 6)
+        self.assertFalse(any(locked))
+
+    def test_006_closed_while_starting(self):
+        started = []
+        def start(fmt, workdir_root=None):
+            if not started:
+                server.close()
+            started.append(FakeWarmLatex(fmt, workdir_root))
+            return started[-1]
+        with mock.patch.object(latex, 'WarmLatex', start):
+            server = latex.LatexServer(size=2)
+            server.prepare('fmt')
+            self.assertTrue(all(warm.closed for warm in started))
+            server.prepare('fmt')
+            self.assertEqual(len(started), 4)
+            self.assertFalse(any(warm.closed for warm in started[2:]))
+            server.close()
+
+
+########################################################################
+
+
+_pdflatex_works = None
+
+
+def pdflatex_works():
+    """Whether a pdflatex which can compile documents is on the PATH"""
+    global _pdflatex_works
+    if _pdflatex_works is None:
+        _pdflatex_works = False
+        if shutil.which('pdflatex'):
+            with tempfile.TemporaryDirectory() as workdir:
+                try:
+                    subprocess.run(['pdflatex', '-interaction=batchmode',
+                                    r'\documentclass{article}'
+                                    r'\begin{document}x\end{document}'],
+                                   cwd=workdir,
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL,
+                                   timeout=60)
+                except (EnvironmentError, subprocess.SubprocessError):
+                    pass
+                _pdflatex_works = os.path.exists(
+                    os.path.join(workdir, 'texput.pdf'))
+    return _pdflatex_works
+
+
+class TestWarmLatex(TestCase):
+
+    """Compile with real warm pdflatex processes, if pdflatex works"""
+
+    preamble = '\\documentclass{article}'
+
+    def setUp(self):
+        if not pdflatex_works():
+            self.skipTest('pdflatex not available')
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.dict(os.environ,
+                                     {'XDG_CACHE_HOME': self.cache_home.name})
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.cache_home.cleanup()
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_compile(self):
+        self.assertIsNotNone(latex.get_format(self.preamble))
+        with latex.LatexServer(size=1) as server, \
+             mock.patch.object(server, 'acquire',
+                               wraps=server.acquire) as acquire:
+            for text in ['one', 'two']:
+                outfile = io.BytesIO()
+                job = latex.LatexJob(self.preamble,
+                                     '\\begin{document}\n%s\n'
+                                     '\\end{document}' % text,
+                                     outfile, server=server)
+                result = job.run()
+                self.assertTrue(result.ok)
+                self.assertTrue(outfile.getvalue().startswith(b'%PDF'))
+            self.assertTrue(acquire.called)
+
+
+########################################################################
+
+
+# Stand-in for pdflatex which follows the protocol of WarmLatex: the
+# last argument of a warm process makes it read the \input line from
+# stdin. Every call and stdin line is logged next to the script.
+fake_pdflatex = r'''#!/bin/sh
+calls="$(dirname "$0")/calls.log"
+printf 'args: %s\n' "$*" >> "$calls"
+jobname=texput
+ini=
+last=
+for arg do
+    case "$arg" in
+        --version) echo 'pdfTeX 3.14 (fake)'; exit 0 ;;
+        -ini) ini=yes ;;
+        -jobname=*) jobname="${arg#-jobname=}" ;;
+    esac
+    last="$arg"
+done
+if [ -n "$ini" ]; then
+    echo dumped > "$jobname.fmt"
+    exit 0
+fi
+case "$last" in
+    *wcgnext*) read -r line; printf 'stdin: %s\n' "$line" >> "$calls" ;;
+    *) jobname="$last" ;;
+esac
+echo '\relax' > "$jobname.aux"
+echo '%PDF-1.4 fake' > "$jobname.pdf"
+'''
+
+
+def prepare_server(fmt):
+    """Start the shared server in a pool worker, listing its workdirs"""
+    server = latex.get_server(1)
+    server.prepare(fmt)
+    return sorted(fname for fname in os.listdir(server.workdir_root)
+                  if fname.endswith('.warm'))
+
+
+class TestWarmLatexProtocol(TestCase):
+
+    """Run warm processes and jobs against a fake pdflatex"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.bindir = os.path.join(self.tmpdir.name, 'bin')
+        self.rundir = os.path.join(self.tmpdir.name, 'run')
+        for dirname in [self.bindir, self.rundir]:
+            os.mkdir(dirname)
+        script = os.path.join(self.bindir, 'pdflatex')
+        with open(script, 'w') as script_file:
+            script_file.write(fake_pdflatex)
+        os.chmod(script, 0o755)
+        self.patches = [
+            mock.patch.dict(os.environ, {
+                'PATH': os.pathsep.join([self.bindir, os.environ['PATH']]),
+                'XDG_CACHE_HOME': os.path.join(self.tmpdir.name, 'cache'),
+                'XDG_RUNTIME_DIR': self.rundir}),
+            mock.patch.object(latex, '_pdflatex_version', None),
+            ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def calls(self):
+        with open(os.path.join(self.bindir, 'calls.log')) as calls_file:
+            return calls_file.read().splitlines()
+
+    def warm_dirs(self):
+        return [fname for fname in os.listdir(self.rundir)
+                if fname.endswith('.warm')]
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_server_job(self):
+        with latex.LatexServer(size=1) as server:
+            for i in range(2):
+                outfile = io.BytesIO()
+                result = latex.LatexJob('preamble', 'body', outfile,
+                                        server=server).run()
+                self.assertEqual(outfile.getvalue(), b'%PDF-1.4 fake\n')
+            # the second job starts from the cached .aux file
+            self.assertEqual(result.runs, 1)
+            self.assertEqual(len(self.warm_dirs()), 1)
+        self.assertEqual(self.warm_dirs(), [])
+        calls = self.calls()
+        warm_calls = [call for call in calls if 'wcgnext' in call]
+        self.assertEqual(len(warm_calls), 4)
+        self.assertTrue(all('-fmt=wcg-' in call for call in warm_calls))
+        self.assertEqual(calls.count(
+            'stdin: \\input weight-calendar-grid.tex'), 3)
+
+    def test_002_worker_cleanup(self):
+        fmt = latex.get_format('preamble')
+        with concurrent.futures.ProcessPoolExecutor(1) as executor:
+            self.assertEqual(len(executor.submit(prepare_server,
+                                                 fmt).result()), 1)
+        self.assertEqual(self.warm_dirs(), [])
+
+
+########################################################################
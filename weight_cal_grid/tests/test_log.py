@@ -0,0 +1,159 @@
+########################################################################
+
+
+import io
+import json
+import logging
+from unittest import TestCase, mock
+
+
+########################################################################
+
+
+from .. import log
+
+
+########################################################################
+
+
+class TestLazyLogging(TestCase):
+
+    def setUp(self):
+        self.outfile = io.StringIO()
+        self.patcher = mock.patch.multiple(
+            log, level=log.INFO, startup_level=log.INFO,
+            outfile=self.outfile)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_enabled(self):
+        self.assertTrue(log.enabled(log.INFO))
+        self.assertFalse(log.enabled(log.DEBUG))
+        log.level = log.DEBUG
+        self.assertTrue(log.enabled(log.DEBUG))
+
+    def test_002_lazy_disabled(self):
+        func = mock.Mock(return_value='value')
+        log.debug('lazy %s', log.lazy(func, 1, 2))
+        self.assertFalse(func.called)
+        self.assertEqual(self.outfile.getvalue(), '')
+
+    def test_003_lazy_enabled(self):
+        log.level = log.DEBUG
+        func = mock.Mock(return_value='value')
+        log.debug('lazy %s %r', log.lazy(func, 1, 2), log.lazy(str, 'x'))
+        func.assert_called_once_with(1, 2)
+        self.assertIn("DEBUG: lazy value 'x'", self.outfile.getvalue())
+
+    def test_004_level_functions(self):
+        funcs = [(log.data, log.DATA), (log.debug, log.DEBUG),
+                 (log.verbose, log.VERBOSE), (log.info, log.INFO),
+                 (log.quiet, log.QUIET), (log.warn, log.WARN),
+                 (log.error, log.ERROR)]
+        with mock.patch.object(log, 'enabled') as enabled, \
+             mock.patch.object(log, '_emit') as emit:
+            for level in [None, log.ERROR, log.INFO, log.DATA]:
+                log.level = level
+                for func, lvl in funcs:
+                    emit.reset_mock()
+                    func('msg %s', 1, extra={'a': 1})
+                    if (level is not None and level >= lvl) or lvl <= log.INFO:
+                        emit.assert_called_once_with(
+                            lvl, 'msg %s', (1,), {'extra': {'a': 1}})
+                    else:
+                        self.assertFalse(emit.called)
+            # the level functions compare the levels themselves
+            self.assertFalse(enabled.called)
+
+
+########################################################################
+
+
+class TestSinks(TestCase):
+
+    def setUp(self):
+        self.outfile = io.StringIO()
+        self.patcher = mock.patch.multiple(
+            log, level=log.INFO, startup_level=log.INFO,
+            outfile=self.outfile, sink=log.TextSink())
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_text(self):
+        log.info('%d jobs', 3, extra={'jobs': 3})
+        log.debug('hidden')
+        self.assertEqual(self.outfile.getvalue(),
+                         '%s: INFO:  3 jobs\n' % log.get_prog())
+
+    def test_002_json_lines(self):
+        stream = io.StringIO()
+        log.set_sink(log.JSONLinesSink(stream, buffer_size=3))
+        with log.context(job=7, driver='tikz'):
+            log.info('job %d', 7)
+            with log.context(driver='cairo'):
+                log.verbose('filtered out')
+                log.info('done', extra={'duration_s': 0.5})
+        self.assertEqual(stream.getvalue(), '')
+        log.warn('warning')
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['msg'] for r in records],
+                         ['job 7', 'done', 'warning'])
+        self.assertEqual(records[0]['level'], 'info')
+        self.assertEqual(records[0]['job'], 7)
+        self.assertEqual(records[1]['driver'], 'cairo')
+        self.assertEqual(records[1]['duration_s'], 0.5)
+        self.assertNotIn('job', records[2])
+        self.assertEqual(self.outfile.getvalue(), '')
+
+    def test_003_json_lines_worker(self):
+        stream = io.StringIO()
+        with mock.patch.object(log.atexit, 'register') as register:
+            for i in range(3):
+                log.set_sink(log.JSONLinesSink(stream))
+        self.assertFalse(register.called)
+        log.info('parent')
+        # a forked worker drops the records buffered by its parent
+        with mock.patch.object(log.os, 'getpid', return_value=4242):
+            log._sink_after_fork()
+            log.info('worker')
+            log.sink.flush()
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['msg'] for r in records], ['worker'])
+        self.assertEqual(records[0]['pid'], 4242)
+        self.assertEqual(records[0]['prog'], '%s(4242)' % log.prog_name)
+
+    def test_004_logging_bridge(self):
+        logger = logging.getLogger('wcg-test')
+        logger.propagate = False
+        logger.setLevel(1)
+        handler = mock.Mock(spec=logging.Handler, level=0)
+        logger.addHandler(handler)
+        try:
+            log.set_sink(log.LoggingSink(logger))
+            with log.context(job=1):
+                log.info('info', extra={'name': 'clash'})
+                log.quiet('quiet')
+                log.error('error')
+        finally:
+            logger.removeHandler(handler)
+        records = [args[0] for args, kwargs in handler.handle.call_args_list]
+        self.assertEqual([r.getMessage() for r in records],
+                         ['info', 'quiet', 'error'])
+        levels = [r.levelno for r in records]
+        self.assertEqual(levels, sorted(levels))
+        self.assertEqual(records[0].levelno, logging.INFO)
+        self.assertEqual(records[0].job, 1)
+        self.assertEqual(records[0].wcg_name, 'clash')
+
+
+########################################################################
@@ -0,0 +1,135 @@
+########################################################################
+
+
+import datetime
+from io import BytesIO
+from unittest import TestCase, mock
+
+
+########################################################################
+
+
+from .. import generate_grid
+from ..drivers.basic import DriverError
+from ..i18n import get_translation
+
+
+########################################################################
+
+
+def render_grid(driver_cls, output_format='pdf', **kwargs):
+    outfile = BytesIO()
+    generate_grid(1.78, (70.0, 80.0),
+                  (datetime.date(2015, 11, 22), datetime.date(2016, 1, 17)),
+                  None, driver_cls, output_format, outfile,
+                  keep_tmp_on_error=False, history_mode=False,
+                  initials='RL', lang=None, **kwargs)
+    return outfile.getvalue()
+
+
+########################################################################
+
+
+try:
+    from ..drivers import ReportLab
+
+    class TestReportLabFonts(TestCase):
+
+        def test_000_nothing(self):
+            pass
+
+        def test_001_fontset_cached(self):
+            fs1 = ReportLab.find_fontset(ReportLab.sans_font_sets)
+            fs2 = ReportLab.find_fontset(ReportLab.sans_font_sets)
+            self.assertIs(fs1, fs2)
+
+        def test_002_no_font_work_on_rerender(self):
+            render_grid(ReportLab.ReportLabDriver)
+            with mock.patch.object(ReportLab.pdfmetrics,
+                                   'registerFont') as register_font:
+                with mock.patch.object(ReportLab.os.path,
+                                       'exists') as path_exists:
+                    data = render_grid(ReportLab.ReportLabDriver)
+            self.assertFalse(register_font.called)
+            self.assertFalse(path_exists.called)
+            self.assertTrue(data.startswith(b'%PDF'))
+
+    def png_available():
+        try:
+            ReportLab.get_renderPM()
+            return True
+        except DriverError:
+            return False
+
+    class TestReportLabFormats(TestCase):
+
+        def test_000_nothing(self):
+            pass
+
+        def test_001_svg(self):
+            data = render_grid(ReportLab.ReportLabDriver, 'svg')
+            self.assertIn(b'<svg', data)
+
+        def test_002_render_once(self):
+            outputs = [(BytesIO(), fmt)
+                       for fmt in ReportLab.ReportLabDriver.driver_formats
+                       if fmt != 'png' or png_available()]
+            driver = ReportLab.ReportLabDriver(
+                1.78, (70.0, 80.0),
+                (datetime.date(2015, 11, 22), datetime.date(2016, 1, 17)),
+                history_mode=False, initials='RL',
+                translation=get_translation(None))
+            driver.count_axes()
+            with mock.patch.object(driver, 'render',
+                                   wraps=driver.render) as render:
+                driver.gen_outfiles(outputs)
+            self.assertEqual(render.call_count, 1)
+            for outfile, _fmt in outputs:
+                self.assertTrue(outfile.getvalue())
+
+        def test_003_png(self):
+            if png_available():
+                data = render_grid(ReportLab.ReportLabDriver, 'png')
+                self.assertTrue(data.startswith(b'\x89PNG'))
+            else:
+                self.assertRaises(DriverError, render_grid,
+                                  ReportLab.ReportLabDriver, 'png')
+
+    class TestReportLabOutputSize(TestCase):
+
+        # Upper bound for a compressed grid using the PDF standard fonts.
+        # If this fails, find out what made the output grow.
+        size_budget = 12 * 1024
+
+        def test_000_nothing(self):
+            pass
+
+        def test_001_compression(self):
+            compressed = render_grid(ReportLab.ReportLabDriver)
+            uncompressed = render_grid(ReportLab.ReportLabDriver,
+                                       driver_options={'compress': 'no'})
+            self.assertLess(len(compressed), len(uncompressed))
+
+        def test_002_standard_fonts(self):
+            embedded = render_grid(ReportLab.ReportLabDriver)
+            standard = render_grid(ReportLab.ReportLabDriver,
+                                   driver_options={'embed_fonts': 'no'})
+            self.assertLess(len(standard), len(embedded))
+            self.assertNotIn(b'/FontFile', standard)
+
+        def test_003_size_budget(self):
+            data = render_grid(ReportLab.ReportLabDriver,
+                               driver_options={'embed_fonts': False})
+            self.assertLess(len(data), self.size_budget)
+
+        def test_004_unknown_option(self):
+            from ..drivers.basic import NoSuchDriverOptionError
+            self.assertRaises(NoSuchDriverOptionError,
+                              render_grid, ReportLab.ReportLabDriver,
+                              driver_options={'no_such_option': 'yes'})
+
+except ImportError:
+    pass
+
+
+########################################################################
@@ -0,0 +1,114 @@
+########################################################################
+
+
+import asyncio
+import concurrent.futures
+from unittest import TestCase
+
+
+########################################################################
+
+
+from .. import server
+
+
+########################################################################
+
+
+class TestHelpers(TestCase):
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_parse_request_head(self):
+        method, target, version, headers = server.parse_request_head(
+            b'GET /?weight=75 HTTP/1.1\r\nHost: x\r\nIf-None-Match: "a"\r\n\r\n')
+        self.assertEqual((method, target, version),
+                         ('GET', '/?weight=75', 'HTTP/1.1'))
+        self.assertEqual(headers, {'host': 'x', 'if-none-match': '"a"'})
+        for head in [b'GET /\r\n\r\n', b'GET / SPDY/3\r\n\r\n',
+                     b'GET / HTTP/1.1\r\nHost\r\n\r\n']:
+            self.assertRaises(ValueError, server.parse_request_head, head)
+
+    def test_002_server_timing(self):
+        self.assertEqual(server.format_server_timing(
+            {'render': 0.0125, 'parse': 0.0004}),
+                         'parse;dur=0.4, render;dur=12.5')
+
+
+########################################################################
+
+
+class TestGridServer(TestCase):
+
+    def make_server(self, max_queue=None):
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+        return server.GridServer(1, max_queue, executor=executor)
+
+    async def fetch(self, port, query):
+        reader, writer = await asyncio.open_connection('localhost', port)
+        writer.write(('GET /?%s HTTP/1.1\r\nHost: localhost\r\n'
+                      'Connection: close\r\n\r\n' % query).encode('ascii'))
+        response = await reader.read()
+        writer.close()
+        head, sep, body = response.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        return int(lines[0].split(' ')[1]), headers, body
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_http(self):
+        async def run():
+            async with self.make_server() as grid_server:
+                if 'pdf' not in grid_server.app.formats:
+                    return
+                http_server = await grid_server.start()
+                port = http_server.sockets[0].getsockname()[1]
+                status, headers, body = await self.fetch(
+                    port, 'weight=70-80&begin=2015-11-22')
+                self.assertEqual(status, 200)
+                self.assertEqual(headers['Content-Type'], 'application/pdf')
+                self.assertTrue(body.startswith(b'%PDF'))
+                for stage in ['parse', 'wait', 'layout', 'render']:
+                    self.assertIn('%s;dur=' % stage, headers['Server-Timing'])
+                status, headers, body = await self.fetch(port, 'weight=heavy')
+                self.assertEqual(status, 400)
+                self.assertEqual(grid_server.get_stats()['requests'], 2)
+        asyncio.run(run())
+
+    def test_002_coalesce(self):
+        async def run():
+            async with self.make_server() as grid_server:
+                if 'pdf' not in grid_server.app.formats:
+                    return
+                grid_server.start_dispatch()
+                request = grid_server.app.parse_request('weight=75')
+                results = await asyncio.gather(
+                    *[grid_server.render(request) for i in range(3)])
+                self.assertEqual(grid_server.stats['renders'], 1)
+                self.assertEqual(grid_server.stats['coalesced'], 2)
+                self.assertEqual(len(set(body for body, t in results)), 1)
+                self.assertEqual(grid_server.in_flight, {})
+        asyncio.run(run())
+
+    def test_003_busy(self):
+        async def run():
+            async with self.make_server(max_queue=1) as grid_server:
+                if 'pdf' not in grid_server.app.formats:
+                    return
+                grid_server.start_dispatch()
+                requests = [grid_server.app.parse_request('weight=%d' % kg)
+                            for kg in range(70, 74)]
+                results = await asyncio.gather(
+                    *[grid_server.render(request) for request in requests],
+                    return_exceptions=True)
+                busy = [r for r in results if isinstance(r, server.ServerBusy)]
+                self.assertTrue(busy)
+                self.assertLess(len(busy), len(requests))
+                self.assertEqual(grid_server.stats['busy'], len(busy))
+        asyncio.run(run())
+
+
+########################################################################
@@ -0,0 +1,79 @@
+########################################################################
+
+
+from io import BytesIO
+import os
+import tempfile
+from unittest import TestCase
+
+
+########################################################################
+
+
+from .. import sink
+from ..sink import OutputSink, open_sink
+
+
+########################################################################
+
+
+class NonSeekableFile(BytesIO):
+
+    """Byte buffer behaving like a pipe or socket"""
+
+    def seek(self, *args):
+        raise OSError('illegal seek')
+
+    def tell(self):
+        raise OSError('illegal seek')
+
+    def seekable(self):
+        return False
+
+
+########################################################################
+
+
+class TestSink(TestCase):
+
+    def setUp(self):
+        self.data = bytes(range(256)) * 1000
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_open_sink(self):
+        s = open_sink(BytesIO())
+        self.assertIsInstance(s, OutputSink)
+        self.assertIs(open_sink(s), s)
+
+    def test_002_write_non_seekable(self):
+        dst = NonSeekableFile()
+        s = open_sink(dst)
+        s.write(self.data[:1000])
+        s.write(self.data[1000:])
+        s.close()
+        self.assertEqual(dst.getvalue(), self.data)
+        self.assertEqual(s.bytes_written, len(self.data))
+
+    def test_003_chunked_copy(self):
+        dst = NonSeekableFile()
+        s = open_sink(dst)
+        copied = s.copy_from(BytesIO(self.data))
+        self.assertEqual(copied, len(self.data))
+        self.assertEqual(dst.getvalue(), self.data)
+
+    def test_004_copy_file_to_pipe(self):
+        data = self.data[:sink.chunk_size // 2]
+        with tempfile.TemporaryFile() as srcfile:
+            srcfile.write(data)
+            srcfile.seek(0)
+            rfd, wfd = os.pipe()
+            with os.fdopen(rfd, 'rb') as rfile, os.fdopen(wfd, 'wb') as wfile:
+                s = OutputSink(wfile, close_fileobj=True)
+                self.assertEqual(s.copy_from(srcfile), len(data))
+                s.close()
+                self.assertEqual(rfile.read(), data)
+
+
+########################################################################
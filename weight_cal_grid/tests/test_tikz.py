@@ -0,0 +1,211 @@
+########################################################################
+
+
+import datetime
+import io
+import os
+import re
+import tempfile
+from unittest import TestCase, mock, skipUnless
+
+
+########################################################################
+
+
+from .. import setup_driver
+from ..i18n import get_translation
+from .test_latex import pdflatex_works
+
+
+########################################################################
+
+
+def split_top_level(text, sep):
+    """Split text at the sep characters outside of braces"""
+    parts, depth, begin = [], 0, 0
+    for i, c in enumerate(text):
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+        elif c == sep and depth == 0:
+            parts.append(text[begin:i])
+            begin = i + 1
+    parts.append(text[begin:])
+    return parts
+
+
+def check_tex(testcase, tex):
+    """Check braces and environments in tex, returning the \\foreach lists"""
+    tex = re.sub(r'\\[{}%]|%.*', '', tex)
+    depth = 0
+    for c in tex:
+        depth += {'{': 1, '}': -1}.get(c, 0)
+        testcase.assertGreaterEqual(depth, 0)
+    testcase.assertEqual(depth, 0)
+    envs = []
+    for kind, env in re.findall(r'\\(begin|end)\{(\w+)\}', tex):
+        if kind == 'begin':
+            envs.append(env)
+        else:
+            testcase.assertEqual(envs.pop(), env)
+    testcase.assertEqual(envs, [])
+    lists = []
+    for match in re.finditer(r'\\foreach ((?:\\\w+/?)+) in \{', tex):
+        depth, end = 1, match.end()
+        while depth:
+            depth += {'{': 1, '}': -1}.get(tex[end], 0)
+            end += 1
+        nvars = match.group(1).count('/') + 1
+        items = [split_top_level(item, '/') if nvars > 1 else [item]
+                 for item in split_top_level(tex[match.end():end-1], ',')]
+        for item in items:
+            testcase.assertEqual(len(item), nvars)
+        lists.append(items)
+    return lists
+
+
+try:
+    from ..drivers import TikZ
+    TikZ_error = None
+except ImportError as e:
+    TikZ = None
+    TikZ_error = e
+
+
+def make_driver(initials, lang=None):
+    driver = TikZ.TikZDriver(
+        1.78, (70.0, 80.0),
+        (datetime.date(2015, 11, 22), datetime.date(2016, 1, 17)),
+        initials=initials,
+        translation=get_translation(lang))
+    driver.count_axes()
+    return driver
+
+
+@skipUnless(TikZ, 'TikZ driver not available: %s' % TikZ_error)
+class TestTikZPage(TestCase):
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_single_page(self):
+        job = make_driver('AB').latex_job(None)
+        self.assertEqual(job.body.count(r'\begin{document}'), 1)
+        self.assertEqual(job.body.count(r'\begin{tikzpicture}'), 1)
+        self.assertNotIn(r'\newpage', job.body)
+        self.assertNotIn(r'\begin{document}', job.preamble)
+
+    def test_003_compact_ticks(self):
+        body = make_driver('AB').latex_job(None).body
+        self.assertIn(r'\foreach \x/\txt in', body)
+        self.assertLess(body.count('current page.south west'), 5)
+        self.assertNotIn(' line}{rgb}', body)
+
+    def test_004_well_formed(self):
+        job = make_driver('AB').latex_job(None)
+        check_tex(self, job.preamble)
+        check_tex(self, job.body)
+
+    def test_005_label_syntax(self):
+        # e.g. translated labels with list syntax characters
+        def render_day_tick(driver, ctx, style, date):
+            label_str = {1: 'a,b', 2: 'c/d'}.get(date.day, 'x')
+            driver.render_time_tick(ctx, style, date, label_str, '')
+        with mock.patch.object(TikZ.TikZDriver, 'render_day_tick',
+                               render_day_tick):
+            body = make_driver('AB').latex_job(None).body
+        labels = [item[1] for items in check_tex(self, body)
+                  for item in items if len(item) == 2]
+        self.assertIn('{a,b}', labels)
+        self.assertIn('{c/d}', labels)
+
+    def test_006_server_size(self):
+        driver = TikZ.TikZDriver(
+            1.78, (70.0, 80.0),
+            (datetime.date(2015, 11, 22), datetime.date(2016, 1, 17)),
+            driver_options={'server': 'yes', 'server_size': '3'})
+        driver.count_axes()
+        with mock.patch.object(TikZ.latex, 'get_server') as get_server:
+            job = driver.latex_job(None)
+        get_server.assert_called_once_with(3)
+        self.assertIs(job.server, get_server.return_value)
+
+    def test_007_cmdline_escaped(self):
+        driver, output_format = setup_driver(
+            1.78, (70.0, 80.0),
+            (datetime.date(2015, 11, 22), datetime.date(2016, 1, 17)),
+            None, TikZ.TikZDriver, None, False, False, None, None,
+            driver_options={'workdir_root': '/tmp/a_b'})
+        body = driver.latex_job(None).body
+        nodes = [line for line in body.splitlines()
+                 if 'driver-option' in line]
+        self.assertEqual(len(nodes), 1)
+        self.assertIn(r'-\/-driver-option=workdir\_root=/tmp/a\_b',
+                      nodes[0])
+        self.assertNotRegex(re.sub(r'\\[_{}$&#%]', '', nodes[0]),
+                            r'[_$&#%]')
+        check_tex(self, body)
+
+
+@skipUnless(TikZ and pdflatex_works(), 'pdflatex not available')
+class TestTikZCompile(TestCase):
+
+    """Compile grids with the real pdflatex"""
+
+    def setUp(self):
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.dict(os.environ,
+                                     {'XDG_CACHE_HOME': self.cache_home.name})
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.cache_home.cleanup()
+
+    def cached_files(self, subdir):
+        dirname = os.path.join(self.cache_home.name, 'weight-calendar-grid',
+                               subdir)
+        if not os.path.isdir(dirname):
+            return []
+        return sorted(os.listdir(dirname))
+
+    def compile(self, driver):
+        outfile = io.BytesIO()
+        result = driver.latex_job(outfile).run()
+        self.assertTrue(result.ok)
+        self.assertTrue(outfile.getvalue().startswith(b'%PDF'))
+        return result
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_precompiled(self):
+        first = self.compile(make_driver('AB'))
+        self.assertTrue(any(fname.endswith('.fmt') for fname
+                            in self.cached_files(TikZ.latex.format_subdir)))
+        self.assertEqual(len(self.cached_files(TikZ.latex.aux_subdir)), 1)
+        self.assertGreaterEqual(first.runs, 2)
+        # the same layout again, with the format and the cached .aux file
+        second = self.compile(make_driver('AB'))
+        self.assertEqual(second.runs, 1)
+
+    def test_002_full_preamble(self):
+        driver = make_driver('AB')
+        driver.options['precompile'] = False
+        self.compile(driver)
+        self.assertEqual(self.cached_files(TikZ.latex.format_subdir), [])
+
+    def test_003_server(self):
+        server = TikZ.latex.get_server(1)
+        try:
+            for initials in ['AB', 'CD']:
+                driver = make_driver(initials)
+                driver.options['server'] = True
+                driver.options['server_size'] = 1
+                self.compile(driver)
+        finally:
+            server.close()
+
+
+########################################################################
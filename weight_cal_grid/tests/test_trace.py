@@ -0,0 +1,75 @@
+########################################################################
+
+
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+
+########################################################################
+
+
+from .. import trace
+
+
+########################################################################
+
+
+class TestTrace(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmpdir.name, 'trace.json')
+        # record into fresh state, without registering an atexit writer
+        self.patcher = mock.patch.multiple(
+            trace, fname=self.fname, _events=[], _stages={},
+            _pid=os.getpid(), _t0=time.perf_counter())
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_disabled(self):
+        with mock.patch.object(trace, 'fname', None):
+            self.assertFalse(trace.enabled())
+            self.assertIs(trace.span('x'), trace.span('y'))
+            with trace.span('x'):
+                pass
+        self.assertEqual(trace.summary(), {})
+
+    def test_002_write(self):
+        for i in range(3):
+            with trace.span('outer', n=i):
+                with trace.span('inner'):
+                    pass
+        trace.write()
+        with open(self.fname) as trace_file:
+            data = json.load(trace_file)
+        events = data['traceEvents']
+        self.assertEqual(len(events), 6)
+        self.assertEqual(set(e['ph'] for e in events), set(['X']))
+        self.assertEqual(events[1]['args'], {'n': 0})
+        stages = data['otherData']['stages']
+        self.assertEqual(stages['outer']['count'], 3)
+        self.assertEqual(stages['inner']['count'], 3)
+
+    def test_003_render_stages(self):
+        try:
+            from ..drivers import ReportLab
+        except ImportError:
+            return
+        from .test_reportlab import render_grid
+        render_grid(ReportLab.ReportLabDriver)
+        stages = trace.summary()
+        for stage in ['generate_grid', 'count_axes', 'render.axis_time',
+                      'render.axis_kg', 'render.plot', 'serialize']:
+            self.assertIn(stage, stages)
+
+
+########################################################################
@@ -0,0 +1,122 @@
+########################################################################
+
+
+import os
+import subprocess
+import sys
+import wsgiref.util
+from unittest import TestCase, mock
+
+
+########################################################################
+
+
+from .. import wsgi
+
+
+########################################################################
+
+
+class FakeDriver(object):
+    driver_name = 'fake'
+
+
+class TestGridRequest(TestCase):
+
+    formats = {'pdf': {None: FakeDriver, 'fake': FakeDriver}}
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_canonical(self):
+        a = wsgi.GridRequest('weight=70-80&begin=2015-11-22', self.formats)
+        b = wsgi.GridRequest('begin=2015-11-22&format=pdf&weight=70.0-80',
+                             self.formats)
+        c = wsgi.GridRequest('weight=70-81&begin=2015-11-22', self.formats)
+        self.assertEqual(a.etag(), b.etag())
+        self.assertNotEqual(a.etag(), c.etag())
+        self.assertTrue(a.etag().startswith('W/"'))
+
+    def test_002_bad_request(self):
+        for query in ['', 'weight=75&input=/etc/passwd', 'weight=heavy',
+                      'weight=75&weight=80', 'weight=75&format=png',
+                      'weight=75&lang=xx']:
+            self.assertRaises(wsgi.BadRequest,
+                              wsgi.GridRequest, query, self.formats)
+
+    def test_003_etag_matches(self):
+        self.assertTrue(wsgi.etag_matches('W/"ab"', '"xy", W/"ab"'))
+        self.assertTrue(wsgi.etag_matches('W/"ab"', '"ab"'))
+        self.assertTrue(wsgi.etag_matches('W/"ab"', '*'))
+        self.assertFalse(wsgi.etag_matches('W/"ab"', '"abc"'))
+        self.assertFalse(wsgi.etag_matches('W/"ab"', None))
+
+
+########################################################################
+
+
+class TestGridApplication(TestCase):
+
+    def call(self, query, method='GET', **headers):
+        environ = {'REQUEST_METHOD': method, 'QUERY_STRING': query}
+        environ.update(headers)
+        wsgiref.util.setup_testing_defaults(environ)
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        body = b''.join(wsgi.application(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_000_nothing(self):
+        pass
+
+    def test_001_pdf(self):
+        if 'pdf' not in wsgi.application.formats:
+            return
+        query = 'height=1.78&weight=70-80&begin=2015-11-22'
+        status, headers, body = self.call(query)
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Type'], 'application/pdf')
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertEqual(int(headers['Content-Length']), len(body))
+
+        status, headers2, body = self.call(
+            query, HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(headers2['ETag'], headers['ETag'])
+        self.assertEqual(body, b'')
+
+    def test_002_errors(self):
+        self.assertEqual(self.call('weight=heavy')[0], '400 Bad Request')
+        self.assertEqual(self.call('weight=75', method='POST')[0],
+                         '405 Method Not Allowed')
+
+    def test_003_height_only(self):
+        if 'pdf' not in wsgi.application.formats:
+            return
+        status, headers, body = self.call('height=1.78')
+        self.assertEqual(status, '200 OK')
+        self.assertTrue(body.startswith(b'%PDF'))
+
+    def test_004_internal_error(self):
+        if 'pdf' not in wsgi.application.formats:
+            return
+        with mock.patch.object(wsgi.GridRequest, 'render',
+                               side_effect=TypeError('bug')), \
+             mock.patch.object(wsgi.log, 'error'):
+            status, headers, body = self.call('weight=75')
+        self.assertEqual(status, '500 Internal Server Error')
+
+    def test_005_lazy_application(self):
+        code = ('import sys, weight_cal_grid.wsgi; '
+                'print(sorted(m for m in sys.modules '
+                'if m.startswith("weight_cal_grid.drivers.")))')
+        top_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=top_dir, stderr=subprocess.STDOUT)
+        self.assertEqual(output.strip(), b"['weight_cal_grid.drivers.basic']")
+
+
+########################################################################
@@ -0,0 +1,127 @@
+########################################################################
+
+"""\
+trace - opt-in timing of the stages of generating grids
+
+Tracing is off unless started with start(fname), which wcg-cli does
+for --profile=FILE, or by setting the WCG_TRACE environment variable
+to a file name. While tracing, every span() records its wall time.
+At exit, the spans are written to the file in the Chrome trace event
+format (load it in chrome://tracing or https://ui.perfetto.dev/),
+with the count and total time per stage under "otherData".
+
+Only the process which started tracing writes the file, so the stages
+running in worker processes do not show up.
+
+With tracing off, span() returns a shared do-nothing context manager.
+"""
+
+########################################################################
+
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+########################################################################
+
+from . import log
+
+########################################################################
+
+fname = None
+
+_events = []
+_stages = {}
+_lock = threading.Lock()
+_t0 = 0.0
+_pid = None
+
+_null_span = contextlib.nullcontext()
+
+########################################################################
+
+def enabled():
+    """Whether spans are being recorded"""
+    return fname is not None
+
+def start(trace_fname):
+    """Start recording spans, to be written to trace_fname at exit"""
+    global fname, _t0, _pid
+    if fname is None:
+        atexit.register(write)
+    fname = trace_fname
+    _t0 = time.perf_counter()
+    _pid = os.getpid()
+    log.verbose('tracing into %s', fname)
+
+########################################################################
+
+class Span(object):
+
+    """Context manager recording the wall time of one stage"""
+
+    def __init__(self, name, args):
+        super(Span, self).__init__()
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        event = {'name': self.name, 'ph': 'X', 'cat': 'wcg',
+                 'ts': 1e6 * (self.begin - _t0),
+                 'dur': 1e6 * (end - self.begin),
+                 'pid': os.getpid(), 'tid': threading.get_ident()}
+        if self.args:
+            event['args'] = self.args
+        with _lock:
+            _events.append(event)
+            count, total = _stages.get(self.name, (0, 0.0))
+            _stages[self.name] = (count + 1, total + end - self.begin)
+        return False
+
+def span(name, **args):
+    """Context manager timing the stage name while tracing"""
+    if fname is None:
+        return _null_span
+    return Span(name, args)
+
+########################################################################
+
+def summary():
+    """{stage: {'count': n, 'total_ms': ms}} of the recorded spans"""
+    with _lock:
+        return dict((name, {'count': count,
+                            'total_ms': round(1000.0 * total, 3)})
+                    for name, (count, total) in _stages.items())
+
+def write():
+    """Write the recorded spans to the trace file"""
+    if fname is None or os.getpid() != _pid:
+        return
+    with _lock:
+        events = list(_events)
+    trace = {'traceEvents': events,
+             'displayTimeUnit': 'ms',
+             'otherData': {'stages': summary()}}
+    try:
+        with open(fname, 'w') as trace_file:
+            json.dump(trace, trace_file, indent=0)
+        log.verbose('wrote %d trace events to %s', len(events), fname)
+    except EnvironmentError as e:
+        log.error('Could not write trace file: %s', e)
+
+########################################################################
+
+env_name = 'WCG_TRACE'
+
+if os.environ.get(env_name):
+    start(os.environ[env_name])
+
+########################################################################
@@ -8,12 +8,19 @@
 
 
 import datetime
+import os
 import time
 
 
 ########################################################################
 
 
+from . import version
+
+
+########################################################################
+
+
 def get_latest_sunday(date):
     """Get latest sunday, starting at given date and going back"""
     for i in range(7):
@@ -55,6 +62,18 @@ def get_next_first(date):
 ########################################################################
 
 
+def get_cache_dir(*subdirs):
+    """Get the per user cache directory, creating it if necessary"""
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.expanduser('~/.cache'))
+    cache_dir = os.path.join(cache_home, version.package_name, *subdirs)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+########################################################################
+
+
 class AbstractMethodError(Exception):
     """Abstract method has been called"""
     pass
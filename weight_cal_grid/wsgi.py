@@ -0,0 +1,318 @@
+########################################################################
+
+
+"""WSGI application serving weight calendar grids
+
+The query parameters are named after the long wcg-cli options:
+
+    /?height=1.78&weight=70-80&begin=2015-11-22&format=png&lang=de
+
+Recognized parameters are height, weight, begin, end, initials, lang,
+format (pdf, png or svg; default pdf) and driver. Input files are not
+available, so the grid never contains any plot data.
+
+The grid is rendered into memory and returned with a weak ETag derived
+from the canonical form of the parameters, so that a client sending
+that ETag back in If-None-Match gets a 304 without any rendering.
+
+Drivers and translations are loaded once when the application is
+created, i.e. when a server first looks up the module's application,
+not when the module is imported. Requests never change the process wide locale or the
+installed translation, so the application can run in any threaded or
+forking WSGI server:
+
+    gunicorn weight_cal_grid.wsgi:application
+
+For local testing, `python3 -m weight_cal_grid.wsgi` serves the
+application with the wsgiref server.
+"""
+
+
+########################################################################
+
+
+import argparse
+import datetime
+import hashlib
+import io
+import sys
+import time
+import urllib.parse
+import wsgiref.simple_server
+
+
+########################################################################
+
+
+from . import batch
+from . import drivers
+from . import setup_driver
+from . import log
+from .i18n import get_translation, preload_translations
+from .version import package_name, package_version
+
+
+########################################################################
+
+
+content_types = {
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    }
+
+
+# Query parameters, a subset of the batch job keys
+query_keys = ['height', 'weight', 'begin', 'end', 'initials', 'lang',
+              'format', 'driver']
+
+
+# Preference order of the drivers for each output format. The drivers
+# rendering in this process come before the one running pdflatex.
+driver_preference = ['reportlab', 'cairo', 'tikz']
+
+
+########################################################################
+
+
+class BadRequest(Exception):
+    """The query parameters do not describe a grid we can generate"""
+    pass
+
+
+def format_weight(weight):
+    if weight is None:
+        return 'auto'
+    if isinstance(weight, tuple):
+        return '%g-%g' % weight
+    return '%g' % weight
+
+
+class GridRequest(object):
+
+    """A grid request, parsed from a query string"""
+
+    def __init__(self, query_string, formats):
+        super(GridRequest, self).__init__()
+        query = urllib.parse.parse_qs(query_string, keep_blank_values=True)
+        unknown = sorted(set(query) - set(query_keys))
+        if unknown:
+            raise BadRequest('unknown parameter(s) %s' % ', '.join(unknown))
+        # never opened, the grid goes into the response body
+        entry = {'output': '<response>'}
+        for key, values in query.items():
+            if len(values) != 1:
+                raise BadRequest('parameter %s given more than once' % key)
+            if values[0]:
+                entry[key] = values[0]
+        try:
+            self.job = batch.BatchJob(0, entry)
+        except batch.ManifestError as e:
+            raise BadRequest(str(e).replace('job 0: ', ''))
+
+        self.output_format = self.job.output_format or 'pdf'
+        if self.output_format not in formats:
+            raise BadRequest('output format %s not available'
+                             % self.output_format)
+        self.driver_cls = formats[self.output_format].get(self.job.driver)
+        if not self.driver_cls:
+            raise BadRequest('driver %s not available for %s output'
+                             % (self.job.driver, self.output_format))
+
+    def canonical(self):
+        """Canonical form of the request, in query string syntax
+
+        Requests with the same canonical form get the same grid. The
+        default date range depends on the current date, which is then
+        part of the canonical form.
+        """
+        job = self.job
+        items = [
+            ('version', package_version),
+            ('driver', self.driver_cls.driver_name),
+            ('format', self.output_format),
+            ('height', '%g' % job.height if job.height else 'none'),
+            ('weight', format_weight(job.weight)),
+            ('begin', job.begin_date or 'default'),
+            ('end', job.end_date or 'default'),
+            ('initials', job.initials or ''),
+            ('lang', job.lang or ''),
+            ]
+        if not job.begin_date:
+            items.append(('today', datetime.date.today()))
+        return urllib.parse.urlencode(items)
+
+    def etag(self):
+        digest = hashlib.sha1(self.canonical().encode('utf-8')).hexdigest()
+        return 'W/"%s"' % digest
+
+    def render(self, timings=None):
+        """Generate the grid, returning the file contents
+
+        If given, the timings dict gets the durations of the layout
+        and render stages in seconds.
+        """
+        job = self.job
+        t0 = time.perf_counter()
+        driver, output_format = setup_driver(
+            job.height, job.weight, (job.begin_date, job.end_date), None,
+            self.driver_cls, self.output_format,
+            False, False, job.initials, job.lang)
+        t1 = time.perf_counter()
+        outfile = io.BytesIO()
+        driver.gen_outfile(outfile, output_format)
+        body = outfile.getvalue()
+        if timings is not None:
+            timings['layout'] = t1 - t0
+            timings['render'] = time.perf_counter() - t1
+        return body
+
+
+def etag_matches(etag, if_none_match):
+    """Check an ETag against an If-None-Match header, weakly"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    strip = lambda tag: tag.strip()[2:] if tag.strip().startswith('W/') \
+        else tag.strip()
+    return strip(etag) in [strip(tag) for tag in if_none_match.split(',')]
+
+
+########################################################################
+
+
+class GridApplication(object):
+
+    """WSGI application generating weight calendar grids"""
+
+    def __init__(self, langs=None):
+        super(GridApplication, self).__init__()
+        self.formats = self.__load_drivers()
+        get_translation(None)
+        self.langs = set([None] + preload_translations(langs))
+
+    def __load_drivers(self):
+        """Map every output format to {driver name or None: driver class}"""
+        formats = {}
+        for name in driver_preference:
+            try:
+                driver_cls = drivers.get_driver(name)
+            except drivers.NoSuchDriverError:
+                continue
+            driver_cls.warm_up()
+            for fmt in driver_cls.driver_formats:
+                if fmt not in content_types:
+                    continue
+                fmt_drivers = formats.setdefault(fmt, {})
+                fmt_drivers.setdefault(None, driver_cls)
+                fmt_drivers[name] = driver_cls
+        log.verbose('wsgi: output formats %s', ', '.join(sorted(formats)))
+        return formats
+
+    def parse_request(self, query_string):
+        """Parse a GridRequest we can serve, or raise BadRequest"""
+        request = GridRequest(query_string, self.formats)
+        if request.job.lang not in self.langs:
+            raise BadRequest('language %s not available' % request.job.lang)
+        return request
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in ('GET', 'HEAD'):
+            return self.respond(start_response, '405 Method Not Allowed',
+                                'method %s not allowed\n' % method,
+                                [('Allow', 'GET, HEAD')])
+        try:
+            request = self.parse_request(environ.get('QUERY_STRING', ''))
+        except BadRequest as e:
+            return self.respond(start_response, '400 Bad Request',
+                                '%s\n' % e)
+
+        etag = request.etag()
+        headers = [('ETag', etag),
+                   ('Cache-Control', 'public, max-age=86400')]
+        if etag_matches(etag, environ.get('HTTP_IF_NONE_MATCH')):
+            start_response('304 Not Modified', headers)
+            return []
+
+        try:
+            body = request.render()
+        except drivers.basic.DriverError as e:
+            log.error('wsgi: %s: %s', request.canonical(), e)
+            return self.respond(start_response, '500 Internal Server Error',
+                                'failed to generate the grid\n')
+        except Exception:
+            log.error('wsgi: %s failed', request.canonical(), exc_info=True)
+            return self.respond(start_response, '500 Internal Server Error',
+                                'internal server error\n')
+
+        fname = '%s.%s' % (package_name, request.output_format)
+        headers.extend([
+            ('Content-Type', content_types[request.output_format]),
+            ('Content-Length', str(len(body))),
+            ('Content-Disposition', 'inline; filename="%s"' % fname),
+            ])
+        start_response('200 OK', headers)
+        if method == 'HEAD':
+            return []
+        return [body]
+
+    def respond(self, start_response, status, text, headers=()):
+        """Send a plain text response"""
+        body = text.encode('utf-8')
+        start_response(status, [('Content-Type', 'text/plain; charset=utf-8'),
+                                ('Content-Length', str(len(body)))] + list(headers))
+        return [body]
+
+
+########################################################################
+
+
+def make_app(langs=None):
+    """Create the WSGI application, loading drivers and translations"""
+    return GridApplication(langs)
+
+
+# The application for WSGI servers, created on first access
+_application = None
+
+
+def __getattr__(name):
+    global _application
+    if name != 'application':
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    if _application is None:
+        _application = make_app()
+    return _application
+
+
+########################################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='serve weight calendar grids with the wsgiref server')
+    parser.add_argument('--host', default='localhost',
+                        help='host name or address to bind to '
+                        '(default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='port to listen on (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    server = wsgiref.simple_server.make_server(args.host, args.port,
+                                               make_app())
+    log.info('serving on http://%s:%d/', args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+########################################################################